@@ -0,0 +1,239 @@
+from doipclient import DoIPClient
+from doipclient.messages import DiagnosticMessage, DiagnosticMessageNegativeAcknowledgement
+from concurrent.futures import ThreadPoolExecutor
+
+import can
+import isotp
+import socket
+import time
+
+from onebase.core.device_identity import BUS_IDENTIFICATION_DID, BusIdentificationCodec, decodeBusIdentification
+
+# short timeouts for scanning, an ECU that exists answers well within them
+SCAN_ISOTP_PARAMS = {
+    'stmin': 10,                            # Will request the sender to wait 10ms between consecutive frame. 0-127ms or 100-900ns with values from 0xF1-0xF9
+    'blocksize': 0,                         # Request the sender to send all consecutives frames without new flow control message
+    'wftmax': 0,                            # Number of wait frame allowed before triggering an error
+    'tx_data_length': 8,                    # Link layer (CAN layer) works with 8 byte payload (CAN 2.0)
+    'tx_data_min_length': 8,                # Minimum length of CAN messages. Messages are padded to meet this length.
+    'tx_padding': 0,                        # Will pad all transmitted CAN messages with byte 0x00.
+    'rx_flowcontrol_timeout': 500,          # Triggers a timeout if a flow control is awaited for more than 500 milliseconds
+    'rx_consecutive_frame_timeout': 500,    # Triggers a timeout if a consecutive frame is awaited for more than 500 milliseconds
+    'max_frame_size': 4095,                 # Limit the size of receive frame.
+}
+
+REQUEST_BUS_IDENTIFICATION = bytes([0x22]) + BUS_IDENTIFICATION_DID.to_bytes(2, byteorder='big')
+RESPONSE_PENDING = 0x78
+
+# functional addresses that reach all ECUs, the requests must fit into a single frame
+FUNCTIONAL_CAN_ADDRESS = 0x7DF
+FUNCTIONAL_DOIP_ADDRESS = 0xE400
+MAX_FUNCTIONAL_DIDS = 3
+
+DOIP_CLIENT_ADDRESS = 0x0E00 # logical address of the tester, the default of DoIPClient
+
+def _parseBusIdentificationResponse(paramPayload:bytes):
+    # returns (done, decoded identification or None)
+    if len(paramPayload) >= 3 and paramPayload[0] == 0x7F:
+        return paramPayload[2] != RESPONSE_PENDING, None
+    if len(paramPayload) >= 3 and paramPayload[0] == 0x62 and int.from_bytes(paramPayload[1:3], byteorder='big') == BUS_IDENTIFICATION_DID:
+        try:
+            return True, decodeBusIdentification(paramPayload[3:])
+        except (ValueError, IndexError, UnicodeDecodeError):
+            return True, None
+    return False, None
+
+def _makeReadRequest(paramDids:list, paramCodecs:dict) -> bytes:
+    if len(paramDids) == 0 or len(paramDids) > MAX_FUNCTIONAL_DIDS:
+        raise ValueError("A functional request reads 1 to " + str(MAX_FUNCTIONAL_DIDS) + " DIDs")
+    if len(paramDids) > 1 and any(did not in paramCodecs for did in paramDids):
+        raise ValueError("Codecs of all DIDs are needed to split a response with several DIDs")
+    return bytes([0x22]) + b"".join(did.to_bytes(2, byteorder='big') for did in paramDids)
+
+def _parseReadResponse(paramPayload:bytes, paramDids:list, paramCodecs:dict):
+    # returns (done, did -> decoded value or None), the values of DIDs without codec are hex strings
+    if len(paramPayload) >= 3 and paramPayload[0] == 0x7F:
+        return paramPayload[2] != RESPONSE_PENDING, None
+    if len(paramPayload) < 3 or paramPayload[0] != 0x62:
+        return False, None
+    values = dict()
+    index = 1
+    try:
+        while index + 2 <= len(paramPayload) and len(values) < len(paramDids):
+            did = int.from_bytes(paramPayload[index:index+2], byteorder='big')
+            if did not in paramDids:
+                return True, None
+            codec = paramCodecs.get(did)
+            length = len(paramPayload) - index - 2 if codec == None else codec.getNumBytes()
+            raw = bytes(paramPayload[index+2:index+2+length])
+            if len(raw) != length:
+                return True, None
+            values[did] = raw.hex() if codec == None else codec.decode(raw)
+            index += 2 + length
+    except (ValueError, IndexError, UnicodeDecodeError):
+        return True, None
+    return True, values
+
+def _collectCANResponses(paramStacks:dict, paramParse, paramTimeout:float) -> dict:
+    # polls the ISO-TP stacks (tx -> stack) until all of them got their final response or paramTimeout passed,
+    # returns tx -> parsed response of the addresses that answered. Response pending (NRC 0x78) extends the wait.
+    results = dict()
+    deadline = time.monotonic() + paramTimeout
+    pending = dict(paramStacks)
+    while len(pending) > 0 and time.monotonic() < deadline:
+        for tx, stack in list(pending.items()):
+            payload = stack.recv(block=False)
+            while payload != None:
+                done, result = paramParse(payload)
+                if done:
+                    results[tx] = result
+                    del pending[tx]
+                    break
+                deadline = max(deadline, time.monotonic() + paramTimeout)
+                payload = stack.recv(block=False)
+        time.sleep(0.005)
+    return results
+
+def _sendDoIP(paramClient:DoIPClient, paramLogicalAddress:int, paramRequest:bytes):
+    # sends without waiting for the acknowledgement, DoIPClient.send_diagnostic_to_address() would drop the
+    # responses that arrive before it
+    paramClient.send_doip_message(DiagnosticMessage(DOIP_CLIENT_ADDRESS, paramLogicalAddress, paramRequest))
+
+def _collectDoIPResponses(paramClient:DoIPClient, paramAddresses:set, paramParse, paramTimeout:float) -> dict:
+    # reads the DoIP socket until all logical addresses of paramAddresses (any address if None) sent their final
+    # response or paramTimeout passed, returns source address -> parsed response. Acknowledgements are skipped, a
+    # negative acknowledgement ends the wait for its address, response pending (NRC 0x78) extends the wait.
+    results = dict()
+    pending = None if paramAddresses == None else set(paramAddresses)
+    deadline = time.monotonic() + paramTimeout
+    while (pending == None or len(pending) > 0) and time.monotonic() < deadline:
+        try:
+            message = paramClient.read_doip(timeout=max(deadline - time.monotonic(), 0.01))
+        except (TimeoutError, OSError):
+            break
+        if type(message) == DiagnosticMessageNegativeAcknowledgement and pending != None:
+            pending.discard(message.source_address)
+            continue
+        if type(message) != DiagnosticMessage or message.source_address in results or (pending != None and message.source_address not in pending):
+            continue
+        done, result = paramParse(bytes(message.user_data))
+        if done:
+            results[message.source_address] = result
+            if pending != None:
+                pending.discard(message.source_address)
+        else:
+            deadline = max(deadline, time.monotonic() + paramTimeout)
+    return results
+
+def _makeResult(paramConnectionType:str, paramInterface:str, paramTXAddress:int, paramRXAddress:int, paramIdentification:dict) -> dict:
+    deviceType = None
+    if paramIdentification != None:
+        deviceType = paramIdentification["DeviceProperty"]["Value "]
+    return {"type": paramConnectionType, "interface": paramInterface, "tx": paramTXAddress, "rx": paramRXAddress, "deviceType": deviceType, "identification": paramIdentification}
+
+def scanCANBus(paramBus:can.BusABC, paramTXAddresses=range(0x680, 0x690), paramRXOffset:int=0x10, paramTimeout:float=0.5, paramMaxParallel:int=16, paramConnectionType:str="SocketCAN", paramConnectionInterface:str=None, paramVerbose:bool=False) -> list:
+    # Reads BusIdentification from all given addresses with one ISO-TP session per address running in parallel
+    # on the same bus, so the scan takes about one timeout per paramMaxParallel addresses. The bus must not be
+    # used by an open ECUConnection at the same time. The results carry paramConnectionType and
+    # paramConnectionInterface (e.g. "can0") as given, to open ECUConnections with. Without an interface the channel
+    # of a SocketCAN bus is reported, None for other buses.
+    found = []
+    interface = paramConnectionInterface
+    if interface == None and type(getattr(paramBus, "channel", None)) == str:
+        interface = paramBus.channel
+    notifier = can.Notifier(paramBus, [], timeout=0.05)
+    try:
+        addresses = list(paramTXAddresses)
+        for batchStart in range(0, len(addresses), paramMaxParallel):
+            stacks = dict()
+            for tx in addresses[batchStart:batchStart+paramMaxParallel]:
+                tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx, rxid=tx + paramRXOffset)
+                stack = isotp.NotifierBasedCanStack(paramBus, notifier, address=tp_addr, params=SCAN_ISOTP_PARAMS)
+                stack.start()
+                stack.send(REQUEST_BUS_IDENTIFICATION)
+                stacks[tx] = stack
+
+            for tx, identification in _collectCANResponses(stacks, _parseBusIdentificationResponse, paramTimeout).items():
+                found.append(_makeResult(paramConnectionType, interface, tx, tx + paramRXOffset, identification))
+                if paramVerbose:
+                    print("ECU found at 0x%03X" % tx)
+
+            for stack in stacks.values():
+                stack.stop()
+    finally:
+        notifier.stop()
+
+    return sorted(found, key=lambda result: result["tx"])
+
+def _scanDoIPHost(paramHost:str, paramLogicalAddresses:list, paramTimeout:float, paramPort:int):
+    found = []
+    try: # fail fast on hosts that are not reachable, DoIPClient would wait for the OS connect timeout
+        socket.create_connection((paramHost, paramPort), timeout=paramTimeout).close()
+        client = DoIPClient(paramHost, paramLogicalAddresses[0], tcp_port=paramPort, client_logical_address=DOIP_CLIENT_ADDRESS)
+    except OSError: # not reachable, routing activation refused or not answered: no ECU found
+        return found
+
+    try:
+        # all requests of this host are outstanding at the same time, responses are collected by source address
+        for logicalAddress in paramLogicalAddresses:
+            _sendDoIP(client, logicalAddress, REQUEST_BUS_IDENTIFICATION)
+        for logicalAddress, identification in sorted(_collectDoIPResponses(client, set(paramLogicalAddresses), _parseBusIdentificationResponse, paramTimeout).items()):
+            found.append(_makeResult("DoIP", paramHost, logicalAddress, None, identification))
+    except OSError as e: # connection lost during the scan
+        print("DoIP scan of " + paramHost + " failed.\nErr: " + str(e))
+    finally:
+        client.close()
+    return found
+
+def scanDoIPHosts(paramHosts:list, paramLogicalAddresses:list=[0x680], paramTimeout:float=1.0, paramPort:int=13400, paramMaxParallel:int=16) -> list:
+    # Reads BusIdentification from the given logical addresses of all hosts, hosts are scanned in parallel
+    found = []
+    with ThreadPoolExecutor(max_workers=paramMaxParallel) as executor:
+        for result in executor.map(lambda host: _scanDoIPHost(host, paramLogicalAddresses, paramTimeout, paramPort), paramHosts):
+            found.extend(result)
+    return found
+
+def readFunctionalCAN(paramBus:can.BusABC, paramDids:list=[BUS_IDENTIFICATION_DID], paramCodecs:dict=None, paramTXAddresses=range(0x680, 0x690), paramRXOffset:int=0x10,
+                      paramFunctionalAddress:int=FUNCTIONAL_CAN_ADDRESS, paramTimeout:float=0.5) -> dict:
+    # Reads up to 3 DIDs from all ECUs with one functionally addressed request. The physical responses of the
+    # given addresses are received by one ISO-TP session per address like in scanCANBus() and decoded with
+    # paramCodecs (did -> codec, e.g. the DID registry). Returns tx -> {did: value} for every ECU that answered
+    # within paramTimeout, None for ECUs that answered negatively. The bus must not be used by an open
+    # ECUConnection at the same time.
+    codecs = {BUS_IDENTIFICATION_DID: BusIdentificationCodec} if paramCodecs == None else paramCodecs
+    dids = list(paramDids)
+    request = _makeReadRequest(dids, codecs)
+    notifier = can.Notifier(paramBus, [], timeout=0.05)
+    stacks = dict()
+    try:
+        for tx in paramTXAddresses: # receive only, the ECUs answer to the physical address of their own
+            tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx, rxid=tx + paramRXOffset)
+            stacks[tx] = isotp.NotifierBasedCanStack(paramBus, notifier, address=tp_addr, params=SCAN_ISOTP_PARAMS)
+            stacks[tx].start()
+        functionalAddress = isotp.AsymmetricAddress(tx_addr=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=paramFunctionalAddress, tx_only=True),
+                                                    rx_addr=isotp.Address(isotp.AddressingMode.Normal_11bits, rxid=paramFunctionalAddress, rx_only=True)) # send only
+        functional = isotp.NotifierBasedCanStack(paramBus, notifier, address=functionalAddress, params=SCAN_ISOTP_PARAMS)
+        functional.start()
+        try:
+            functional.send(request, target_address_type=isotp.TargetAddressType.Functional)
+            return dict(sorted(_collectCANResponses(stacks, lambda payload: _parseReadResponse(payload, dids, codecs), paramTimeout).items()))
+        finally:
+            functional.stop()
+    finally:
+        for stack in stacks.values():
+            stack.stop()
+        notifier.stop()
+
+def readFunctionalDoIP(paramHost:str, paramDids:list=[BUS_IDENTIFICATION_DID], paramCodecs:dict=None, paramFunctionalAddress:int=FUNCTIONAL_DOIP_ADDRESS,
+                       paramTimeout:float=1.0, paramPort:int=13400) -> dict:
+    # DoIP variant of readFunctionalCAN(): one request to the functional logical address of the host, the
+    # responses are collected by source address until paramTimeout passed without an outstanding response pending
+    codecs = {BUS_IDENTIFICATION_DID: BusIdentificationCodec} if paramCodecs == None else paramCodecs
+    dids = list(paramDids)
+    request = _makeReadRequest(dids, codecs)
+    client = DoIPClient(paramHost, paramFunctionalAddress, tcp_port=paramPort, client_logical_address=DOIP_CLIENT_ADDRESS)
+    try:
+        _sendDoIP(client, paramFunctionalAddress, request)
+        return dict(sorted(_collectDoIPResponses(client, None, lambda payload: _parseReadResponse(payload, dids, codecs), paramTimeout).items()))
+    finally:
+        client.close()
@@ -0,0 +1,51 @@
+import json
+import os
+import time
+
+class CapabilityMap():
+    # Supported DIDs and their payload length per device identity, as found by ECUConnection.discoverSupportedDids()
+    def __init__(self, paramFilePath:str=None):
+        self.filePath = paramFilePath
+        self.identityKey = None
+        self.timestamp = None
+        self._dids = dict() # did -> number of payload bytes
+
+    def isKnown(self) -> bool:
+        return self.timestamp != None
+
+    def setSupportedDids(self, paramDids:dict):
+        self._dids = dict(paramDids)
+        self.timestamp = time.time()
+
+    def getSupportedDids(self) -> dict:
+        return dict(self._dids)
+
+    def isSupported(self, paramDid:int) -> bool:
+        return paramDid in self._dids
+
+    def getLength(self, paramDid:int):
+        return self._dids.get(paramDid)
+
+    def setIdentity(self, paramIdentityKey:str):
+        self.identityKey = paramIdentityKey
+        entry = self._loadFile().get(paramIdentityKey)
+        if entry != None:
+            self._dids = {int(did): length for did, length in entry["dids"].items()}
+            self.timestamp = entry["timestamp"]
+
+    def save(self):
+        if self.filePath == None or self.identityKey == None or not self.isKnown():
+            return
+        data = self._loadFile()
+        data[self.identityKey] = {"timestamp": self.timestamp, "dids": {str(did): length for did, length in sorted(self._dids.items())}}
+
+        tmpFilePath = self.filePath + ".tmp"
+        with open(tmpFilePath, "w") as json_file:
+            json.dump(data, json_file, indent=1)
+        os.replace(tmpFilePath, self.filePath)
+
+    def _loadFile(self) -> dict:
+        if self.filePath == None or not os.path.isfile(self.filePath):
+            return dict()
+        with open(self.filePath) as json_file:
+            return json.load(json_file)
@@ -0,0 +1,62 @@
+import numbers
+
+import onebase.core.codecs
+from onebase.core.did_registry import DIDRegistry
+
+class ChangeDetector():
+    # Keeps the last raw payload per DID and only decodes DIDs, or sub-fields of complex DIDs, whose bytes changed
+    def __init__(self, paramDataIdentifiers:dict):
+        if not isinstance(paramDataIdentifiers, DIDRegistry):
+            paramDataIdentifiers = DIDRegistry(paramDataIdentifiers)
+        self.dataIdentifiers = paramDataIdentifiers
+        self._lastRaw = dict()        # did -> last raw payload
+        self._lastPublished = dict()  # (did, sub-field name) -> last value reported as change
+        self._deadbands = dict()      # (did, sub-field name) -> minimum numeric difference to report
+
+    def setDeadband(self, paramDid:int, paramDeadband:float, paramSubDidName:str=None):
+        self._deadbands[(paramDid, paramSubDidName)] = paramDeadband
+
+    def reset(self, paramDid:int=None):
+        if paramDid == None:
+            self._lastRaw.clear()
+            self._lastPublished.clear()
+        else:
+            self._lastRaw.pop(paramDid, None)
+            for key in [key for key in self._lastPublished if key[0] == paramDid]:
+                del self._lastPublished[key]
+
+    def update(self, paramDid:int, paramRaw:bytes) -> list:
+        # returns the change events caused by the new payload, an empty list if nothing changed
+        lastRaw = self._lastRaw.get(paramDid)
+        if lastRaw == paramRaw:
+            return []
+        self._lastRaw[paramDid] = paramRaw
+
+        codec = self.dataIdentifiers.get(paramDid)
+        if codec == None:
+            return self._makeEvents(paramDid, None, None, paramRaw.hex(), paramRaw)
+
+        if type(codec) == onebase.core.codecs.CodecComplexType and len(paramRaw) == codec.getNumBytes():
+            events = []
+            view = memoryview(paramRaw) # sub-fields are compared without copying
+            lastView = memoryview(lastRaw) if lastRaw != None and len(lastRaw) == len(paramRaw) else None
+            for field in self.dataIdentifiers.getLayout(paramDid).values():
+                start = field.offset
+                end = field.offset + field.length
+                if lastView != None and lastView[start:end] == view[start:end]:
+                    continue
+                subRaw = bytes(view[start:end])
+                events.extend(self._makeEvents(paramDid, codec._DIDName, field.name, field.codec.decode(subRaw), subRaw))
+            return events
+
+        return self._makeEvents(paramDid, codec._DIDName, None, codec.decode(paramRaw), paramRaw)
+
+    def _makeEvents(self, paramDid:int, paramName:str, paramSubDidName:str, paramValue, paramRaw:bytes) -> list:
+        key = (paramDid, paramSubDidName)
+        deadband = self._deadbands.get(key)
+        if deadband != None and key in self._lastPublished:
+            lastValue = self._lastPublished[key]
+            if isinstance(paramValue, numbers.Number) and isinstance(lastValue, numbers.Number) and abs(paramValue - lastValue) < deadband:
+                return []
+        self._lastPublished[key] = paramValue
+        return [{"did": paramDid, "name": paramName, "subDid": paramSubDidName, "value": paramValue, "raw": paramRaw}]
@@ -1,7 +1,25 @@
 import udsoncan
 from typing import Any
 import datetime
+import decimal
+import math
 from onebase.core.enumerations import OneBaseEnums
+from onebase.core.lazy_record import LazyRecord
+
+def parseNumber(paramText:str):
+    # parses decimal, hexadecimal (0x..), binary (0b..) and exponent notation, returns int or decimal.Decimal
+    text = paramText.strip()
+    try:
+        return int(text, 0)
+    except ValueError:
+        pass
+    try:
+        value = decimal.Decimal(text)
+    except decimal.InvalidOperation:
+        raise ValueError("Not a number: " + repr(paramText))
+    if not value.is_finite():
+        raise ValueError("Not a finite number: " + repr(paramText))
+    return value
 
 class CodecRaw(udsoncan.DidCodec):
     def __init__(self, paramNumBytes: int, paramDIDName:str):
@@ -36,6 +54,14 @@ class CodecInt(udsoncan.DidCodec):
         self._scale = paramScale
         self._offset = paramOffset
         self._signed = paramSigned
+        # range of the raw integer, checked before encoding
+        if paramSigned:
+            self._minRaw = -(1 << (8*paramByteWidth - 1))
+            self._maxRaw = (1 << (8*paramByteWidth - 1)) - 1
+        else:
+            self._minRaw = 0
+            self._maxRaw = (1 << (8*paramByteWidth)) - 1
+        self._decimalScale = decimal.Decimal(str(paramScale))
 
     def encode(self, string_ascii: Any, paramRaw=False) -> bytes:        
         if(paramRaw):
@@ -45,9 +71,37 @@ class CodecInt(udsoncan.DidCodec):
             if (self._offset != 0):
                 raise NotImplementedError("O3EInt.encode(): offset!=0 not implemented yet")
             else:
-                val = round(eval(str(string_ascii))*self._scale)    # convert submitted data to numeric value and apply scaling factor
-                string_bin = val.to_bytes(length=self._byteWidth, byteorder=self._byteOrder, signed=self._signed)
-                return string_bin
+                return self._toRaw(string_ascii).to_bytes(length=self._byteWidth, byteorder=self._byteOrder, signed=self._signed)
+
+    def encodeBatch(self, paramValues:list) -> list:
+        # encodes many values, e.g. for restoring a snapshot, returns one bytes object per value
+        if (self._offset != 0):
+            raise NotImplementedError("O3EInt.encode(): offset!=0 not implemented yet")
+        toRaw = self._toRaw
+        byteWidth = self._byteWidth
+        byteOrder = self._byteOrder
+        signed = self._signed
+        return [toRaw(value).to_bytes(length=byteWidth, byteorder=byteOrder, signed=signed) for value in paramValues]
+
+    def _toRaw(self, paramValue) -> int:
+        # converts the value to the scaled raw integer and checks that it fits into the byte width
+        if type(paramValue) == str:
+            paramValue = parseNumber(paramValue)
+        if type(paramValue) in (int, bool):
+            val = int(paramValue) if self._scale == 1.0 else round(paramValue*self._scale)
+        elif type(paramValue) == float:
+            if not math.isfinite(paramValue):
+                raise ValueError("Cannot encode " + str(paramValue) + " for " + self._DIDName)
+            val = round(paramValue*self._scale)
+        elif type(paramValue) == decimal.Decimal:
+            if not paramValue.is_finite():
+                raise ValueError("Cannot encode " + str(paramValue) + " for " + self._DIDName)
+            val = int((paramValue*self._decimalScale).to_integral_value())
+        else:
+            raise TypeError("Cannot encode value of type " + type(paramValue).__name__ + " for " + self._DIDName)
+        if val < self._minRaw or val > self._maxRaw:
+            raise ValueError("Value " + str(paramValue) + " out of range for " + self._DIDName + " (" + str(self._minRaw / self._scale) + " to " + str(self._maxRaw / self._scale) + ")")
+        return val
 
     def decode(self, paramEncodedBytes: bytes, paramRaw=False) -> Any:
         if(paramRaw):
@@ -436,32 +490,60 @@ class CodecList(udsoncan.DidCodec):
             string_bin+=bytes(self._numBytes - len(string_bin))
         return string_bin
 
-    def decode(self, paramEncodedBytes: bytes, paramRaw:bool=False) -> Any:
+    def decode(self, paramEncodedBytes: bytes, paramRaw:bool=False, paramFields:list=None, paramLazy:bool=False) -> Any:
+        # paramFields limits the result to the given names, list entries that are not requested are not decoded.
+        # paramLazy returns a LazyRecord that decodes fields and list entries on first access.
         if(paramRaw): 
             return CodecRaw.decode(self, paramEncodedBytes)
+        if(paramLazy):
+            return LazyRecord(self._getLazyDecoders(paramEncodedBytes, paramFields), bytes(paramEncodedBytes))
         result = {}
         index = 0
         if(self.len == 0): 
             count = 0
 
         for subType in self._listSubCodecs:
+            requested = paramFields == None or subType._DIDName in paramFields
             # we expect a byte element with the name "Count" or "count"
             if subType._DIDName.lower() == 'count':
-                count = int(subType.decode(paramEncodedBytes[index:index+subType._numBytes]))
-                result[subType._DIDName]=count 
+                count = int(subType.decode(paramEncodedBytes[index:index+subType._numBytes])) # always needed for the entries
+                if requested:
+                    result[subType._DIDName]=count 
                 index =+ subType._numBytes 
 
             elif type(subType) is CodecComplexType:
-                result[subType._DIDName] = []
-                for i in range(count):
-                    result[subType._DIDName].append(subType.decode(paramEncodedBytes[index:index+subType._numBytes]))
-                    index+=subType._numBytes
+                if requested:
+                    result[subType._DIDName] = []
+                    for i in range(count):
+                        result[subType._DIDName].append(subType.decode(paramEncodedBytes[index+i*subType._numBytes:index+(i+1)*subType._numBytes]))
+                index+=count*subType._numBytes
 
             else:
-                result[subType._DIDName]=subType.decode(paramEncodedBytes[index:index+subType._numBytes]) 
+                if requested:
+                    result[subType._DIDName]=subType.decode(paramEncodedBytes[index:index+subType._numBytes]) 
                 index = index + subType._numBytes
 
         return dict(result)
+
+    def _getLazyDecoders(self, paramEncodedBytes: bytes, paramFields:list=None) -> dict:
+        # the count is decoded right away, it determines where the fields behind the entries start
+        decoders = dict()
+        index = 0
+        count = 0
+        for subType in self._listSubCodecs:
+            if subType._DIDName.lower() == 'count':
+                count = int(subType.decode(paramEncodedBytes[index:index+subType._numBytes]))
+                decoders[subType._DIDName] = lambda raw, value=count: value
+                index += subType._numBytes
+            elif type(subType) is CodecComplexType:
+                decoders[subType._DIDName] = lambda raw, start=index, numEntries=count, codec=subType: [codec.decode(raw[start+i*codec._numBytes:start+(i+1)*codec._numBytes], paramLazy=True) for i in range(numEntries)]
+                index += count*subType._numBytes
+            else:
+                decoders[subType._DIDName] = lambda raw, start=index, codec=subType: codec.decode(raw[start:start+codec._numBytes])
+                index += subType._numBytes
+        if paramFields == None:
+            return decoders
+        return {name: decoder for name, decoder in decoders.items() if name in paramFields}
     
     def getCodecInfo(self):
         argsSubTypes = []
@@ -480,6 +562,7 @@ class CodecComplexType(udsoncan.DidCodec):
         self._numBytes = paramNumBytes
         self._DIDName = paramDIDName
         self._subTypes = paramListSubCodecs
+        self._decoders = None # sub-DID name -> decoder for lazy records, built on first use
 
     def encode(self, string_ascii:Any, paramRaw:bool=False) -> bytes:      
         if(paramRaw):
@@ -494,16 +577,33 @@ class CodecComplexType(udsoncan.DidCodec):
 
         return _encodedBytes
 
-    def decode(self, paramEncodedBytes: bytes, paramRaw:bool=False) -> Any:
+    def decode(self, paramEncodedBytes: bytes, paramRaw:bool=False, paramFields:list=None, paramLazy:bool=False) -> Any:
+        # paramFields limits the result to the given sub-DID names, the other sub-DIDs are not decoded.
+        # paramLazy returns a LazyRecord that decodes sub-DIDs on first access.
         if(paramRaw): #just convert hex string to bytes
             return CodecRaw.decode(self, paramEncodedBytes)
+        elif(paramLazy):
+            return LazyRecord(self._getLazyDecoders(paramFields), bytes(paramEncodedBytes))
         else:
             _result = dict()
             _index = 0
             for subType in self._subTypes:
-                _result[subType._DIDName] = subType.decode(paramEncodedBytes[_index:_index+subType._numBytes])
+                if paramFields == None or subType._DIDName in paramFields:
+                    _result[subType._DIDName] = subType.decode(paramEncodedBytes[_index:_index+subType._numBytes])
                 _index+=subType._numBytes
             return dict(_result)
+
+    def _getLazyDecoders(self, paramFields:list=None) -> dict:
+        if self._decoders == None:
+            decoders = dict()
+            _index = 0
+            for subType in self._subTypes:
+                decoders[subType._DIDName] = lambda raw, start=_index, codec=subType: codec.decode(raw[start:start+codec._numBytes])
+                _index+=subType._numBytes
+            self._decoders = decoders
+        if paramFields == None:
+            return self._decoders
+        return {name: decoder for name, decoder in self._decoders.items() if name in paramFields}
     
     def getCodecInfo(self):
         argsSubTypes = []
@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+
+import threading
+import time
+
+from onebase.core.ecu_connection import ECUConnection
+
+class ConnectionPool():
+    # Hands out one shared ECUConnection per transport endpoint (connection type, interface, tx, rx). A
+    # connection is opened on first use, checked with TesterPresent before it is handed out again once
+    # paramHealthCheckInterval passed, reopened if the ECU does not answer and closed by a background reaper
+    # after being unused for paramIdleTimeout. ECUConnection serializes its requests, so several users may hold
+    # the same connection. Opening, checking and closing happen outside the pool lock, a slow endpoint only
+    # blocks the users of that endpoint.
+    def __init__(self, paramIdleTimeout:float=300.0, paramHealthCheckInterval:float=30.0, paramConnectionFactory=ECUConnection, paramReapInterval:float=None):
+        self.idleTimeout = paramIdleTimeout
+        self.healthCheckInterval = paramHealthCheckInterval
+        self.reapInterval = paramReapInterval # None checks for idle connections every idleTimeout / 2
+        self._factory = paramConnectionFactory
+        self._entries = dict() # endpoint key -> {"connection", "users", "lastUsed", "lastCheck", "lock"}
+        self._lock = threading.RLock()
+        self._reaper = None
+        self._stopReaper = threading.Event()
+        self.stats = {"opened": 0, "reused": 0, "reconnected": 0, "closed": 0, "healthCheckFailed": 0}
+
+    def acquire(self, paramConnectionType:str, paramConnectionInterface:str, paramTXAddress:int=0x680, paramRXAddress:int=None, **paramOptions) -> ECUConnection:
+        # Returns the open connection of the endpoint, paramOptions (e.g. paramRetryPolicy) are passed to the
+        # factory when the connection is created. Every acquire() needs a release().
+        key = self._makeKey(paramConnectionType, paramConnectionInterface, paramTXAddress, paramRXAddress)
+        with self._lock:
+            self._startReaper()
+            entry = self._entries.get(key)
+            if entry == None: # placeholder until the connection is open, later users of the endpoint wait for it
+                entry = {"connection": None, "users": 0, "lastUsed": time.monotonic(), "lastCheck": time.monotonic(), "lock": threading.Lock()}
+                self._entries[key] = entry
+            entry["users"] += 1 # the reaper leaves the entry alone while it is opened or checked
+            entry["lastUsed"] = time.monotonic()
+
+        try:
+            with entry["lock"]:
+                if entry["connection"] == None: # new endpoint, or the last open or reconnect failed
+                    connection = self._factory(paramTXAddress=key[2], paramRXAddress=key[3], paramConnectionType=paramConnectionType,
+                                               paramConnectionInterface=paramConnectionInterface, paramOpen=False, **paramOptions)
+                    connection.open()
+                    entry["connection"] = connection
+                    entry["lastCheck"] = time.monotonic()
+                    self._count("opened")
+                else:
+                    self._count("reused")
+                    self._checkHealth(key, entry)
+                return entry["connection"]
+        except BaseException:
+            self._releaseEntry(entry)
+            raise
+
+    def release(self, paramConnection:ECUConnection):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["connection"] is paramConnection:
+                    self._releaseEntry(entry)
+                    break
+
+    @contextmanager
+    def connection(self, paramConnectionType:str, paramConnectionInterface:str, paramTXAddress:int=0x680, paramRXAddress:int=None, **paramOptions):
+        # with pool.connection("DoIP", "192.168.1.20") as connection: ...
+        connection = self.acquire(paramConnectionType, paramConnectionInterface, paramTXAddress, paramRXAddress, **paramOptions)
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def closeIdle(self) -> int:
+        # closes the connections nobody used for idleTimeout, returns how many were closed. Called by the reaper.
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, entry in self._entries.items() if entry["users"] == 0 and now - entry["lastUsed"] >= self.idleTimeout]
+            entries = [(key, self._entries.pop(key)) for key in idle]
+        closed = [entry["connection"] for key, entry in entries if entry["connection"] != None] # placeholders of failed opens just go
+        for key, entry in entries:
+            self._close(key, entry["connection"])
+        return len(closed)
+
+    def closeAll(self):
+        # closes every connection, the ones still in use included, and stops the reaper
+        with self._lock:
+            entries = list(self._entries.items())
+            self._entries.clear()
+            reaper = self._reaper
+            self._reaper = None
+            self._stopReaper.set()
+        if reaper != None and reaper is not threading.current_thread():
+            reaper.join()
+        for key, entry in entries:
+            self._close(key, entry["connection"])
+
+    def getStats(self) -> dict:
+        # reconnected counts the reopening after failed health checks and after transport errors during requests
+        with self._lock:
+            stats = dict(self.stats)
+            stats["reconnected"] += sum(entry["connection"].reconnects for entry in self._entries.values() if entry["connection"] != None)
+            stats["open"] = len(self._entries)
+            stats["inUse"] = sum(1 for entry in self._entries.values() if entry["users"] > 0)
+        return stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.closeAll()
+
+    def _makeKey(self, paramConnectionType:str, paramConnectionInterface:str, paramTXAddress:int, paramRXAddress:int) -> tuple:
+        return (paramConnectionType, paramConnectionInterface, paramTXAddress, paramTXAddress + 0x10 if paramRXAddress == None else paramRXAddress)
+
+    def _releaseEntry(self, paramEntry:dict):
+        with self._lock:
+            paramEntry["users"] = max(paramEntry["users"] - 1, 0)
+            paramEntry["lastUsed"] = time.monotonic()
+
+    def _count(self, paramKey:str, paramNumber:int=1):
+        with self._lock:
+            self.stats[paramKey] += paramNumber
+
+    def _startReaper(self):
+        # called with the pool lock held
+        if self._reaper != None:
+            return
+        self._stopReaper.clear()
+        self._reaper = threading.Thread(target=self._reap, name="ConnectionPoolReaper", daemon=True)
+        self._reaper.start()
+
+    def _reap(self):
+        while not self._stopReaper.wait(self.reapInterval if self.reapInterval != None else max(self.idleTimeout / 2, 0.1)):
+            self.closeIdle()
+
+    def _checkHealth(self, paramKey:tuple, paramEntry:dict):
+        # called with the lock of the entry held
+        connection = paramEntry["connection"]
+        if time.monotonic() - paramEntry["lastCheck"] < self.healthCheckInterval and connection.isOpen():
+            return
+        if not connection.isAlive():
+            self._count("healthCheckFailed")
+            try:
+                connection.reconnect() # counted by the connection
+            except Exception:
+                paramEntry["connection"] = None # the next acquire() opens a new connection
+                self._close(paramKey, connection)
+                raise
+        paramEntry["lastCheck"] = time.monotonic()
+
+    def _close(self, paramKey:tuple, paramConnection:ECUConnection):
+        # the connection is no longer in the pool, None for the placeholder of a failed open
+        if paramConnection == None:
+            return
+        with self._lock:
+            self.stats["closed"] += 1
+            self.stats["reconnected"] += paramConnection.reconnects # kept in the stats after the connection is gone
+        try:
+            paramConnection.close()
+        except Exception as e:
+            print("Connection " + str(paramKey) + " could not be closed cleanly.\nErr: " + str(e))
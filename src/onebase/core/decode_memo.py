@@ -0,0 +1,55 @@
+from collections import OrderedDict
+
+import threading
+
+class FrozenDict(dict):
+    # dict that cannot be changed, so one decoded value can be handed out to every caller. Being a dict it
+    # serializes to the same JSON as the value the codec returned.
+    def _readOnly(self, *args, **kwargs):
+        raise TypeError("Decoded values from the memo are read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readOnly
+    clear = pop = popitem = setdefault = update = _readOnly
+
+def freeze(paramValue):
+    # dicts become FrozenDicts and lists tuples, recursively
+    if type(paramValue) == dict:
+        return FrozenDict((key, freeze(value)) for key, value in paramValue.items())
+    if type(paramValue) == list:
+        return tuple(freeze(value) for value in paramValue)
+    return paramValue
+
+class DecodeMemo():
+    # Bounded LRU of the decoded values of one codec keyed by the raw payload. Polling returns the same payloads
+    # over and over, a hit costs one dictionary lookup instead of a decode.
+    def __init__(self, paramCodec, paramMaxEntries:int=256):
+        self.codec = paramCodec
+        self.maxEntries = paramMaxEntries
+        self._entries = OrderedDict() # raw payload -> frozen decoded value, least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, paramRaw:bytes):
+        key = bytes(paramRaw)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = freeze(self.codec.decode(key))
+        with self._lock:
+            self._entries[key] = value
+            if len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def getStats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "hitRate": self.hits / lookups if lookups > 0 else 0.0}
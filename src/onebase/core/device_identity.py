@@ -0,0 +1,20 @@
+from onebase.core.codecs import CodecComplexType, CodecByte, CodecEnumeration, CodecHardwareSoftwareVersion, CodecUTF8
+
+BUS_IDENTIFICATION_DID = 256
+
+# DID 256 is answered by every OneBase ECU and identifies device type, software version and serial number (VIN)
+BusIdentificationCodec = CodecComplexType(36, "BusIdentification", [CodecByte(1, "BusAddress"),
+                                                                    CodecEnumeration(1, "BusType", "BusTypes"),
+                                                                    CodecEnumeration(1, "DeviceProperty", "Devices"),
+                                                                    CodecEnumeration(1, "DeviceFunction", "Devices"),
+                                                                    CodecHardwareSoftwareVersion(8, "SW-Version"),
+                                                                    CodecHardwareSoftwareVersion(8, "HW-Version"),
+                                                                    CodecUTF8(16, "VIN")])
+
+def decodeBusIdentification(paramRawBytes:bytes) -> dict:
+    return BusIdentificationCodec.decode(bytes(paramRawBytes[:BusIdentificationCodec.getNumBytes()]))
+
+def makeIdentityKey(paramTXAddress:int, paramBusIdentification:dict) -> str:
+    # key for data persisted per device, changes when the device is replaced or its software is updated
+    serial = paramBusIdentification["VIN"].strip() or "unknown"
+    return "%03X_%s_%s" % (paramTXAddress, serial, paramBusIdentification["SW-Version"])
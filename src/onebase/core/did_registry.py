@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+import onebase.core.codecs
+
+FieldLayout = namedtuple("FieldLayout", ["name", "index", "offset", "length", "codec"])
+
+# codecs whose bytes the ECU changes by itself, they are ignored when written payloads are verified
+VOLATILE_CODEC_TYPES = (onebase.core.codecs.CodecDateTime, onebase.core.codecs.CodecSTime, onebase.core.codecs.CodecUTC)
+
+class DIDRegistry(dict):
+    # did -> codec, like the plain DID dictionary, plus the field layout of complex DIDs which is computed once
+    # per DID and dropped when the codec of the DID is replaced
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._layouts = dict() # did -> (codec the layout was computed for, {name: FieldLayout}, [FieldLayout])
+        self._volatileFields = dict() # did -> names of additional volatile sub-DIDs
+        self._masks = dict()          # did -> (codec the mask was computed for, mask or None)
+
+    def getLayout(self, paramDid:int) -> dict:
+        # sub-DID name -> FieldLayout in payload order, None if the DID is not a known complex DID
+        entry = self._getEntry(paramDid)
+        return None if entry == None else entry[1]
+
+    def getField(self, paramDid:int, paramSubDid) -> FieldLayout:
+        # FieldLayout of a sub-DID given by index or name, None if it does not exist
+        entry = self._getEntry(paramDid)
+        if entry == None:
+            return None
+        if type(paramSubDid) == int:
+            return entry[2][paramSubDid] if 0 <= paramSubDid < len(entry[2]) else None
+        return entry[1].get(paramSubDid)
+
+    def setVolatileFields(self, paramDid:int, paramFieldNames:list):
+        # marks sub-DIDs (or the DID itself by its name) as changed by the ECU, e.g. counters or time stamps
+        self._volatileFields[paramDid] = set(paramFieldNames)
+        self._masks.pop(paramDid, None)
+
+    def getVolatileMask(self, paramDid:int) -> bytes:
+        # mask over the payload with 0x00 for volatile and 0xFF for stable bytes, None if no byte is volatile
+        codec = self.get(paramDid)
+        entry = self._masks.get(paramDid)
+        if entry == None or entry[0] is not codec:
+            entry = (codec, self._makeVolatileMask(paramDid, codec))
+            self._masks[paramDid] = entry
+        return entry[1]
+
+    def _makeVolatileMask(self, paramDid:int, paramCodec) -> bytes:
+        if paramCodec == None:
+            return None
+        names = self._volatileFields.get(paramDid, set())
+        if isinstance(paramCodec, VOLATILE_CODEC_TYPES) or paramCodec._DIDName in names:
+            return bytes(paramCodec.getNumBytes())
+        layout = self.getLayout(paramDid)
+        if layout == None:
+            return None
+        mask = bytearray(b"\xff" * paramCodec.getNumBytes())
+        for field in layout.values():
+            if isinstance(field.codec, VOLATILE_CODEC_TYPES) or field.name in names:
+                mask[field.offset:field.offset+field.length] = bytes(field.length)
+        return None if all(byte == 0xFF for byte in mask) else bytes(mask)
+
+    def _getEntry(self, paramDid:int):
+        codec = self.get(paramDid)
+        if type(codec) != onebase.core.codecs.CodecComplexType:
+            return None
+        entry = self._layouts.get(paramDid)
+        if entry == None or entry[0] is not codec:
+            fields = []
+            offset = 0
+            for index, subType in enumerate(codec._subTypes):
+                fields.append(FieldLayout(subType._DIDName, index, offset, subType._numBytes, subType))
+                offset += subType._numBytes
+            entry = (codec, {field.name: field for field in fields}, fields)
+            self._layouts[paramDid] = entry
+        return entry
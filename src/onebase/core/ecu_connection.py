@@ -2,31 +2,53 @@ import udsoncan
 from doipclient import DoIPClient
 from doipclient.connectors import DoIPClientUDSConnector
 from onebase.uds.uds_client import OneBaseUDSClient
+from onebase.uds.uds_periodic import PeriodicDataConnection, TransmissionMode
 from onebase.tools.open3e_converter import *
 from udsoncan.exceptions import *
 from udsoncan.services import *
 
+import can
 from can.interface import Bus
 from udsoncan.connections import PythonIsoTpConnection
 from can.interfaces.socketcan import SocketcanBus
 from can.interfaces.slcan import slcanBus
 import isotp
 
+import asyncio
 import importlib
-import binascii
+import itertools
 import os
 import sys
 import time
 import json
+import queue
+import threading
+from collections import deque
 
 import onebase.core.codecs
 from onebase.core.codecs import *
+from onebase.core.timing import AdaptiveTimeout, RetryPolicy, CircuitBreaker, ECUParkedException
+from onebase.core.negative_cache import NegativeResponseCache
+from onebase.core.capability_map import CapabilityMap
+from onebase.core.change_detection import ChangeDetector
+from onebase.core.did_registry import DIDRegistry
+from onebase.core.decode_memo import DecodeMemo
+from onebase.core.subscriptions import SubscriptionManager
+from onebase.core.device_identity import BUS_IDENTIFICATION_DID, decodeBusIdentification, makeIdentityKey
 
 class ECUConnection():
     
     GLOBAL_SLCANBUS = None
+    MAX_PENDING_VERIFICATIONS = 256 # deferred write checks kept for verifyWrites(), the oldest are dropped first
     
-    def __init__(self, paramTXAddress:int=0x680, paramRXAddress:int=None, paramConnectionType:str=None, paramConnectionInterface:str=None, paramFilepathDIDList:str=""):
+    def __init__(self, paramTXAddress:int=0x680, paramRXAddress:int=None, paramConnectionType:str=None, paramConnectionInterface:str=None, paramFilepathDIDList:str="", paramAdaptiveTimeout:AdaptiveTimeout=None, paramRetryPolicy:RetryPolicy=None, paramCircuitBreaker:CircuitBreaker=None, paramNegativeCacheFile:str=None, paramCapabilityFile:str=None, paramConnection=None, paramOpen:bool=True):
+        self._lock = threading.RLock()
+
+        # timeout, retry and circuit breaker handling
+        self.adaptiveTimeout = paramAdaptiveTimeout if paramAdaptiveTimeout != None else AdaptiveTimeout()
+        self.retryPolicy = paramRetryPolicy if paramRetryPolicy != None else RetryPolicy()
+        self.circuitBreaker = paramCircuitBreaker if paramCircuitBreaker != None else CircuitBreaker()
+
         # calculate RX address
         self.tx = paramTXAddress
         if paramRXAddress == None:
@@ -34,15 +56,80 @@ class ECUConnection():
         else:
             self.rx = paramRXAddress
 
+        # CAN transfers are paced by the requested stmin of 10 ms per consecutive frame, DoIP is not
+        self.connectionType = paramConnectionType
+        self._timePerFrame = 0.0 if paramConnectionType == "DoIP" else 0.0105
+
         # load DID definition file
-        self.dataIdentifiers = convertDIDs()
+        self.dataIdentifiers = DIDRegistry(convertDIDs())
         #self.dataIdentifiers = self._loadDIDFile(paramFilePath=paramFilepathDIDList)       
 
-        # select backend
-        if(paramConnectionType == "DoIP"): # DoIP
-            conn = DoIPClientUDSConnector(DoIPClient(paramConnectionInterface, self.tx))
+        # cache for negative responses of unsupported DIDs and map of supported DIDs, persisted per device identity if files are given
+        self.negativeCache = NegativeResponseCache(paramFilePath=paramNegativeCacheFile)
+        self.capabilityMap = CapabilityMap(paramFilePath=paramCapabilityFile)
+        self.changeDetector = ChangeDetector(self.dataIdentifiers)
+        self._decodeMemos = None      # codec -> DecodeMemo, see enableDecodeMemo()
+        self._pendingVerifications = dict() # did -> (written payload, time of the write), see verifyWrites()
+        self._subscriptionManager = None # see subscribe()
+        self._learnedLengths = dict() # payload length of DIDs outside the registry, learned from single DID responses
+        self._compositeSources = dict() # dynamic did -> (sources, [(did, sub-DID name, offset, length, codec)]), see defineDynamicDid()
+        self._dynamicDids = set()       # dynamic DIDs currently defined in the ECU
+        self._dynamicDidSupported = None # False once the ECU rejected service 0x2C
+        self._deviceIdentity = None
+        self._identityPending = paramNegativeCacheFile != None or paramCapabilityFile != None
+        self._periodicData = deque(maxlen=10000) # (periodic did, payload, time of reception), see receivePeriodicData()
+        self._periodicIds = set()                # periodic DIDs the ECU was asked to send
+
+        # transport, opened by open()
+        self.connectionInterface = paramConnectionInterface
+        self._connection = paramConnection
+        self._bus = None
+        self.uds_client = None
+        self.reconnects = 0
+        if paramOpen:
+            self.open()
+
+
+    def open(self):
+        # Opens the transport and the UDS client. Done by __init__ unless paramOpen is False, requests open a
+        # closed connection as well.
+        with self._lock:
+            if self.uds_client != None:
+                return self
+            conn = self._openTransport()
+
+            # configuration for udsoncan client
+            config = dict(udsoncan.configs.default_client_config)
+            config['data_identifiers'] = self.dataIdentifiers
+            # initial timeouts, adapted per request to the learned response times
+            config['request_timeout'] = self.adaptiveTimeout.defaultTimeout #seconds
+            config['p2_timeout'] = self.adaptiveTimeout.defaultTimeout #seconds
+            config['p2_star_timeout'] = self.adaptiveTimeout.maxTimeout #seconds, used after response pending (NRC 0x78)
+        
+            # run uds client, periodic data sent by the ECU on its own is collected aside of the responses
+            udsClient = OneBaseUDSClient(PeriodicDataConnection(conn, self._onPeriodicData), config=config)
+            udsClient.open()
+            self.uds_client = udsClient
+
+            if self._identityPending: # caches persisted per device are loaded once the device can be asked
+                self._identityPending = False
+                try:
+                    identityKey = self.getIdentityKey()
+                    self.negativeCache.setIdentity(identityKey)
+                    self.capabilityMap.setIdentity(identityKey)
+                except (TimeoutException, NegativeResponseException) as e:
+                    print("Device identity could not be read, negative response cache and capability map are not loaded.\nErr: " + str(e))
+        return self
 
-        elif (paramConnectionType == "SLCAN"): # SLCAN = CAN over Serial Interface
+    def _openTransport(self):
+        # creates the udsoncan connection of the configured backend
+        self._bus = None # CAN bus owned by this connection, shut down with the transport
+        if self._connection != None: # prepared udsoncan connection, e.g. to a simulated ECU
+            conn = self._connection
+        elif(self.connectionType == "DoIP"): # DoIP
+            conn = DoIPClientUDSConnector(DoIPClient(self.connectionInterface, self.tx))
+
+        elif (self.connectionType == "SLCAN"): # SLCAN = CAN over Serial Interface
             # Refer to isotp documentation for full details about parameters
             isotp_params = {
                 'stmin': 10,                            # Will request the sender to wait 10ms between consecutive frame. 0-127ms or 100-900ns with values from 0xF1-0xF9
@@ -63,8 +150,9 @@ class ECUConnection():
                 'listen_mode': False                    # Does not use the listen_mode which prevent transmission.
             }
             
+            self._bus = None # shared by all SLCAN connections, it stays open
             if ECUConnection.GLOBAL_SLCANBUS == None:
-                bus = slcanBus(channel=paramConnectionInterface, tty_baudrate=115200, bitrate=250000)
+                bus = slcanBus(channel=self.connectionInterface, tty_baudrate=115200, bitrate=250000)
                 ECUConnection.GLOBAL_SLCANBUS = bus
             else:
                 bus = ECUConnection.GLOBAL_SLCANBUS
@@ -74,7 +162,7 @@ class ECUConnection():
             stack.set_sleep_timing(0.01, 0.01)                                                  # Balancing speed and load
             conn = PythonIsoTpConnection(stack)                                                 # interface between Application and Transport layer
 
-        elif (paramConnectionType == "Telnet"): # Telnet = CAN over Remote Serial Interface (Telnet) RFC2217
+        elif (self.connectionType == "Telnet"): # Telnet = CAN over Remote Serial Interface (Telnet) RFC2217
             # Refer to isotp documentation for full details about parameters
             isotp_params = {
                 'stmin': 10,                            # Will request the sender to wait 10ms between consecutive frame. 0-127ms or 100-900ns with values from 0xF1-0xF9
@@ -94,13 +182,14 @@ class ECUConnection():
                 'rate_limit_window_size': 0.2,          # Ignored when rate_limit_enable=False. Sets the averaging window size for bitrate calculation when rate_limit_enable=True
                 'listen_mode': False                    # Does not use the listen_mode which prevent transmission.
             }
-            bus = slcanBus(channel=paramConnectionInterface, tty_baudrate=115200, bitrate=250000)
+            bus = slcanBus(channel=self.connectionInterface, tty_baudrate=115200, bitrate=250000)
+            self._bus = bus
             tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=self.tx, rxid=self.rx) # Network layer addressing scheme
             stack = isotp.CanStack(bus=bus, address=tp_addr, params=isotp_params)               # Network/Transport layer (IsoTP protocol)
             stack.set_sleep_timing(0.01, 0.01)                                                  # Balancing speed and load
             conn = PythonIsoTpConnection(stack)                                                 # interface between Application and Transport layer
 
-        elif (paramConnectionType == "SocketCAN"): # SocketCAN Interface on Linux Systems
+        elif (self.connectionType == "SocketCAN"): # SocketCAN Interface on Linux Systems
             # Refer to isotp documentation for full details about parameters
             isotp_params = {
                 'stmin': 10,                            # Will request the sender to wait 10ms between consecutive frame. 0-127ms or 100-900ns with values from 0xF1-0xF9
@@ -120,7 +209,8 @@ class ECUConnection():
                 'rate_limit_window_size': 0.2,          # Ignored when rate_limit_enable=False. Sets the averaging window size for bitrate calculation when rate_limit_enable=True
                 'listen_mode': False                    # Does not use the listen_mode which prevent transmission.
             }
-            bus = SocketcanBus(channel=paramConnectionInterface, bitrate=250000)                                     # Link Layer (CAN protocol)
+            bus = SocketcanBus(channel=self.connectionInterface, bitrate=250000)                                     # Link Layer (CAN protocol)
+            self._bus = bus
             tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=self.tx, rxid=self.rx) # Network layer addressing scheme
             stack = isotp.CanStack(bus=bus, address=tp_addr, params=isotp_params)               # Network/Transport layer (IsoTP protocol)
             stack.set_sleep_timing(0.01, 0.01)                                                  # Balancing speed and load
@@ -147,22 +237,12 @@ class ECUConnection():
                 'listen_mode': False                    # Does not use the listen_mode which prevent transmission.
             }
             bus = SocketcanBus(channel="can0", bitrate=250000)                                     # Link Layer (CAN protocol)
+            self._bus = bus
             tp_addr = isotp.Address(isotp.AddressingMode.Normal_11bits, txid=self.tx, rxid=self.rx) # Network layer addressing scheme
             stack = isotp.CanStack(bus=bus, address=tp_addr, params=isotp_params)               # Network/Transport layer (IsoTP protocol)
             stack.set_sleep_timing(0.01, 0.01)                                                  # Balancing speed and load
             conn = PythonIsoTpConnection(stack)
-
-        # configuration for udsoncan client
-        config = dict(udsoncan.configs.default_client_config)
-        config['data_identifiers'] = self.dataIdentifiers
-        # increase default timeout
-        config['request_timeout'] = 1 #seconds
-        config['p2_timeout'] = 1 #seconds
-        config['p2_star_timeout'] = 1 #seconds
-        
-        # run uds client
-        self.uds_client = OneBaseUDSClient(conn, config=config)
-        self.uds_client.open()
+        return conn
 
     def _loadDIDFile(self, paramFilePath:str):
         didDictionary = dict()
@@ -192,133 +272,810 @@ class ECUConnection():
 
             return didDictionary
 
+    def _transact(self, paramDid:int, paramFunction, paramTransferTime:float=0.0):
+        # runs one UDS transaction with adaptive timeout, retries with backoff and circuit breaker
+        with self._lock: # the connection is shared by the caller and background workers
+            self.circuitBreaker.check()
+            # every way out records an outcome, otherwise a failed trial request would leave the breaker half-open
+            try:
+                result = self._attempt(paramDid, paramFunction, paramTransferTime)
+            except (NegativeResponseException, InvalidResponseException, UnexpectedResponseException):
+                self.circuitBreaker.recordSuccess() # the ECU answered, even if not the way we hoped
+                raise
+            except Exception: # timeouts after all retries, transport lost again after reconnecting, ...
+                self.circuitBreaker.recordFailure()
+                raise
+            self.circuitBreaker.recordSuccess()
+            return result
+
+    def _attempt(self, paramDid:int, paramFunction, paramTransferTime:float):
+        # runs paramFunction until it returns, retrying timeouts and reconnecting once if the transport is lost
+        if self.uds_client == None:
+            self.open()
+        timeout = self.adaptiveTimeout.getTimeout(paramDid) + paramTransferTime
+        attempt = 0
+        reconnected = False
+
+        while True:
+            self.uds_client.config['request_timeout'] = timeout
+            self.uds_client.config['p2_timeout'] = timeout
+            startTime = time.monotonic()
+            try:
+                result = paramFunction()
+            except (OSError, can.CanError):
+                # transport lost, e.g. TCP connection closed by the gateway or CAN interface gone after bus-off
+                if reconnected:
+                    raise
+                reconnected = True
+                self.reconnect()
+                continue
+            except (NegativeResponseException, InvalidResponseException, UnexpectedResponseException):
+                # the ECU answered, so the latency is valid even though the answer is not
+                self.adaptiveTimeout.record(paramDid, time.monotonic() - startTime)
+                raise
+            except TimeoutException:
+                attempt += 1
+                if attempt > self.retryPolicy.retries:
+                    raise
+                time.sleep(self.retryPolicy.getDelay(attempt))
+                timeout = min(timeout * self.retryPolicy.timeoutFactor, self.adaptiveTimeout.maxTimeout + paramTransferTime)
+                continue
+
+            self.adaptiveTimeout.record(paramDid, time.monotonic() - startTime)
+            return result
+
+    def getLatencyStats(self):
+        return self.adaptiveTimeout.getStats()
+
+    def _estimateTransferTime(self, paramNumBytes:int) -> float:
+        # a multi frame ISO-TP response carries 7 bytes per consecutive frame
+        if paramNumBytes <= 7:
+            return 0.0
+        return ((paramNumBytes - 6) // 7 + 1) * self._timePerFrame
+
+    def _getDidLength(self, paramDid:int):
+        if paramDid in self.dataIdentifiers:
+            return self.dataIdentifiers[paramDid].getNumBytes()
+        if paramDid in self._learnedLengths:
+            return self._learnedLengths[paramDid]
+        return self.capabilityMap.getLength(paramDid)
+
+    def _readMultipleRaw(self, paramDids:list, paramTimingKey=None) -> dict:
+        # one ReadDataByIdentifier request for several DIDs, returns the raw payload of every DID the ECU answered
+        expectedBytes = sum(2 + (self._getDidLength(did) or 0) for did in paramDids)
+        data = self._transact(paramTimingKey, lambda: self.uds_client.send_read_request(paramDids), self._estimateTransferTime(expectedBytes))
+        return self._splitMultipleResponse(paramDids, data)
+
+    def _splitMultipleResponse(self, paramDids:list, paramData:bytes) -> dict:
+        # malformed responses raise InvalidResponseException or UnexpectedResponseException like udsoncan does
+        values = dict()
+        index = 0
+        while index < len(paramData):
+            if not any(paramData[index:]): # zero padding after the last DID
+                break
+            if index + 2 > len(paramData):
+                raise InvalidResponseException(self._makeReadResponse(paramData), "Truncated DID in multi DID response")
+            did = int.from_bytes(paramData[index:index+2], byteorder='big')
+            if did not in paramDids or did in values:
+                raise UnexpectedResponseException(self._makeReadResponse(paramData), "Unexpected DID " + str(did) + " in multi DID response")
+
+            length = self._getDidLength(did)
+            if length == None:
+                if len(paramDids) != 1: # payload boundaries of unknown DIDs can only be found in single DID responses
+                    raise InvalidResponseException(self._makeReadResponse(paramData), "Length of DID " + str(did) + " unknown")
+                length = len(paramData) - index - 2
+                self._learnedLengths[did] = length
+            if index + 2 + length > len(paramData):
+                raise InvalidResponseException(self._makeReadResponse(paramData), "Truncated payload of DID " + str(did) + " in multi DID response")
+
+            values[did] = paramData[index+2:index+2+length]
+            index += 2 + length
+        return values
+
+    def _makeReadResponse(self, paramData:bytes):
+        return udsoncan.Response.from_payload(bytes([0x62]) + bytes(paramData))
+
+    def _makeBatches(self, paramDids:list, paramBatchSize:int, paramMaxResponseBytes:int) -> list:
+        batches = []
+        batch = []
+        batchBytes = 0
+        for did in paramDids:
+            didBytes = 2 + (self._getDidLength(did) or 0)
+            if len(batch) > 0 and (len(batch) >= paramBatchSize or batchBytes + didBytes > paramMaxResponseBytes):
+                batches.append(batch)
+                batch = []
+                batchBytes = 0
+            batch.append(did)
+            batchBytes += didBytes
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def readRawValues(self, paramDids:list, paramBatchSize:int=16, paramMaxResponseBytes:int=4000) -> dict:
+        # raw payloads of several DIDs read in batches, DIDs of failing batches are read one by one and left out if unreadable
+        values = dict()
+        dids = [did for did in paramDids if self.negativeCache.lookup(did) == None]
+        for batch in self._makeBatches(dids, paramBatchSize, paramMaxResponseBytes):
+            values.update(self._readBatch(batch))
+        return values
+
+    def _readBatch(self, paramBatch:list) -> dict:
+        try:
+            return self._readMultipleRaw(paramBatch, tuple(paramBatch) if len(paramBatch) > 1 else paramBatch[0])
+        except (NegativeResponseException, InvalidResponseException, UnexpectedResponseException):
+            if len(paramBatch) == 1:
+                return dict()
+        values = dict()
+        for did in paramBatch:
+            try:
+                values.update(self._readMultipleRaw([did], did))
+            except NegativeResponseException as e:
+                self.negativeCache.store(did, e.response.code)
+            except (InvalidResponseException, UnexpectedResponseException):
+                pass
+        return values
+
+    def iterRead(self, paramDids, paramBatchSize:int=16, paramMaxResponseBytes:int=4000, paramPrefetch:int=2, paramRaw:bool=False):
+        # Generator yielding (did, value, timestamp, latency) in the order of paramDids as soon as the response of
+        # a batch arrived, latency is the round trip of that batch request. A reader thread keeps reading up to
+        # paramPrefetch batches ahead while the caller processes the values. paramDids may be any iterable and is
+        # consumed batch by batch, so memory stays constant for any number of DIDs. DIDs that could not be read are
+        # left out, with paramRaw the values are bytes.
+        batches = queue.Queue(maxsize=max(paramPrefetch, 1))
+        stop = threading.Event()
+
+        def readAhead():
+            try:
+                dids = iter(paramDids)
+                while not stop.is_set():
+                    chunk = list(itertools.islice(dids, paramBatchSize))
+                    if len(chunk) == 0:
+                        break
+                    chunk = [did for did in chunk if self.negativeCache.lookup(did) == None]
+                    for batch in self._makeBatches(chunk, paramBatchSize, paramMaxResponseBytes):
+                        if stop.is_set():
+                            return
+                        startTime = time.monotonic()
+                        values = self._readBatch(batch)
+                        self._putUnlessStopped(batches, (batch, values, time.time(), time.monotonic() - startTime), stop)
+                self._putUnlessStopped(batches, None, stop)
+            except Exception as e: # handed to the caller
+                self._putUnlessStopped(batches, e, stop)
+
+        reader = threading.Thread(target=readAhead, name="iterRead", daemon=True)
+        reader.start()
+        try:
+            while True:
+                item = batches.get()
+                if item == None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                batch, values, timestamp, latency = item
+                for did in batch:
+                    if did in values:
+                        yield did, (values[did] if paramRaw else self.decodeRaw(did, values[did])), timestamp, latency
+        finally:
+            stop.set()
+            while reader.is_alive(): # unblock the reader if the caller stopped early
+                try:
+                    batches.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+
+    async def aiterRead(self, paramDids, paramBatchSize:int=16, paramMaxResponseBytes:int=4000, paramPrefetch:int=2, paramRaw:bool=False):
+        # asynchronous iterRead(), the values are received and decoded in an executor thread so the event loop
+        # is never blocked by the bus
+        loop = asyncio.get_running_loop()
+        values = self.iterRead(paramDids, paramBatchSize, paramMaxResponseBytes, paramPrefetch, paramRaw)
+        try:
+            while True:
+                item = await loop.run_in_executor(None, next, values, None)
+                if item == None:
+                    return
+                yield item
+        finally:
+            await loop.run_in_executor(None, values.close)
+
+    def _putUnlessStopped(self, paramQueue:queue.Queue, paramItem, paramStop:threading.Event):
+        while not paramStop.is_set():
+            try:
+                paramQueue.put(paramItem, timeout=0.01)
+                return
+            except queue.Full:
+                pass
+
+    def _readRawByDid(self, paramDid:int) -> bytes:
+        values = self._readMultipleRaw([paramDid], paramDid)
+        if paramDid not in values:
+            raise UnexpectedResponseException(udsoncan.Response(service=udsoncan.services.ReadDataByIdentifier, code=udsoncan.Response.Code.PositiveResponse), "No payload for DID " + str(paramDid) + " in response")
+        return values[paramDid]
+
+    def readRaw(self, paramDid:int, paramSubDid=None):
+        # Returns the payload of the DID as bytes without decoding, or a memoryview on the bytes of one
+        # sub-DID (index or name) of a complex DID.
+        cachedNrc = self.negativeCache.lookup(paramDid)
+        if cachedNrc != None:
+            raise NegativeResponseException(udsoncan.Response(service=udsoncan.services.ReadDataByIdentifier, code=cachedNrc))
+        field = None if paramSubDid == None else self._getSubDidField(paramDid, paramSubDid)
+        try:
+            payload = self._readRawByDid(paramDid)
+        except NegativeResponseException as e:
+            self.negativeCache.store(paramDid, e.response.code)
+            raise
+        if field == None:
+            return payload
+        return memoryview(payload)[field.offset:field.offset+field.length]
+
+    def _checkRawLength(self, paramDid:int, paramPayload:bytes):
+        length = self._getDidLength(paramDid)
+        if length != None and len(paramPayload) != length:
+            raise ValueError("Payload of DID " + str(paramDid) + " must be " + str(length) + " bytes long")
+
+    def writeRaw(self, paramDid:int, paramPayload:bytes, paramService77:bool=False):
+        # writes the payload without encoding, returns (success, response code)
+        self._checkRawLength(paramDid, paramPayload)
+        return self._writeRawByDid(paramDid, paramPayload, paramService77)
+
+    def readChanges(self, paramDids:list, paramBatchSize:int=16) -> list:
+        # Reads the DIDs raw and decodes only DIDs (or sub-fields of complex DIDs) whose bytes changed since the
+        # last call. Returns one event dict per changed DID or sub-field, see ChangeDetector.
+        events = []
+        values = self.readRawValues(paramDids, paramBatchSize)
+        for did in paramDids:
+            if did in values:
+                events.extend(self.changeDetector.update(did, values[did]))
+        return events
+
+    def defineDynamicDid(self, paramDynamicDid:int, paramSources:list) -> bool:
+        # Bundles source DIDs and sub-DIDs into one dynamic DID (service 0x2C, define by identifier), so they are
+        # polled with a single request by readDynamicDid(). paramSources holds DIDs or (did, sub-DID index or name)
+        # tuples. Returns False if the ECU rejected the definition, readDynamicDid() then reads the source DIDs
+        # with batched requests instead.
+        entries = []
+        definition = udsoncan.DynamicDidDefinition()
+        for source in paramSources:
+            did, subDid = source if type(source) == tuple else (source, None)
+            if subDid == None:
+                length = self._getDidLength(did)
+                if length == None:
+                    raise ValueError("Length of DID " + str(did) + " unknown")
+                entry = (did, None, 0, length, self.dataIdentifiers.get(did))
+            else:
+                field = self._getSubDidField(did, subDid)
+                entry = (did, field.name, field.offset, field.length, field.codec)
+            definition.add(source_did=did, position=entry[2]+1, memorysize=entry[3])
+            entries.append(entry)
+        self._compositeSources[paramDynamicDid] = (list(paramSources), entries)
+        self._undefineDynamicDid(paramDynamicDid) # the ECU appends a new definition to an existing one
+        if self._dynamicDidSupported == False:
+            return False
+
+        try:
+            self._transact(paramDynamicDid, lambda: self.uds_client.dynamically_define_did(paramDynamicDid, definition))
+        except NegativeResponseException as e:
+            if e.response.code in (udsoncan.Response.Code.ServiceNotSupported, udsoncan.Response.Code.ServiceNotSupportedInActiveSession):
+                self._dynamicDidSupported = False
+            return False
+        except (TimeoutException, InvalidResponseException, UnexpectedResponseException):
+            return False
+        self._dynamicDidSupported = True
+        self._dynamicDids.add(paramDynamicDid)
+        self._learnedLengths[paramDynamicDid] = sum(entry[3] for entry in entries)
+        return True
+
+    def clearDynamicDid(self, paramDynamicDid:int):
+        # removes the definition from the ECU and forgets the sources
+        self._compositeSources.pop(paramDynamicDid, None)
+        self._undefineDynamicDid(paramDynamicDid)
+
+    def _undefineDynamicDid(self, paramDynamicDid:int):
+        self._learnedLengths.pop(paramDynamicDid, None)
+        if paramDynamicDid in self._dynamicDids:
+            self._dynamicDids.discard(paramDynamicDid)
+            try:
+                self._transact(paramDynamicDid, lambda: self.uds_client.clear_dynamically_defined_did(paramDynamicDid))
+            except (NegativeResponseException, TimeoutException, InvalidResponseException, UnexpectedResponseException):
+                pass
+
+    def readDynamicDid(self, paramDynamicDid:int, paramRaw:bool=False) -> dict:
+        # Reads the sources of a dynamic DID defined with defineDynamicDid(). Returns did -> value for whole DIDs
+        # and did -> {sub-DID name: value} for sub-DIDs, with paramRaw the values are bytes. Sources that could
+        # not be read are left out.
+        if paramDynamicDid not in self._compositeSources:
+            raise ValueError("Dynamic DID " + str(paramDynamicDid) + " is not defined")
+        sources, entries = self._compositeSources[paramDynamicDid]
+        if paramDynamicDid in self._dynamicDids:
+            try:
+                payload = self._readRawByDid(paramDynamicDid)
+            except NegativeResponseException: # definition lost, e.g. by a reset or session change of the ECU
+                payload = None
+                if self.defineDynamicDid(paramDynamicDid, sources):
+                    try:
+                        payload = self._readRawByDid(paramDynamicDid)
+                    except NegativeResponseException:
+                        self._dynamicDids.discard(paramDynamicDid)
+            if payload != None:
+                return self.splitDynamicDid(paramDynamicDid, payload, paramRaw)
+
+        # ECU without dynamic DIDs: batched reads of the source DIDs
+        values = self.readRawValues(list(dict.fromkeys(entry[0] for entry in entries)))
+        available = [entry for entry in entries if entry[0] in values]
+        return self._splitComposite(available, [values[entry[0]][entry[2]:entry[2]+entry[3]] for entry in available], paramRaw)
+
+    def splitDynamicDid(self, paramDynamicDid:int, paramPayload:bytes, paramRaw:bool=False) -> dict:
+        # splits the payload of a dynamic DID into the values of its sources like readDynamicDid()
+        entries = self._compositeSources[paramDynamicDid][1]
+        raws = []
+        offset = 0
+        for entry in entries:
+            raws.append(paramPayload[offset:offset+entry[3]])
+            offset += entry[3]
+        return self._splitComposite(entries, raws, paramRaw)
+
+    def isDynamicDid(self, paramDid:int) -> bool:
+        return paramDid in self._compositeSources
+
+    def _onPeriodicData(self, paramPayload:bytes):
+        # periodic data frame without the response ID: low byte of the periodic DID, then the payload
+        self._periodicData.append((0xF200 | paramPayload[0], bytes(paramPayload[1:]), time.time()))
+
+    def startPeriodic(self, paramPeriodicDids:list, paramTransmissionMode:int=TransmissionMode.sendAtMediumRate):
+        # Asks the ECU to send the periodic DIDs (0xF200 to 0xF2FF, e.g. dynamic DIDs) on its own with
+        # ReadDataByPeriodicIdentifier (0x2A), the data is collected by receivePeriodicData(). Raises
+        # NegativeResponseException if the ECU does not support it.
+        ids = [did & 0xFF for did in paramPeriodicDids if 0xF200 <= did <= 0xF2FF]
+        if len(ids) != len(paramPeriodicDids):
+            raise ValueError("Periodic DIDs must be in the range 0xF200 to 0xF2FF")
+        self._transact(AdaptiveTimeout.ECU_KEY, lambda: self.uds_client.read_data_by_periodic_identifier(paramTransmissionMode, ids))
+        self._periodicIds.update(paramPeriodicDids)
+
+    def stopPeriodic(self, paramPeriodicDids:list=None):
+        # stops the periodic transmission of the DIDs, of all DIDs started by startPeriodic() if None
+        dids = sorted(self._periodicIds if paramPeriodicDids == None else set(paramPeriodicDids).intersection(self._periodicIds))
+        if len(dids) == 0:
+            return
+        self._periodicIds.difference_update(dids)
+        try:
+            self._transact(AdaptiveTimeout.ECU_KEY, lambda: self.uds_client.read_data_by_periodic_identifier(TransmissionMode.stopSending, [did & 0xFF for did in dids]))
+        except (NegativeResponseException, TimeoutException, InvalidResponseException, UnexpectedResponseException) as e:
+            print("Periodic transmission could not be stopped.\nErr: " + str(e))
+
+    def receivePeriodicData(self, paramTimeout:float=0.01) -> list:
+        # Waits up to paramTimeout for data sent by the ECU on its own and returns the periodic data received since
+        # the last call as (periodic did, payload, time of reception). Periodic data arriving during requests is
+        # collected as well. Opens a closed connection like requests do, a lost transport is reconnected, which
+        # ends the periodic transmissions (see reconnects).
+        if len(self._periodicData) == 0 and paramTimeout > 0:
+            with self._lock:
+                if self.uds_client == None:
+                    self.open()
+                try:
+                    self.uds_client.conn.wait_frame(timeout=paramTimeout) # anything but periodic data is dropped, there is no request pending
+                except (OSError, can.CanError):
+                    self.reconnect()
+        received = []
+        while len(self._periodicData) > 0:
+            received.append(self._periodicData.popleft())
+        return received
+
+    def _splitComposite(self, paramEntries:list, paramRaws:list, paramRaw:bool) -> dict:
+        result = dict()
+        for (did, name, offset, length, codec), raw in zip(paramEntries, paramRaws):
+            raw = bytes(raw)
+            if not paramRaw:
+                raw = raw.hex() if codec == None else codec.decode(raw)
+            if name == None:
+                result[did] = raw
+            else:
+                result.setdefault(did, dict())[name] = raw
+        return result
+
+    def setDeadband(self, paramDid:int, paramDeadband:float, paramSubDidName:str=None):
+        # numeric changes smaller than the deadband against the last reported value are not reported by readChanges()
+        self.changeDetector.setDeadband(paramDid, paramDeadband, paramSubDidName)
+
+    def _probeBatch(self, paramBatch:list, paramSupported:dict, paramIsoMultiRead:bool, paramKnownToFail:bool=False, paramVerbose:bool=False) -> int:
+        # reads a batch of DIDs and bisects it on failure, returns the number of requests sent
+        numRequests = 0
+        rejected = False
+
+        if not paramKnownToFail:
+            numRequests += 1
+            try:
+                values = self._readMultipleRaw(paramBatch)
+                for did, payload in values.items():
+                    paramSupported[did] = len(payload)
+                if paramIsoMultiRead or len(values) == len(paramBatch):
+                    return numRequests
+                paramBatch = [did for did in paramBatch if did not in values]
+            except NegativeResponseException as e:
+                if len(paramBatch) == 1 or (paramIsoMultiRead and e.response.code == udsoncan.Response.Code.RequestOutOfRange):
+                    for did in paramBatch:
+                        self.negativeCache.store(did, e.response.code)
+                    return numRequests
+                rejected = not paramIsoMultiRead # at least one DID of this batch is unsupported
+            except (TimeoutException, InvalidResponseException, UnexpectedResponseException):
+                if len(paramBatch) == 1:
+                    if paramVerbose:
+                        print("DID " + str(paramBatch[0]) + " could not be read")
+                    return numRequests
+
+        if len(paramBatch) == 1: # the only DID of a batch known to fail is unsupported
+            return numRequests
+
+        # split batch and try both halves. If the ECU rejected the whole batch and the first half is fully
+        # supported, the second half must contain an unsupported DID and is split right away
+        middle = len(paramBatch) // 2
+        numSupported = len(paramSupported)
+        numRequests += self._probeBatch(paramBatch[:middle], paramSupported, paramIsoMultiRead, paramVerbose=paramVerbose)
+        firstHalfSupported = (len(paramSupported) - numSupported) == middle
+        numRequests += self._probeBatch(paramBatch[middle:], paramSupported, paramIsoMultiRead, rejected and firstHalfSupported, paramVerbose)
+        return numRequests
+
+    def discoverSupportedDids(self, paramIncludeRange=False, paramBatchSize:int=32, paramMaxResponseBytes:int=4000, paramIsoMultiRead:bool=True, paramVerbose:bool=False) -> dict:
+        # Finds the DIDs this ECU answers with batched multi DID requests. Batches that fail are split in halves
+        # until single DIDs remain. With paramIsoMultiRead the ECU is expected to behave as ISO 14229-1 specifies:
+        # unsupported DIDs are left out of a positive response and NRC 0x31 means none of the DIDs is supported.
+        # Otherwise the ECU is expected to reject a batch as soon as one DID is unsupported.
+        # paramIncludeRange adds the DIDs 0x0100 to 0x0FFF (or the DIDs given) outside the registry. A multi DID
+        # response can only be split with the lengths of its DIDs, so DIDs of unknown length are read singly once,
+        # their length is learned and later discoveries batch them like the others.
+        candidates = set(self.dataIdentifiers.keys())
+        if paramIncludeRange == True:
+            candidates.update(range(0x0100, 0x1000))
+        elif paramIncludeRange:
+            candidates.update(paramIncludeRange)
+        supported = dict()
+        knownLength = sorted(did for did in candidates if self._getDidLength(did) != None)
+        unknownLength = sorted(did for did in candidates if self._getDidLength(did) == None)
+
+        startTime = time.monotonic()
+        numRequests = 0
+        for batch in self._makeBatches(knownLength, paramBatchSize, paramMaxResponseBytes) + [[did] for did in unknownLength]:
+            numRequests += self._probeBatch(batch, supported, paramIsoMultiRead, paramVerbose=paramVerbose)
+
+        if self.capabilityMap.filePath != None and self.capabilityMap.identityKey == None:
+            self.capabilityMap.setIdentity(self.getIdentityKey())
+        self.capabilityMap.setSupportedDids(supported)
+        self.capabilityMap.save()
+
+        if paramVerbose:
+            print("Found " + str(len(supported)) + " supported DIDs of " + str(len(candidates)) + " in " + str(numRequests) + " requests and " + str(round(time.monotonic() - startTime, 1)) + " s")
+        return supported
+
+    def getSupportedDids(self) -> dict:
+        return self.capabilityMap.getSupportedDids()
+
+    def readDeviceIdentity(self, paramForceRead:bool=False) -> dict:
+        if self._deviceIdentity == None or paramForceRead:
+            request = udsoncan.Request(service=udsoncan.services.ReadDataByIdentifier,data=(BUS_IDENTIFICATION_DID).to_bytes(2, byteorder='big'))
+            response = self._transact(BUS_IDENTIFICATION_DID, lambda: self.uds_client.send_request(request))
+            self._deviceIdentity = decodeBusIdentification(response.data[2:])
+        return self._deviceIdentity
+
+    def getIdentityKey(self) -> str:
+        return makeIdentityKey(self.tx, self.readDeviceIdentity())
+
     def _readByDid(self, did:int, raw:bool=False, paramVerbose:bool=False):
+        cachedNrc = self.negativeCache.lookup(did)
+
         if(did in self.dataIdentifiers):
-            if paramVerbose:
-                print("DID not in DID Dictionary")
-            response = self.uds_client.read_data_by_identifier([did])
-            return response.service_data.values[did]
+            if raw: # hex is only the presentation of the raw bytes
+                return self.readRaw(did).hex()
+            if cachedNrc != None: # answer known unsupported DIDs without a round trip
+                raise NegativeResponseException(udsoncan.Response(service=udsoncan.services.ReadDataByIdentifier, code=cachedNrc))
+            try: # pre-encoded request, the payload is decoded here instead of through the generic response interpretation
+                payload = self._readRawByDid(did)
+            except NegativeResponseException as e:
+                self.negativeCache.store(did, e.response.code)
+                raise
+            return self.dataIdentifiers[did].decode(payload)
         else:
+            if cachedNrc != None:
+                return f"negative response, {cachedNrc}:cached"
+
             request = udsoncan.Request(service=udsoncan.services.ReadDataByIdentifier,data=(did).to_bytes(2, byteorder='big'))
-            response = self.uds_client.send_request(request)
+            try:
+                response = self._transact(did, lambda: self.uds_client.send_request(request))
+            except NegativeResponseException as e:
+                response = e.response
 
             if(response.positive):
-                return binascii.hexlify(response.data[2:]).decode('utf-8')
+                return response.data[2:].hex()
             else:
+                self.negativeCache.store(did, response.code)
                 return f"negative response, {response.code}:{response.invalid_reason}"
     
-    def _writeByDid(self, did:int, val, raw:bool, useService77=False, paramVerbose:bool=False):
-        response = self.uds_client.write_data_by_identifier(did, val, useService77)
-        succ = (response.valid & response.positive)
-        return succ, response.code
+    def _writeRawByDid(self, paramDid:int, paramPayload:bytes, paramService77:bool=False, paramVerbose:bool=False):
+        # Every write ends here: the payload is sent as it is, with service 0x2E or 0x77. A negative response
+        # is returned as (False, response code).
+        if paramService77:
+            request = self.uds_client.prepare_raw_write_77(paramDid, bytes(paramPayload))
+            if paramVerbose:
+                print("Using writeDataByIdentifier service 77. Verify the result!")
+                print(request)
+        else:
+            request = udsoncan.Request(service=udsoncan.services.WriteDataByIdentifier, data=(paramDid).to_bytes(2, byteorder='big') + bytes(paramPayload))
+        try:
+            response = self._transact(paramDid, lambda: self.uds_client.send_request(request))
+        except NegativeResponseException as e:
+            if paramVerbose:
+                print("Device rejected this write access (negative response). Err: " + str(e))
+            return False, e.response.code
+        return (response.valid & response.positive), response.code
+
+    def enableDecodeMemo(self, paramMaxEntries:int=256):
+        # Decoded values are remembered per codec for the last paramMaxEntries raw payloads. Repeated payloads are
+        # not decoded again, the values returned are read-only (dicts are FrozenDicts, lists are tuples).
+        self._decodeMemos = dict()
+        self._decodeMemoSize = paramMaxEntries
+
+    def getDecodeMemoStats(self) -> dict:
+        stats = {"hits": 0, "misses": 0, "entries": 0, "hitRate": 0.0}
+        for memo in (self._decodeMemos or {}).values():
+            for key, value in memo.getStats().items():
+                if key != "hitRate":
+                    stats[key] += value
+        if stats["hits"] + stats["misses"] > 0:
+            stats["hitRate"] = stats["hits"] / (stats["hits"] + stats["misses"])
+        return stats
+
+    def _decode(self, paramCodec, paramRaw:bytes):
+        memo = self._decodeMemos.get(paramCodec)
+        if memo == None:
+            memo = DecodeMemo(paramCodec, self._decodeMemoSize)
+            self._decodeMemos[paramCodec] = memo
+        return memo.decode(paramRaw)
+
+    def decodeRaw(self, paramDid:int, paramRaw:bytes, paramFields:list=None):
+        # decodes a payload read with readRaw() or readRawValues() like readDataByIdentifier() does, paramFields
+        # selects sub-DIDs of a complex or list DID
+        codec = self.dataIdentifiers.get(paramDid)
+        if codec == None:
+            return bytes(paramRaw).hex()
+        if paramFields != None and type(codec) in (onebase.core.codecs.CodecComplexType, onebase.core.codecs.CodecList):
+            return codec.decode(bytes(paramRaw), paramFields=paramFields)
+        if self._decodeMemos != None:
+            return self._decode(codec, paramRaw)
+        return codec.decode(bytes(paramRaw))
+
+    def getLayout(self, paramDid:int) -> dict:
+        # sub-DID name -> FieldLayout (name, index, offset, length, codec) of a complex DID, None for other DIDs
+        return self.dataIdentifiers.getLayout(paramDid)
+
+    def _getSubDidField(self, paramDid:int, paramSubDid):
+        # FieldLayout of a sub-DID given by index or name
+        if type(self.dataIdentifiers.get(paramDid)) != onebase.core.codecs.CodecComplexType:
+            raise NotImplementedError("DID " + str(paramDid) + " is not a known complex DID.")
+        field = self.dataIdentifiers.getField(paramDid, paramSubDid)
+        if field == None:
+            raise NotImplementedError("Sub-DID " + str(paramSubDid) + " is not defined in DID " + str(paramDid) + ".")
+        return field
+
+    def _patchSubDids(self, paramDid:int, paramValues:dict) -> bytes:
+        # reads the DID and returns its payload with the sub-DIDs in paramValues replaced
+        # encode everything before touching the ECU, a bad value must not leave a half written DID
+        patches = []
+        for subDid, value in paramValues.items():
+            field = self._getSubDidField(paramDid, subDid)
+            encodedData = field.codec.encode(value)
+            if len(encodedData) != field.length:
+                raise NotImplementedError("Encoded Sub-DID length does not match the length in complex DID")
+            patches.append((field.offset, field.offset + field.length, encodedData))
+
+        payload = bytearray(self._readRawByDid(paramDid))
+        for start, end, encodedData in patches:
+            payload[start:end] = encodedData
+        return bytes(payload)
+
+    def writeSubDids(self, paramDid:int, paramValues:dict, paramService77:bool=False, paramVerify:bool=False, paramVerbose:bool=False):
+        # Changes several sub-DIDs of a complex DID with one read and one write. paramValues maps sub-DID
+        # names or indices to the new values. With paramVerify the DID is read back once and compared.
+        # Returns (success, response code, new raw payload), see planWrite() for a dry run.
+        with self._lock: # nobody may write the DID between our read and write
+            payload = self._patchSubDids(paramDid, paramValues)
+            if paramVerbose:
+                print("New Raw DID Data: " + payload.hex())
+            succ, code = self._writeRawByDid(paramDid, payload, paramService77, paramVerbose)
+            if succ and paramVerify:
+                readBack = self._readRawByDid(paramDid)
+                succ = self._matchesWritten(paramDid, payload, readBack)
+                if paramVerbose and not succ:
+                    print("Read back DID Data differs: " + readBack.hex())
+            return succ, code, payload
     
-    def readDataByIdentifier(self, paramDid:int, paramSubDid:int=-1, paramRaw:bool=False, paramVerbose:bool=False):
+    def _deferVerification(self, paramDid:int, paramPayload:bytes):
+        with self._lock:
+            self._pendingVerifications.pop(paramDid, None) # a new write of the DID replaces the older one
+            self._pendingVerifications[paramDid] = (bytes(paramPayload), time.monotonic())
+            while len(self._pendingVerifications) > self.MAX_PENDING_VERIFICATIONS: # verifyWrites() is not called
+                del self._pendingVerifications[next(iter(self._pendingVerifications))]
+
+    def _matchesWritten(self, paramDid:int, paramWritten:bytes, paramRead:bytes) -> bool:
+        # compares the payloads without the bytes the ECU changes by itself
+        if len(paramWritten) != len(paramRead):
+            return False
+        mask = self.dataIdentifiers.getVolatileMask(paramDid)
+        if mask == None or len(mask) != len(paramWritten):
+            return paramWritten == paramRead
+        difference = int.from_bytes(paramWritten, byteorder='big') ^ int.from_bytes(paramRead, byteorder='big')
+        return difference & int.from_bytes(mask, byteorder='big') == 0
+
+    def setVolatileFields(self, paramDid:int, paramFieldNames:list):
+        # sub-DIDs the ECU changes by itself, they are not compared when writes are verified
+        self.dataIdentifiers.setVolatileFields(paramDid, paramFieldNames)
+
+    def verifyWrites(self, paramBatchSize:int=16) -> dict:
+        # Reads back all DIDs written with paramDeferCheck since the last call with batched requests and
+        # compares them with the written payloads. Returns did -> {"verified", "written", "read", "delay"},
+        # delay is the time in seconds between write and read-back.
+        with self._lock:
+            pending = self._pendingVerifications
+            self._pendingVerifications = dict()
+        if len(pending) == 0:
+            return dict()
+
+        values = self.readRawValues(sorted(pending.keys()), paramBatchSize)
+        readTime = time.monotonic()
+        report = dict()
+        for did, (written, writeTime) in pending.items():
+            read = values.get(did)
+            report[did] = {"verified": read != None and self._matchesWritten(did, written, read), "written": written.hex(),
+                           "read": None if read == None else read.hex(), "delay": readTime - writeTime}
+        return report
+
+    def writeMany(self, paramValues:dict, paramService77Dids:set=None, paramCheckAfterWrite:bool=True, paramBatchSize:int=16) -> dict:
+        # Writes did -> value one after the other and verifies all of them afterwards with batched reads.
+        # Returns did -> {"success", "code", "error"} plus the verification result of verifyWrites().
+        service77Dids = set() if paramService77Dids == None else paramService77Dids
+        report = dict()
+        for did, value in paramValues.items():
+            try:
+                succ, code = self.writeDataByIdentifier(did, value, paramCheckAfterWrite=paramCheckAfterWrite, paramService77=did in service77Dids, paramDeferCheck=True)
+                report[did] = {"success": succ, "code": code, "error": None}
+            except Exception as e:
+                report[did] = {"success": False, "code": None, "error": str(e)}
+        if paramCheckAfterWrite:
+            for did, verification in self.verifyWrites(paramBatchSize).items():
+                report[did].update(verification)
+        return report
+
+    def readDataByIdentifier(self, paramDid:int, paramSubDid:int=-1, paramRaw:bool=False, paramVerbose:bool=False, paramFields:list=None, paramLazy:bool=False):
+        # paramFields selects sub-DIDs of a complex or list DID, only these are decoded and returned.
+        # paramLazy returns complex and list DIDs as LazyRecord which decodes fields on first access.
 
         if(paramDid in self.dataIdentifiers): #DID is in DID list so decoding is known
             selectedDid = self.dataIdentifiers[paramDid]
 
-            if type(selectedDid) == onebase.core.codecs.CodecComplexType:# DID is complex
+            if (paramFields != None or paramLazy) and not paramRaw and type(selectedDid) in (onebase.core.codecs.CodecComplexType, onebase.core.codecs.CodecList): # projection or lazy record
+                return selectedDid.decode(self.readRaw(paramDid), paramFields=paramFields, paramLazy=paramLazy)
 
-                numSubDids = len(selectedDid.subTypes)
-
-                if paramSubDid == -1: #no sub-DID defined means read whole DID
-                    return self._readByDid(paramDid,paramRaw, paramVerbose)
-                
-                elif paramSubDid >= 0 and paramSubDid < numSubDids: #sub-DID index is valid which means read only sub-DID
-                    selectedSubDid = selectedDid.subTypes[paramSubDid]
-                    nameSelectedSubDid = selectedSubDid.id
-
-                    out1 = self._readByDid(paramDid,paramRaw, paramVerbose)
-
-                    if paramRaw: #if raw reading is activated the result is a hex string
-                        lenSubDid = selectedSubDid.string_len
-                        hexSubStringStartIndex = 0
-                        hexSubStringEndIndex = hexSubStringStartIndex + lenSubDid*2
-
-                        for indexSubDid in range(numSubDids):
-                            if (indexSubDid == paramSubDid):
-                                break
-                            else:
-                                lenCurrentSubDid = selectedDid.subTypes[indexSubDid].string_len
-                                hexSubStringStartIndex += lenCurrentSubDid*2
-                                hexSubStringEndIndex += lenCurrentSubDid*2
-
-                        hexSubString = out1[hexSubStringStartIndex:hexSubStringEndIndex]
-
-                        return hexSubString, nameSelectedSubDid
-                    else:
-                        return out1[nameSelectedSubDid], nameSelectedSubDid
-                    
-                else: #sub-DID index undefined
-                    raise NotImplementedError("Sub-DID Index " + str(paramSubDid) + "is not defined.")
-            else: # DID is not complex
+            if type(selectedDid) == onebase.core.codecs.CodecComplexType and paramSubDid != -1: # sub-DID of complex DID
+                field = self._getSubDidField(paramDid, paramSubDid)
+                subRaw = self.readRaw(paramDid, field.index)
+                if paramRaw: # only the bytes of the sub-DID are converted to hex
+                    return subRaw.hex(), field.name
+                if self._decodeMemos != None:
+                    return self._decode(field.codec, subRaw), field.name
+                return field.codec.decode(bytes(subRaw)), field.name # only the requested sub-DID is decoded
+            elif self._decodeMemos != None and not paramRaw:
+                return self._decode(selectedDid, self.readRaw(paramDid))
+            else: # whole DID
                 return self._readByDid(paramDid,paramRaw, paramVerbose)
         else: #DID is not in DID list
             return self._readByDid(paramDid,paramRaw, paramVerbose)
 
-    def writeDataByIdentifier(self, paramDid:int, paramValue:any, paramSubDid:int=-1, paramRaw:bool=False, paramCheckAfterWrite:bool=False, paramService77:bool=False, paramSimulateOnly=False, paramVerbose:bool=False):
+    def planWrite(self, paramDid:int, paramValue:any, paramSubDid=-1, paramRaw:bool=False) -> bytes:
+        # Returns the payload writeDataByIdentifier() would send for the same arguments, nothing is written.
+        # A sub-DID change reads the DID to patch it.
         if(paramDid in self.dataIdentifiers): #DID is in DID list so decoding is known
             selectedDid = self.dataIdentifiers[paramDid]
-            if (type(selectedDid) == onebase.core.codecs.CodecComplexType): #DID is complex
-                # Step 1: Read raw data of complete complex DID as string
-                numSubDids = len(selectedDid.subTypes)
-                rawDidDataString = self.readDataByIdentifier(paramDid=paramDid, paramVerbose=paramVerbose, paramRaw=True)
-
-                # Step 2: Find sub-DID bytes that need to be modified in DID
-                bytesProcessed = 0
-                bytesSubDid = ""
-                
-                for indexSubDid in range(0, numSubDids):
-                    selectedSubDid = selectedDid.subTypes[indexSubDid]
-                    lenSubDid = selectedSubDid.string_len
-                    startIndexSubDid = bytesProcessed
-                    endIndexSubDid = startIndexSubDid + lenSubDid-1
-   
-                    if indexSubDid == paramSubDid:
-                        matchingSubDid = selectedSubDid
-                        if paramVerbose:
-                            print("DID: " + str(paramDid))
-                            print("DID Name: " + str(selectedDid.id))
-                            print("Raw DID Data: " + str(rawDidDataString))
-                            print("DID " + str(paramDid) + " consists of " + str(numSubDids) + " Sub-DIDs.")
-                            print("Sub DID: " + str(indexSubDid))
-                            print("Sub DID Name: " + selectedSubDid.id)
-                            print("Start Byte: " + str(startIndexSubDid))
-                            print("End Byte: " + str(endIndexSubDid))
-
-                        startStringIndexSubDid = (2*startIndexSubDid)
-                        endStringIndexSubDid = ((endIndexSubDid+1)*2)
-                        
-                        bytesSubDid = rawDidDataString[startStringIndexSubDid:endStringIndexSubDid]
-                              
-                    bytesProcessed += lenSubDid
-
-                # Step 3: Modify bytes in raw complete DID data
-                encodedData = matchingSubDid.encode(paramValue)
-                encodedDataHexString = encodedData.hex()
-                
-                if len(bytesSubDid) == len(encodedDataHexString):
-                    if (paramSubDid == numSubDids-1): #if is last sub DID
-                        rawDidDataNew = rawDidDataString[:startStringIndexSubDid] + encodedDataHexString
-                    elif(paramSubDid == 0): # if is first sub DID
-                        rawDidDataNew = encodedDataHexString + rawDidDataString[endStringIndexSubDid:]
-                    else:
-                        rawDidDataNew = rawDidDataString[0:startStringIndexSubDid] + encodedDataHexString + rawDidDataString[endStringIndexSubDid:]
-                    
-                    if paramVerbose:
-                        print("New Raw Sub DID Data: " + encodedDataHexString)
-                        print("New Raw DID Data: " + rawDidDataNew)
-
-                    if not paramSimulateOnly:
-                        self._writeByDid(paramDid,rawDidDataNew,True,paramService77)
-
-                else:
-                    raise NotImplementedError("Encoded Sub-DID length does not match the length in complex DID")   
+            if (type(selectedDid) == onebase.core.codecs.CodecComplexType and paramSubDid != -1): #sub-DID of complex DID
+                return self._patchSubDids(paramDid, {paramSubDid: paramValue})
+            if paramRaw: #raw bytes, hex strings are accepted as their presentation
+                payload = bytes.fromhex(paramValue) if type(paramValue) == str else bytes(paramValue)
+                self._checkRawLength(paramDid, payload)
+                return payload
+            return selectedDid.encode(paramValue) #whole DID, complex DIDs take a dict of all sub-DID values
+        else: #DID is not in DID list so decoding is unknown. Force raw writing
+            raise NotImplementedError("Writing to unknown DIDs is currently not supported.")
 
-            else: #DID is not complex
-                self._writeByDid(paramDid, paramValue, paramRaw, paramService77)
+    def writeDataByIdentifier(self, paramDid:int, paramValue:any, paramSubDid=-1, paramRaw:bool=False, paramCheckAfterWrite:bool=False, paramService77:bool=False, paramSimulateOnly=False, paramVerbose:bool=False, paramDeferCheck:bool=False):
+        # Returns (success, response code). paramCheckAfterWrite reads the DID back and fails the write if it differs
+        # (volatile fields aside). With paramDeferCheck the read-back is left to verifyWrites() instead, which checks
+        # many writes with batched reads, see writeMany(). paramSimulateOnly writes nothing and returns (True, None),
+        # planWrite() returns the payload that would be written.
+        if paramSimulateOnly:
+            payload = self.planWrite(paramDid, paramValue, paramSubDid, paramRaw)
+            if paramVerbose:
+                print("New Raw DID Data: " + payload.hex())
+            return True, None
+        if(paramDid in self.dataIdentifiers): #DID is in DID list so decoding is known
+            selectedDid = self.dataIdentifiers[paramDid]
+            checkNow = paramCheckAfterWrite and not paramDeferCheck
+            if (type(selectedDid) == onebase.core.codecs.CodecComplexType and paramSubDid != -1): #sub-DID of complex DID
+                succ, code, payload = self.writeSubDids(paramDid, {paramSubDid: paramValue}, paramService77, checkNow, paramVerbose)
+            else:
+                payload = self.planWrite(paramDid, paramValue, paramRaw=paramRaw)
+                if paramVerbose:
+                    print("New Raw DID Data: " + payload.hex())
+                with self._lock: # nobody may write the DID between our write and the read-back
+                    succ, code = self._writeRawByDid(paramDid, payload, paramService77, paramVerbose)
+                    if succ and checkNow:
+                        readBack = self._readRawByDid(paramDid)
+                        succ = self._matchesWritten(paramDid, payload, readBack)
+                        if paramVerbose and not succ:
+                            print("Read back DID Data differs: " + readBack.hex())
+            if succ and paramCheckAfterWrite and paramDeferCheck:
+                self._deferVerification(paramDid, payload)
+            return succ, code
         else: #DID is not in DID list so decoding is unknown. Force raw writing
             raise NotImplementedError("Writing to unknown DIDs is currently not supported.")
             
+    def subscribe(self, paramDid:int, paramCallback, paramInterval:float, paramFields:list=None, paramOnChange:bool=True) -> int:
+        # Polls the DID every paramInterval seconds in a background worker and calls paramCallback(did, value,
+        # timestamp) from a thread pool, with paramOnChange only when the value changed. paramFields selects
+        # sub-DIDs of a complex or list DID. Returns the id for unsubscribe(), see SubscriptionManager.
+        if self._subscriptionManager == None:
+            self._subscriptionManager = SubscriptionManager(self)
+        return self._subscriptionManager.subscribe(paramDid, paramCallback, paramInterval, paramFields, paramOnChange)
+
+    def unsubscribe(self, paramSubscriptionId:int):
+        if self._subscriptionManager != None:
+            self._subscriptionManager.unsubscribe(paramSubscriptionId)
+
+    def isOpen(self) -> bool:
+        return self.uds_client != None and self.uds_client.conn.is_open()
+
+    def isAlive(self) -> bool:
+        # health check with TesterPresent, any answer of the ECU, a negative one as well, proves the link works
+        if not self.isOpen():
+            return False
+        try:
+            self._transact(AdaptiveTimeout.ECU_KEY, lambda: self.uds_client.tester_present())
+        except NegativeResponseException:
+            return True
+        except (TimeoutException, InvalidResponseException, UnexpectedResponseException, OSError, can.CanError):
+            return False
+        return True
+
+    def reconnect(self):
+        # closes and opens the transport again, caches, subscriptions and learned timings are kept
+        with self._lock:
+            self._closeTransport()
+            self._periodicIds.clear() # periodic transmissions end with the session
+            self.reconnects += 1
+            self.open()
+
+    def _closeTransport(self):
+        udsClient = self.uds_client
+        self.uds_client = None
+        if udsClient != None:
+            try:
+                udsClient.close()
+            except Exception as e: # the transport may be broken already
+                print("Transport could not be closed cleanly.\nErr: " + str(e))
+        if self._bus != None:
+            try:
+                self._bus.shutdown()
+            except Exception:
+                pass
+            self._bus = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
     def close(self):
-        self.uds_client.close()
\ No newline at end of file
+        if self._subscriptionManager != None:
+            self._subscriptionManager.stop()
+            self._subscriptionManager = None
+        if self.isOpen():
+            self.stopPeriodic()
+        self.negativeCache.save()
+        self.capabilityMap.save()
+        with self._lock:
+            self._closeTransport()
\ No newline at end of file
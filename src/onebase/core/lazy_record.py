@@ -0,0 +1,52 @@
+from collections.abc import Mapping
+
+class LazyRecord(Mapping):
+    # Read-only mapping over the raw payload of a complex or list DID. A field is decoded on first access and
+    # cached, fields that are never accessed are never decoded. Compares equal to the dict the eager decode returns.
+    # The json module only serializes real dicts, so json.dumps() needs default=jsonDefault (or toDict() first),
+    # like every JSON sink of the package does.
+    __slots__ = ("_decoders", "_raw", "_values")
+
+    def __init__(self, paramDecoders:dict, paramRaw:bytes):
+        self._decoders = paramDecoders # field name -> function(raw) -> value, in payload order
+        self._raw = paramRaw
+        self._values = dict()
+
+    def __getitem__(self, paramName):
+        try:
+            return self._values[paramName]
+        except KeyError:
+            pass
+        value = self._decoders[paramName](self._raw)
+        self._values[paramName] = value
+        return value
+
+    def __iter__(self):
+        return iter(self._decoders)
+
+    def __len__(self) -> int:
+        return len(self._decoders)
+
+    def __repr__(self) -> str:
+        return repr(self.toDict())
+
+    def getRaw(self) -> bytes:
+        return self._raw
+
+    def toDict(self) -> dict:
+        # decodes all fields, nested records become dicts as well
+        return {name: toPlainValue(self[name]) for name in self._decoders}
+
+def toPlainValue(paramValue):
+    # replaces lazy records in decoded values by dicts
+    if isinstance(paramValue, LazyRecord):
+        return paramValue.toDict()
+    if type(paramValue) == list:
+        return [toPlainValue(item) for item in paramValue]
+    return paramValue
+
+def jsonDefault(paramValue):
+    # default function for json.dumps, serializes lazy records exactly like the eagerly decoded dicts
+    if isinstance(paramValue, LazyRecord):
+        return paramValue.toDict()
+    raise TypeError("Object of type " + type(paramValue).__name__ + " is not JSON serializable")
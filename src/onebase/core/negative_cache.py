@@ -0,0 +1,85 @@
+from udsoncan.ResponseCode import ResponseCode
+
+import json
+import os
+import time
+
+class NegativeResponseCache():
+    # Remembers negative read responses per DID so unsupported DIDs are not requested on every poll
+    PERMANENT = None
+
+    # time to live in seconds per negative response code, 0 means not cached
+    DEFAULT_POLICY = {
+        ResponseCode.RequestOutOfRange: PERMANENT,          # DID not implemented on this device
+        ResponseCode.ServiceNotSupported: PERMANENT,
+        ResponseCode.SecurityAccessDenied: 300.0,
+        ResponseCode.ConditionsNotCorrect: 10.0,            # e.g. component currently switched off
+        ResponseCode.BusyRepeatRequest: 0,
+        ResponseCode.RequestCorrectlyReceived_ResponsePending: 0
+    }
+
+    def __init__(self, paramFilePath:str=None, paramPolicy:dict=None, paramDefaultTTL:float=60.0):
+        self.filePath = paramFilePath
+        self.policy = dict(NegativeResponseCache.DEFAULT_POLICY)
+        if paramPolicy != None:
+            self.policy.update(paramPolicy)
+        self.defaultTTL = paramDefaultTTL
+
+        self.identityKey = None
+        self._entries = dict() # did -> (nrc, expiry as unix time or None for permanent)
+        self._dirty = False
+
+    def lookup(self, paramDid:int):
+        entry = self._entries.get(paramDid)
+        if entry == None:
+            return None
+        nrc, expiry = entry
+        if expiry != None and time.time() >= expiry:
+            del self._entries[paramDid]
+            self._dirty = True
+            return None
+        return nrc
+
+    def store(self, paramDid:int, paramNrc:int):
+        ttl = self.policy.get(paramNrc, self.defaultTTL)
+        if ttl == 0:
+            return
+        expiry = None if ttl == NegativeResponseCache.PERMANENT else time.time() + ttl
+        self._entries[paramDid] = (paramNrc, expiry)
+        self._dirty = True
+
+    def invalidate(self, paramDid:int=None):
+        if paramDid == None:
+            self._entries.clear()
+        else:
+            self._entries.pop(paramDid, None)
+        self._dirty = True
+
+    def getEntries(self) -> dict:
+        return {did: nrc for did, (nrc, expiry) in self._entries.items() if expiry == None or expiry > time.time()}
+
+    def setIdentity(self, paramIdentityKey:str):
+        # switch to the entries persisted for this device, keeping what was learned before the identity was known
+        self.identityKey = paramIdentityKey
+        for did, entry in self._loadFile().get(paramIdentityKey, {}).items():
+            if int(did) not in self._entries:
+                self._entries[int(did)] = (entry["nrc"], entry["expires"])
+
+    def save(self):
+        if self.filePath == None or self.identityKey == None or not self._dirty:
+            return
+        data = self._loadFile()
+        now = time.time()
+        data[self.identityKey] = {str(did): {"nrc": nrc, "expires": expiry} for did, (nrc, expiry) in self._entries.items() if expiry == None or expiry > now}
+
+        tmpFilePath = self.filePath + ".tmp"
+        with open(tmpFilePath, "w") as json_file:
+            json.dump(data, json_file, indent=1)
+        os.replace(tmpFilePath, self.filePath)
+        self._dirty = False
+
+    def _loadFile(self) -> dict:
+        if self.filePath == None or not os.path.isfile(self.filePath):
+            return dict()
+        with open(self.filePath) as json_file:
+            return json.load(json_file)
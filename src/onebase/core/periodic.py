@@ -0,0 +1,172 @@
+from udsoncan.exceptions import NegativeResponseException, TimeoutException, InvalidResponseException, UnexpectedResponseException
+
+import threading
+import time
+
+from onebase.uds.uds_periodic import TransmissionMode
+
+RATES = {"slow": TransmissionMode.sendAtSlowRate, "medium": TransmissionMode.sendAtMediumRate, "fast": TransmissionMode.sendAtFastRate}
+PERIODIC_DIDS = range(0xF200, 0xF300)
+
+class PeriodicReader():
+    # Lets the ECU send DIDs on its own with ReadDataByPeriodicIdentifier (0x2A) instead of polling them. Each
+    # subscription bundles its sources into a dynamic DID in the periodic range, the ECU then sends it at the
+    # slow, medium or fast rate it defines. The worker thread receives the data, decodes it with the registry
+    # and calls the subscribers. Subscriptions the ECU rejects are polled at paramPollIntervals instead. The
+    # periodic transmissions end with the session, so they are requested again after a reconnect.
+    def __init__(self, paramConnection, paramPollIntervals:dict=None, paramPeriodicDids:list=PERIODIC_DIDS):
+        self.connection = paramConnection
+        self.pollIntervals = {"slow": 2.0, "medium": 1.0, "fast": 0.2} # seconds, used when polling
+        if paramPollIntervals != None:
+            self.pollIntervals.update(paramPollIntervals)
+        self._freeDids = [did for did in paramPeriodicDids if 0xF200 <= did <= 0xF2FF]
+        self._subscriptions = dict() # periodic did -> subscription dict
+        self._lock = threading.RLock()
+        self._worker = None
+        self._running = False
+        self._reconnects = 0 # reconnects of the connection when the transmissions were started
+        self.stats = {"pushed": 0, "polled": 0, "pollFailed": 0, "receiveFailed": 0, "restarted": 0, "callbackErrors": 0}
+
+    def subscribe(self, paramSources, paramCallback, paramRate:str="medium") -> int:
+        # paramSources is a periodic DID or a list of DIDs and (did, sub-DID) tuples like for
+        # ECUConnection.defineDynamicDid(). paramCallback(values, timestamp) gets the values like
+        # ECUConnection.readDynamicDid() returns them. Returns the periodic DID that identifies the subscription.
+        if paramRate not in RATES:
+            raise ValueError("Rate must be one of " + ", ".join(RATES))
+        with self._lock:
+            if type(paramSources) == int and 0xF200 <= paramSources <= 0xF2FF: # periodic DID defined by the ECU
+                periodicDid = paramSources
+                if periodicDid in self._subscriptions:
+                    raise ValueError("Periodic DID " + hex(periodicDid) + " is subscribed already")
+                if periodicDid in self._freeDids:
+                    self._freeDids.remove(periodicDid)
+                push = True
+            else:
+                if len(self._freeDids) == 0:
+                    raise ValueError("No periodic DID left for another subscription")
+                periodicDid = self._freeDids.pop(0)
+                push = self.connection.defineDynamicDid(periodicDid, self._getSources(paramSources))
+            subscription = {"sources": paramSources, "callback": paramCallback, "rate": paramRate, "push": push, "nextPoll": 0.0}
+            self._subscriptions[periodicDid] = subscription
+            if self._running and push:
+                self._startPush([periodicDid], paramRate)
+        return periodicDid
+
+    def unsubscribe(self, paramPeriodicDid:int):
+        with self._lock:
+            subscription = self._subscriptions.pop(paramPeriodicDid, None)
+            if subscription == None:
+                return
+            if subscription["push"] and self._running:
+                self.connection.stopPeriodic([paramPeriodicDid])
+            if self.connection.isDynamicDid(paramPeriodicDid):
+                self.connection.clearDynamicDid(paramPeriodicDid)
+            self._freeDids.append(paramPeriodicDid)
+
+    def getModes(self) -> dict:
+        # periodic did -> "push" or "poll"
+        with self._lock:
+            return {did: "push" if subscription["push"] else "poll" for did, subscription in self._subscriptions.items()}
+
+    def start(self):
+        if self._running:
+            return
+        with self._lock:
+            self._running = True
+            self._startAllPushes()
+        self._worker = threading.Thread(target=self._run, name="PeriodicReader", daemon=True)
+        self._worker.start()
+
+    def stop(self):
+        self._running = False
+        if self._worker != None:
+            self._worker.join()
+            self._worker = None
+        with self._lock:
+            pushed = [did for did, subscription in self._subscriptions.items() if subscription["push"]]
+        if len(pushed) > 0:
+            self.connection.stopPeriodic(pushed)
+
+    def _getSources(self, paramSources) -> list:
+        return paramSources if type(paramSources) == list else [paramSources]
+
+    def _startAllPushes(self):
+        self._reconnects = self.connection.reconnects
+        for rate in RATES:
+            dids = [did for did, subscription in self._subscriptions.items() if subscription["push"] and subscription["rate"] == rate]
+            if len(dids) > 0:
+                self._startPush(dids, rate)
+
+    def _restartPushes(self):
+        # after a reconnect the dynamic DIDs are defined and the transmissions requested again, subscriptions
+        # failing now are polled
+        with self._lock:
+            for periodicDid, subscription in self._subscriptions.items():
+                if subscription["push"] and self.connection.isDynamicDid(periodicDid):
+                    subscription["push"] = self.connection.defineDynamicDid(periodicDid, self._getSources(subscription["sources"]))
+            self._startAllPushes()
+        self.stats["restarted"] += 1
+
+    def _startPush(self, paramPeriodicDids:list, paramRate:str):
+        try:
+            self.connection.startPeriodic(paramPeriodicDids, RATES[paramRate])
+        except (NegativeResponseException, TimeoutException, InvalidResponseException, UnexpectedResponseException) as e:
+            print("ECU does not send periodic data, DIDs " + ", ".join(hex(did) for did in paramPeriodicDids) + " are polled.\nErr: " + str(e))
+            for did in paramPeriodicDids:
+                self._subscriptions[did]["push"] = False
+
+    def _run(self):
+        while self._running:
+            modes = self.getModes()
+            if "push" in modes.values():
+                try:
+                    if self.connection.reconnects != self._reconnects:
+                        self._restartPushes()
+                    received = self.connection.receivePeriodicData(0.01)
+                except Exception as e: # e.g. the ECU is parked by the circuit breaker, keep the worker running
+                    self.stats["receiveFailed"] += 1
+                    print("Periodic data could not be received.\nErr: " + str(e))
+                    time.sleep(self.pollIntervals["fast"])
+                    received = []
+                for periodicDid, payload, timestamp in received:
+                    self._dispatchPushed(periodicDid, payload, timestamp)
+            else:
+                time.sleep(0.01)
+            self._poll([did for did, mode in modes.items() if mode == "poll"])
+
+    def _dispatchPushed(self, paramPeriodicDid:int, paramPayload:bytes, paramTimestamp:float):
+        subscription = self._subscriptions.get(paramPeriodicDid)
+        if subscription == None: # sent once more after unsubscribe
+            return
+        if self.connection.isDynamicDid(paramPeriodicDid):
+            values = self.connection.splitDynamicDid(paramPeriodicDid, paramPayload)
+        else:
+            codec = self.connection.dataIdentifiers.get(paramPeriodicDid)
+            values = {paramPeriodicDid: paramPayload.hex() if codec == None else codec.decode(paramPayload)}
+        self.stats["pushed"] += 1
+        self._callSubscriber(subscription, values, paramTimestamp)
+
+    def _poll(self, paramPeriodicDids:list):
+        now = time.monotonic()
+        for periodicDid in paramPeriodicDids:
+            subscription = self._subscriptions.get(periodicDid)
+            if subscription == None or subscription["nextPoll"] > now:
+                continue
+            subscription["nextPoll"] = now + self.pollIntervals[subscription["rate"]]
+            try:
+                if self.connection.isDynamicDid(periodicDid):
+                    values = self.connection.readDynamicDid(periodicDid)
+                else:
+                    values = {periodicDid: self.connection.readDataByIdentifier(periodicDid)}
+            except Exception: # keep polling the other subscriptions
+                self.stats["pollFailed"] += 1
+                continue
+            self.stats["polled"] += 1
+            self._callSubscriber(subscription, values, time.time())
+
+    def _callSubscriber(self, paramSubscription:dict, paramValues:dict, paramTimestamp:float):
+        try:
+            paramSubscription["callback"](paramValues, paramTimestamp)
+        except Exception as e:
+            self.stats["callbackErrors"] += 1
+            print("Subscriber of periodic data failed.\nErr: " + str(e))
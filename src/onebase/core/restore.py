@@ -0,0 +1,110 @@
+from onebase.core.did_registry import DIDRegistry
+from onebase.core.snapshot import readSnapshot
+
+WRITE_SERVICE = 0x2E
+WRITE_SERVICE_77 = 0x77
+
+class RestorePlanner():
+    # Restores a snapshot by writing only the DIDs whose current payload differs from it. The current payloads
+    # are read with batched requests, the written DIDs are read back with batched requests as well.
+    # Snapshots contain sensors, counters and clocks as well, so only paramWritableDids (settings) are written.
+    # paramService77Dids are the DIDs that have to be written with service 0x77 instead of 0x2E, they are
+    # writable too. Volatile fields (see DIDRegistry.getVolatileMask) are neither compared nor restored.
+    def __init__(self, paramConnection, paramWritableDids:set, paramService77Dids:set=None, paramBatchSize:int=16, paramMaxResponseBytes:int=4000):
+        self.connection = paramConnection
+        self.service77Dids = set() if paramService77Dids == None else set(paramService77Dids)
+        self.writableDids = set(paramWritableDids).union(self.service77Dids)
+        self.batchSize = paramBatchSize
+        self.maxResponseBytes = paramMaxResponseBytes
+        registry = paramConnection.dataIdentifiers
+        self._registry = registry if isinstance(registry, DIDRegistry) else DIDRegistry(registry)
+
+    def plan(self, paramSnapshot, paramDids:list=None) -> dict:
+        # paramSnapshot is a snapshot file or a dict did -> raw payload. Returns the changes to write, the DIDs
+        # that are unchanged, the DIDs whose current payload could not be read and the DIDs skipped because they
+        # are not writable or volatile as a whole.
+        target = self._loadSnapshot(paramSnapshot)
+        dids = sorted(target.keys() if paramDids == None else set(paramDids).intersection(target.keys()))
+        plan = {"changes": [], "unchanged": [], "unreadable": [], "skipped": []}
+        for did in dids:
+            mask = self._registry.getVolatileMask(did)
+            if did not in self.writableDids or (mask != None and not any(mask)):
+                plan["skipped"].append(did)
+        dids = [did for did in dids if did not in plan["skipped"]]
+        current = self.connection.readRawValues(dids, self.batchSize, self.maxResponseBytes)
+
+        for did in dids:
+            if did not in current:
+                plan["unreadable"].append(did)
+                continue
+            payload = self._keepVolatile(did, current[did], target[did])
+            if payload == current[did]:
+                plan["unchanged"].append(did)
+            else:
+                plan["changes"].append(self._makeChange(did, current[did], payload))
+        return plan
+
+    def restore(self, paramSnapshot, paramDids:list=None, paramVerify:bool=True, paramSimulateOnly:bool=False, paramVerbose:bool=False) -> dict:
+        # Writes the planned changes and reads them back. With paramSimulateOnly nothing is written, the report
+        # only contains the plan.
+        report = self.plan(paramSnapshot, paramDids)
+        report.update({"written": [], "failed": dict(), "verifyFailed": []})
+        if paramVerbose:
+            for change in report["changes"]:
+                fields = ", ".join(field["name"] for field in change["fields"])
+                print("DID %d %s: %s -> %s (0x%02X) %s" % (change["did"], change["name"], change["current"].hex(), change["target"].hex(), change["service"], fields))
+        if paramSimulateOnly:
+            return report
+
+        for change in report["changes"]:
+            did = change["did"]
+            try:
+                succ, code = self.connection.writeRaw(did, change["target"], change["service"] == WRITE_SERVICE_77)
+            except Exception as e:
+                report["failed"][did] = str(e)
+                continue
+            if succ:
+                report["written"].append(did)
+            else:
+                report["failed"][did] = "Negative response " + str(code)
+
+        if paramVerify and len(report["written"]) > 0:
+            readBack = self.connection.readRawValues(report["written"], self.batchSize, self.maxResponseBytes)
+            targets = {change["did"]: change["target"] for change in report["changes"]}
+            report["verifyFailed"] = [did for did in report["written"] if readBack.get(did) == None or
+                                      self._keepVolatile(did, readBack[did], targets[did]) != readBack[did]]
+        return report
+
+    def _keepVolatile(self, paramDid:int, paramCurrent:bytes, paramTarget:bytes) -> bytes:
+        # the target payload with the volatile bytes of the current one, equal to paramCurrent if nothing else differs
+        mask = self._registry.getVolatileMask(paramDid)
+        if mask == None or len(mask) != len(paramCurrent) or len(mask) != len(paramTarget):
+            return paramTarget
+        return bytes((target & keep) | (current & ~keep & 0xFF) for current, target, keep in zip(paramCurrent, paramTarget, mask))
+
+    def _loadSnapshot(self, paramSnapshot) -> dict:
+        if type(paramSnapshot) == str:
+            return readSnapshot(paramSnapshot)[1]
+        return paramSnapshot
+
+    def _makeChange(self, paramDid:int, paramCurrent:bytes, paramTarget:bytes) -> dict:
+        codec = self._registry.get(paramDid)
+        change = {"did": paramDid, "name": None if codec == None else codec._DIDName, "current": paramCurrent, "target": paramTarget,
+                  "service": WRITE_SERVICE_77 if paramDid in self.service77Dids else WRITE_SERVICE, "fields": []}
+
+        layout = self._registry.getLayout(paramDid)
+        if layout != None and len(paramCurrent) == len(paramTarget):
+            for field in layout.values(): # sub-fields that differ, with decoded values for the operator
+                start = field.offset
+                end = field.offset + field.length
+                if paramCurrent[start:end] != paramTarget[start:end]:
+                    change["fields"].append({"name": field.name, "current": self._decode(field.codec, paramCurrent[start:end]), "target": self._decode(field.codec, paramTarget[start:end])})
+        elif codec != None:
+            change["fields"].append({"name": codec._DIDName, "current": self._decode(codec, paramCurrent), "target": self._decode(codec, paramTarget)})
+        return change
+
+    def _decode(self, paramCodec, paramRaw:bytes):
+        try:
+            return paramCodec.decode(paramRaw)
+        except Exception:
+            return paramRaw.hex()
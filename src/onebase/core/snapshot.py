@@ -0,0 +1,129 @@
+import json
+import os
+import time
+
+from onebase.core.lazy_record import jsonDefault
+
+SNAPSHOT_VERSION = 1
+
+def readSnapshot(paramFilePath:str):
+    # returns (header, {did: raw payload}) of a snapshot file, DIDs that could not be read are left out
+    header = None
+    values = dict()
+    for record in _readRecords(paramFilePath)[0]:
+        if record.get("type") == "header":
+            header = record
+        elif record.get("raw") != None:
+            values[record["did"]] = bytes.fromhex(record["raw"])
+    return header, values
+
+def _jsonDefault(paramValue):
+    # lazy records like dicts, anything else the json module does not know as its string
+    try:
+        return jsonDefault(paramValue)
+    except TypeError:
+        return str(paramValue)
+
+def _readRecords(paramFilePath:str):
+    # returns the records of a snapshot file and the length of its valid part, a line cut off by an interrupted
+    # dump is not part of it
+    records = []
+    validLength = 0
+    with open(paramFilePath, "rb") as snapshotFile:
+        for line in snapshotFile:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                break
+            validLength += len(line)
+    return records, validLength
+
+class SnapshotEngine():
+    # Dumps all supported DIDs of an ECU to a JSON lines file: one header line, then one line per DID with the raw
+    # payload as hex and the decoded value. DIDs are read with batched requests and written chunk by chunk, every
+    # chunk is flushed to disk, so an interrupted dump continues after the last complete chunk.
+    def __init__(self, paramConnection, paramFilePath:str, paramBatchSize:int=16, paramMaxResponseBytes:int=4000, paramChunkSize:int=64):
+        self.connection = paramConnection
+        self.filePath = paramFilePath
+        self.batchSize = paramBatchSize
+        self.maxResponseBytes = paramMaxResponseBytes
+        self.chunkSize = paramChunkSize
+
+    def run(self, paramDids:list=None, paramResume:bool=True, paramVerbose:bool=False) -> dict:
+        # paramDids defaults to the supported DIDs of the capability map, they are discovered if the map is empty
+        if paramDids == None:
+            supported = self.connection.getSupportedDids()
+            if len(supported) == 0:
+                supported = self.connection.discoverSupportedDids(paramVerbose=paramVerbose)
+            paramDids = supported.keys()
+        dids = sorted(set(paramDids))
+        identityKey = self._getIdentityKey()
+
+        done = set()
+        if paramResume and os.path.exists(self.filePath):
+            records, validLength = _readRecords(self.filePath)
+            if len(records) > 0 and records[0].get("identity") != identityKey:
+                raise ValueError("Snapshot " + self.filePath + " belongs to device " + str(records[0].get("identity")) + ", not to " + str(identityKey))
+            done = {record["did"] for record in records if record.get("raw") != None} # failed DIDs are read again
+            snapshotFile = open(self.filePath, "r+b")
+            snapshotFile.truncate(validLength)
+            snapshotFile.seek(validLength)
+            if validLength == 0:
+                self._writeHeader(snapshotFile, identityKey)
+        else:
+            snapshotFile = open(self.filePath, "wb")
+            self._writeHeader(snapshotFile, identityKey)
+
+        stats = {"dids": len(dids), "read": 0, "failed": 0, "resumed": len(done.intersection(dids)), "seconds": 0.0, "didsPerSecond": 0.0}
+        pending = [did for did in dids if did not in done]
+        startTime = time.monotonic()
+        try:
+            for chunkStart in range(0, len(pending), self.chunkSize):
+                chunk = pending[chunkStart:chunkStart+self.chunkSize]
+                values = self.connection.readRawValues(chunk, self.batchSize, self.maxResponseBytes)
+                lines = []
+                for did in chunk:
+                    if did in values:
+                        stats["read"] += 1
+                        lines.append(self._makeLine(did, values[did]))
+                    else:
+                        stats["failed"] += 1
+                        lines.append(json.dumps({"did": did, "raw": None}) + "\n")
+                snapshotFile.write("".join(lines).encode("utf-8"))
+                snapshotFile.flush()
+                os.fsync(snapshotFile.fileno())
+
+                elapsed = time.monotonic() - startTime
+                if paramVerbose:
+                    print("%d/%d DIDs, %.1f DIDs/s" % (stats["resumed"] + chunkStart + len(chunk), len(dids), (chunkStart + len(chunk)) / elapsed if elapsed > 0 else 0.0))
+        finally:
+            snapshotFile.close()
+
+        stats["seconds"] = time.monotonic() - startTime
+        if stats["seconds"] > 0:
+            stats["didsPerSecond"] = (stats["read"] + stats["failed"]) / stats["seconds"]
+        return stats
+
+    def _getIdentityKey(self):
+        try:
+            return self.connection.getIdentityKey()
+        except Exception as e:
+            print("Device identity could not be read, snapshot is not bound to a device.\nErr: " + str(e))
+            return None
+
+    def _writeHeader(self, paramFile, paramIdentityKey:str):
+        header = {"type": "header", "version": SNAPSHOT_VERSION, "identity": paramIdentityKey, "tx": self.connection.tx, "timestamp": time.time()}
+        paramFile.write((json.dumps(header) + "\n").encode("utf-8"))
+
+    def _makeLine(self, paramDid:int, paramRaw:bytes) -> str:
+        record = {"did": paramDid, "raw": paramRaw.hex()}
+        codec = self.connection.dataIdentifiers.get(paramDid)
+        if codec != None:
+            record["name"] = codec._DIDName
+            try:
+                record["value"] = codec.decode(paramRaw)
+            except Exception as e: # the raw payload is what matters for a restore
+                record["error"] = str(e)
+        return json.dumps(record, default=_jsonDefault) + "\n"
@@ -0,0 +1,146 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import itertools
+import threading
+import time
+
+GROUPING_FRACTION = 0.5
+
+class SubscriptionManager():
+    # Polls subscribed DIDs from one worker thread and hands the decoded values to the callbacks in a thread
+    # pool. DIDs that are due at about the same time are read with batched requests, a DID subscribed several
+    # times is read once. A callback is never called again before it returned, values arriving in the meantime
+    # replace each other, so a slow subscriber gets the latest value and never holds up the bus.
+    def __init__(self, paramConnection, paramMaxWorkers:int=4, paramBatchSize:int=16):
+        self.connection = paramConnection
+        self.batchSize = paramBatchSize
+        self.maxWorkers = paramMaxWorkers
+        self._executor = None # created by _start(), a stopped manager starts again with the next subscribe()
+        self._subscriptions = dict() # subscription id -> subscription dict
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeUp = threading.Event()
+        self._worker = None
+        self._running = False
+        self.stats = {"reads": 0, "updates": 0, "unchanged": 0, "coalesced": 0, "callbackErrors": 0}
+
+    def subscribe(self, paramDid:int, paramCallback, paramInterval:float, paramFields:list=None, paramOnChange:bool=True) -> int:
+        # paramCallback(did, value, timestamp) is called every paramInterval seconds, with paramOnChange only if
+        # the bytes of the DID (of paramFields for complex DIDs) changed. Returns the id for unsubscribe().
+        if paramInterval <= 0:
+            raise ValueError("Interval must be positive")
+        subscription = {"did": paramDid, "callback": paramCallback, "interval": paramInterval, "fields": paramFields, "onChange": paramOnChange,
+                        "slices": self._getSlices(paramDid, paramFields), "nextTime": time.monotonic(), "last": None, "running": False, "pending": None, "active": True}
+        with self._lock:
+            subscriptionId = next(self._ids)
+            self._subscriptions[subscriptionId] = subscription
+        self._start()
+        self._wakeUp.set()
+        return subscriptionId
+
+    def unsubscribe(self, paramSubscriptionId:int):
+        # the DID is left out from the next read on and values read already are dropped, a callback already running completes
+        with self._lock:
+            subscription = self._subscriptions.pop(paramSubscriptionId, None)
+            if subscription != None:
+                subscription["active"] = False
+                subscription["pending"] = None
+        self._wakeUp.set()
+
+    def getSubscribedDids(self) -> set:
+        with self._lock:
+            return {subscription["did"] for subscription in self._subscriptions.values()}
+
+    def stop(self):
+        self._running = False
+        self._wakeUp.set()
+        if self._worker != None:
+            self._worker.join()
+            self._worker = None
+        if self._executor != None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            self._executor = ThreadPoolExecutor(max_workers=self.maxWorkers, thread_name_prefix="Subscriber")
+            self._worker = threading.Thread(target=self._run, name="SubscriptionManager", daemon=True)
+            self._worker.start()
+
+    def _getSlices(self, paramDid:int, paramFields:list):
+        # byte ranges compared for paramOnChange, None compares the whole payload
+        layout = self.connection.dataIdentifiers.getLayout(paramDid)
+        if paramFields == None or layout == None:
+            return None
+        return [(layout[name].offset, layout[name].offset + layout[name].length) for name in paramFields if name in layout]
+
+    def _run(self):
+        while self._running:
+            now = time.monotonic()
+            with self._lock:
+                nextTime = min((subscription["nextTime"] for subscription in self._subscriptions.values()), default=None)
+                if nextTime != None and nextTime <= now: # DIDs due within half of their interval join the read, so their reads line up
+                    due = [subscription for subscription in self._subscriptions.values() if subscription["nextTime"] <= now + subscription["interval"] * GROUPING_FRACTION]
+                else:
+                    due = []
+            if len(due) == 0:
+                self._wakeUp.wait(None if nextTime == None else nextTime - now)
+                self._wakeUp.clear()
+                continue
+
+            for subscription in due: # intervals missed while the bus was busy are skipped instead of caught up
+                subscription["nextTime"] = now + subscription["interval"]
+            try:
+                values = self.connection.readRawValues(list(dict.fromkeys(subscription["did"] for subscription in due)), self.batchSize)
+            except Exception as e: # e.g. ECU parked by the circuit breaker, tried again at the next interval
+                print("Subscribed DIDs could not be read.\nErr: " + str(e))
+                continue
+            self.stats["reads"] += 1
+            timestamp = time.time()
+            for subscription in due:
+                if subscription["did"] in values:
+                    self._update(subscription, values[subscription["did"]], timestamp)
+
+    def _update(self, paramSubscription:dict, paramRaw:bytes, paramTimestamp:float):
+        if paramSubscription["slices"] == None:
+            key = bytes(paramRaw)
+        else:
+            key = tuple(bytes(paramRaw[start:end]) for start, end in paramSubscription["slices"])
+        if paramSubscription["onChange"] and key == paramSubscription["last"]:
+            self.stats["unchanged"] += 1
+            return
+        paramSubscription["last"] = key
+        try:
+            value = self.connection.decodeRaw(paramSubscription["did"], paramRaw, paramSubscription["fields"])
+        except Exception as e:
+            print("DID " + str(paramSubscription["did"]) + " could not be decoded.\nErr: " + str(e))
+            return
+        self.stats["updates"] += 1
+
+        with self._lock:
+            if not paramSubscription["active"]: # unsubscribed during the read
+                return
+            if paramSubscription["running"]: # callback still busy with an older value
+                if paramSubscription["pending"] != None:
+                    self.stats["coalesced"] += 1
+                paramSubscription["pending"] = (value, paramTimestamp)
+                return
+            paramSubscription["running"] = True
+        self._executor.submit(self._callSubscriber, paramSubscription, value, paramTimestamp)
+
+    def _callSubscriber(self, paramSubscription:dict, paramValue, paramTimestamp:float):
+        while True:
+            try:
+                paramSubscription["callback"](paramSubscription["did"], paramValue, paramTimestamp)
+            except Exception as e:
+                self.stats["callbackErrors"] += 1
+                print("Subscriber of DID " + str(paramSubscription["did"]) + " failed.\nErr: " + str(e))
+            with self._lock:
+                if paramSubscription["pending"] == None:
+                    paramSubscription["running"] = False
+                    return
+                paramValue, paramTimestamp = paramSubscription["pending"]
+                paramSubscription["pending"] = None
@@ -0,0 +1,121 @@
+from udsoncan.exceptions import TimeoutException
+from collections import deque
+
+import math
+import time
+
+class ECUParkedException(TimeoutException):
+    pass
+
+class AdaptiveTimeout():
+    # Learns response latencies per DID (and for the whole ECU) and derives request timeouts from them
+    ECU_KEY = None
+
+    def __init__(self, paramDefaultTimeout:float=1.0, paramMinTimeout:float=0.1, paramMaxTimeout:float=5.0, paramPercentile:float=99.0, paramFactor:float=3.0, paramMinSamples:int=8, paramWindowSize:int=64):
+        self.defaultTimeout = paramDefaultTimeout
+        self.minTimeout = paramMinTimeout
+        self.maxTimeout = paramMaxTimeout
+        self.percentile = paramPercentile
+        self.factor = paramFactor
+        self.minSamples = paramMinSamples
+        self.windowSize = paramWindowSize
+
+        self._samples = dict()  # key -> deque of latencies in seconds
+        self._timeouts = dict() # key -> cached timeout, invalidated on every new sample
+
+    def record(self, paramDid:int, paramLatency:float):
+        keys = (paramDid, AdaptiveTimeout.ECU_KEY) if paramDid != AdaptiveTimeout.ECU_KEY else (AdaptiveTimeout.ECU_KEY,)
+        for key in keys:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.windowSize)
+            self._samples[key].append(paramLatency)
+            self._timeouts.pop(key, None)
+
+    def getPercentile(self, paramDid:int=None, paramPercentile:float=None):
+        samples = self._samples.get(paramDid)
+        if not samples:
+            return None
+        if paramPercentile == None:
+            paramPercentile = self.percentile
+
+        ordered = sorted(samples)
+        index = math.ceil(paramPercentile / 100.0 * len(ordered)) - 1 # nearest-rank method
+        return ordered[min(max(index, 0), len(ordered)-1)]
+
+    def getTimeout(self, paramDid:int=None) -> float:
+        # prefer the DID specific distribution, fall back to the ECU wide one and finally to the default
+        for key in (paramDid, AdaptiveTimeout.ECU_KEY):
+            if key in self._timeouts:
+                return self._timeouts[key]
+            samples = self._samples.get(key)
+            if samples != None and len(samples) >= self.minSamples:
+                timeout = self.getPercentile(key) * self.factor
+                timeout = min(max(timeout, self.minTimeout), self.maxTimeout)
+                self._timeouts[key] = timeout
+                return timeout
+        return self.defaultTimeout
+
+    def getStats(self):
+        stats = dict()
+        for key, samples in self._samples.items():
+            stats["ecu" if key == AdaptiveTimeout.ECU_KEY else key] = {
+                "count": len(samples),
+                "p50": self.getPercentile(key, 50.0),
+                "p99": self.getPercentile(key, 99.0),
+                "timeout": self.getTimeout(key)
+            }
+        return stats
+
+class RetryPolicy():
+    # Number of retries after a timeout and the exponential backoff between them
+    def __init__(self, paramRetries:int=2, paramBackoff:float=0.05, paramBackoffFactor:float=2.0, paramMaxBackoff:float=1.0, paramTimeoutFactor:float=2.0):
+        self.retries = paramRetries
+        self.backoff = paramBackoff
+        self.backoffFactor = paramBackoffFactor
+        self.maxBackoff = paramMaxBackoff
+        self.timeoutFactor = paramTimeoutFactor # a retried request gets a longer timeout than the one that expired
+
+    def getDelay(self, paramAttempt:int) -> float:
+        return min(self.backoff * (self.backoffFactor ** (paramAttempt-1)), self.maxBackoff)
+
+class CircuitBreaker():
+    # Parks an unresponsive ECU so that callers fail fast instead of waiting for every timeout
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, paramFailureThreshold:int=3, paramParkDuration:float=30.0, paramMaxParkDuration:float=300.0):
+        self.failureThreshold = paramFailureThreshold
+        self.parkDuration = paramParkDuration
+        self.maxParkDuration = paramMaxParkDuration
+
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._currentParkDuration = paramParkDuration
+        self._parkedUntil = 0.0
+
+    def check(self):
+        if self.state == CircuitBreaker.OPEN:
+            if time.monotonic() < self._parkedUntil:
+                raise ECUParkedException("ECU is parked for another %.1f seconds after %d failed requests" % (self._parkedUntil - time.monotonic(), self._failures))
+            self.state = CircuitBreaker.HALF_OPEN # let one trial request through
+
+    def recordSuccess(self):
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._currentParkDuration = self.parkDuration
+
+    def recordFailure(self):
+        self._failures += 1
+        if self.state == CircuitBreaker.HALF_OPEN: # trial request failed, park again for longer
+            self._currentParkDuration = min(self._currentParkDuration * 2, self.maxParkDuration)
+            self._park()
+        elif self._failures >= self.failureThreshold:
+            self._park()
+
+    def reset(self):
+        self.recordSuccess()
+
+    def _park(self):
+        self.state = CircuitBreaker.OPEN
+        self._parkedUntil = time.monotonic() + self._currentParkDuration
@@ -0,0 +1,35 @@
+# Compares the full decode of complex and list DIDs with projection reads (paramFields) that decode only the
+# sub-DIDs a consumer needs, e.g. the Actual value of all temperature sensors, and with lazy records (paramLazy)
+# that decode a field on first access. No ECU is needed.
+from onebase.core.codecs import CodecInt16, CodecByte, CodecComplexType, CodecList, CodecEnumeration, CodecDateTime
+
+import os
+import timeit
+
+def makeSensor(paramName:str) -> CodecComplexType:
+    return CodecComplexType(9, paramName, [CodecInt16(2, "Actual", paramScale=10.0, paramSigned=True), CodecInt16(2, "Minimum", paramScale=10.0, paramSigned=True),
+                                           CodecInt16(2, "Maximum", paramScale=10.0, paramSigned=True), CodecInt16(2, "Average", paramScale=10.0, paramSigned=True),
+                                           CodecByte(1, "Unknown")])
+
+def makeDtcList() -> CodecList:
+    return CodecList(122, "StatusDtcList", [CodecByte(2, "Count"), CodecComplexType(12, "ListEntries", [CodecEnumeration(2, "State", "States"), CodecDateTime(8, "DateTime"), CodecByte(2, "Unknown")])])
+
+def run(paramRepeat:int=20):
+    sensors = [(makeSensor("Sensor" + str(index)), os.urandom(9)) for index in range(200)]
+    dtcList = makeDtcList()
+    dtcPayload = (10).to_bytes(2, byteorder="little") + bytes.fromhex("0100" + "14180a0f01020304" + "0000") * 10
+    dtcPayload += bytes(122 - len(dtcPayload))
+
+    cases = {
+        "200 sensors, full decode": lambda: [codec.decode(raw) for codec, raw in sensors],
+        "200 sensors, Actual only": lambda: [codec.decode(raw, paramFields=["Actual"]) for codec, raw in sensors],
+        "200 sensors, lazy, Actual": lambda: [codec.decode(raw, paramLazy=True)["Actual"] for codec, raw in sensors],
+        "DTC list, full decode": lambda: dtcList.decode(dtcPayload),
+        "DTC list, Count only": lambda: dtcList.decode(dtcPayload, paramFields=["Count"]),
+    }
+    for name, function in cases.items():
+        seconds = min(timeit.repeat(function, number=100, repeat=paramRepeat)) / 100
+        print("%-28s %9.1f us" % (name, seconds * 1e6))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,61 @@
+# Measures the CPU time per ReadDataByIdentifier request of the generic udsoncan path against the pre-encoded
+# fast path of OneBaseUDSClient (send_read_request(), as used by ECUConnection) for 50 polled DIDs. The ECU is replaced by a connection that answers at once,
+# so only the client side work is measured.
+from onebase.uds.uds_client import OneBaseUDSClient
+from onebase.core.codecs import CodecInt16
+
+from udsoncan.connections import BaseConnection
+import udsoncan
+import time
+
+class InstantConnection(BaseConnection):
+    # answers every ReadDataByIdentifier request with the stored payloads
+    def __init__(self, paramValues:dict):
+        BaseConnection.__init__(self, "instant")
+        self.values = paramValues
+        self.response = None
+        self.opened = False
+
+    def open(self):
+        self.opened = True
+        return self
+
+    def close(self):
+        self.opened = False
+
+    def is_open(self):
+        return self.opened
+
+    def empty_rxqueue(self):
+        self.response = None
+
+    def specific_send(self, payload, timeout=None):
+        dids = [int.from_bytes(payload[index:index+2], byteorder="big") for index in range(1, len(payload), 2)]
+        self.response = bytes([0x62]) + b"".join(did.to_bytes(2, byteorder="big") + self.values[did] for did in dids)
+
+    def specific_wait_frame(self, timeout=None):
+        response, self.response = self.response, None
+        return response
+
+def measure(paramFunction, paramDids:list, paramRepeat:int=20) -> float:
+    startTime = time.process_time()
+    for i in range(paramRepeat):
+        for did in paramDids:
+            paramFunction(did)
+    return (time.process_time() - startTime) / (paramRepeat * len(paramDids))
+
+def run():
+    dids = list(range(0x0200, 0x0200 + 50))
+    config = dict(udsoncan.configs.default_client_config)
+    config['data_identifiers'] = {did: CodecInt16(2, "Setpoint" + str(did), paramScale=10.0, paramSigned=True) for did in dids}
+    client = OneBaseUDSClient(InstantConnection({did: bytes.fromhex("c201") for did in dids}), config=config)
+    client.open()
+
+    generic = measure(lambda did: client.read_data_by_identifier([did]).service_data.values[did], dids)
+    fast = measure(lambda did: config['data_identifiers'][did].decode(client.send_read_request((did,))[2:]), dids) # payload after the DID
+    print("generic read_data_by_identifier   %6.1f us CPU per request" % (generic * 1e6))
+    print("pre-encoded fast path              %6.1f us CPU per request" % (fast * 1e6))
+    client.close()
+
+if __name__ == "__main__":
+    run()
@@ -1,4 +1,5 @@
 from onebase.core.ecu_connection import ECUConnection
+from onebase.core.connection_pool import ConnectionPool
 
 # DoIP: Linux, Windows, MacOS
 InstanceECUConnection680 = ECUConnection(paramTXAddress=0x680, paramRXAddress=0x690, paramConnectionType="DoIP", paramConnectionInterface="192.168.0.1", paramFilepathDIDList="../did_definitions/BV_OneBase_DIDs.json")
@@ -13,4 +14,9 @@ InstanceECUConnection680 = ECUConnection(paramTXAddress=0x680, paramRXAddress=0x
 InstanceECUConnection680 = ECUConnection(paramTXAddress=0x680, paramRXAddress=0x690, paramConnectionType="Telnet", paramConnectionInterface="rfc2217://10.0.1.137:5000", paramFilepathDIDList="../did_definitions/BV_OneBase_DIDs.json")
 
 # SocketCAN: Linux
-InstanceECUConnection680 = ECUConnection(paramTXAddress=0x680, paramRXAddress=0x690, paramConnectionType="SocketCAN", paramConnectionInterface="can0", paramFilepathDIDList="../did_definitions/BV_OneBase_DIDs.json")
\ No newline at end of file
+InstanceECUConnection680 = ECUConnection(paramTXAddress=0x680, paramRXAddress=0x690, paramConnectionType="SocketCAN", paramConnectionInterface="can0", paramFilepathDIDList="../did_definitions/BV_OneBase_DIDs.json")
+
+# Connection pool: one shared connection per endpoint, opened on first use, reopened after a lost link and closed when idle
+pool = ConnectionPool(paramIdleTimeout=300.0)
+with pool.connection("DoIP", "192.168.0.1", 0x680) as InstanceECUConnection680:
+    print(InstanceECUConnection680.readDataByIdentifier(256))
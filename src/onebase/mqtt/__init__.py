@@ -0,0 +1,3 @@
+"""
+tiny-pkg : a tine example for standard packaging
+"""
\ No newline at end of file
@@ -0,0 +1,158 @@
+import paho.mqtt.client as mqtt
+
+import json
+import threading
+import time
+
+import onebase.core.codecs
+from onebase.core.lazy_record import jsonDefault
+
+class MQTTCommandGateway():
+    # Maps <prefix>/<ecu>/<did>/set and <prefix>/<ecu>/<did>/<sub-DID>/set to writes on the ECU connections.
+    # Commands for the same DID are debounced: the write happens once no new command arrived for paramDebounce
+    # seconds (at the latest paramMaxDelay seconds after the first one), the last value per sub-DID wins and all
+    # sub-DID changes of a complex DID are written with one read-modify-write. The result is published to the
+    # same topic with /ack instead of /set.
+    def __init__(self, paramConnections:dict, paramClient:mqtt.Client=None, paramHost:str="localhost", paramPort:int=1883, paramTopicPrefix:str="onebase",
+                 paramDebounce:float=0.5, paramMaxDelay:float=2.0, paramService77Dids:set=None, paramAckQos:int=1, paramVerifyWrites:bool=False):
+        self.connections = paramConnections # ecu name as used in topics -> ECUConnection
+        if paramClient == None:
+            paramClient = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            paramClient.connect_async(paramHost, paramPort)
+            self._ownClient = True
+        else:
+            self._ownClient = False
+        self.client = paramClient
+        self.client.on_connect = self._onConnect
+        self.client.on_message = self._onMessage
+
+        self.topicPrefix = paramTopicPrefix
+        self.debounce = paramDebounce
+        self.maxDelay = paramMaxDelay
+        self.service77Dids = set() if paramService77Dids == None else set(paramService77Dids)
+        self.ackQos = paramAckQos
+        self.verifyWrites = paramVerifyWrites # read complex DIDs back once after writing
+
+        self._pending = dict() # (ecu, did) -> {"values": {sub-DID or None: value}, "first": t, "last": t}
+        self._condition = threading.Condition()
+        self._worker = None
+        self._running = False
+        self.stats = {"commands": 0, "writes": 0, "failed": 0, "invalid": 0}
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="MQTTCommandGateway", daemon=True)
+        self._worker.start()
+        if self._ownClient:
+            self.client.loop_start()
+        else:
+            self._subscribe()
+
+    def stop(self):
+        # commands still waiting for their debounce time are written before the worker exits
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._worker != None:
+            self._worker.join()
+            self._worker = None
+        if self._ownClient:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def handleCommand(self, paramTopic:str, paramPayload:bytes) -> bool:
+        # queues the command of one set topic, returns False if the topic or the ECU is unknown
+        if not paramTopic.startswith(self.topicPrefix + "/") or not paramTopic.endswith("/set"):
+            return False
+        parts = paramTopic[len(self.topicPrefix)+1:-len("/set")].split("/")
+        if len(parts) not in (2, 3) or parts[0] not in self.connections or not parts[1].isdigit():
+            with self._condition: # stats are updated by the network thread of the client and the worker
+                self.stats["invalid"] += 1
+            return False
+        ecuName = parts[0]
+        did = int(parts[1])
+        subDidName = parts[2] if len(parts) == 3 else None
+
+        now = time.monotonic()
+        with self._condition:
+            self.stats["commands"] += 1
+            entry = self._pending.get((ecuName, did))
+            if entry == None:
+                entry = {"values": dict(), "first": now, "last": now}
+                self._pending[(ecuName, did)] = entry
+            entry["values"][subDidName] = self._parsePayload(paramPayload)
+            entry["last"] = now
+            self._condition.notify()
+        return True
+
+    def _onConnect(self, client, userdata, flags, reason_code, properties=None):
+        self._subscribe()
+
+    def _subscribe(self):
+        self.client.subscribe([(self.topicPrefix + "/+/+/set", 1), (self.topicPrefix + "/+/+/+/set", 1)])
+
+    def _onMessage(self, client, userdata, message):
+        self.handleCommand(message.topic, message.payload)
+
+    def _parsePayload(self, paramPayload:bytes):
+        text = paramPayload.decode("utf-8") if type(paramPayload) in (bytes, bytearray) else str(paramPayload)
+        try:
+            return json.loads(text) # numbers and dicts, e.g. {"Text": "..."} for enumerations
+        except ValueError:
+            return text
+
+    def _getDueKey(self, paramNow:float):
+        # returns the key of the next command due for writing and the time to wait if none is due
+        waitTime = None
+        for key, entry in self._pending.items():
+            dueTime = min(entry["last"] + self.debounce, entry["first"] + self.maxDelay)
+            if dueTime <= paramNow:
+                return key, 0
+            if waitTime == None or dueTime - paramNow < waitTime:
+                waitTime = dueTime - paramNow
+        return None, waitTime
+
+    def _run(self):
+        while True:
+            with self._condition:
+                key, waitTime = self._getDueKey(time.monotonic())
+                while key == None and self._running:
+                    self._condition.wait(waitTime)
+                    key, waitTime = self._getDueKey(time.monotonic())
+                if not self._running:
+                    if len(self._pending) == 0:
+                        return
+                    key = next(iter(self._pending)) # flush on stop, without waiting for the debounce time
+                entry = self._pending.pop(key)
+            self._write(key[0], key[1], entry["values"])
+
+    def _write(self, paramEcuName:str, paramDid:int, paramValues:dict):
+        connection = self.connections[paramEcuName]
+        useService77 = paramDid in self.service77Dids
+        error = None
+        try:
+            subDidValues = {name: value for name, value in paramValues.items() if name != None}
+            if type(connection.dataIdentifiers.get(paramDid)) == onebase.core.codecs.CodecComplexType:
+                if None in paramValues: # value for the whole DID, sub-DID commands win over it
+                    if type(paramValues[None]) != dict:
+                        raise ValueError("Complex DID " + str(paramDid) + " expects a dict of sub-DID values")
+                    subDidValues = {**paramValues[None], **subDidValues}
+                succ, code, payload = connection.writeSubDids(paramDid, subDidValues, useService77, paramVerify=self.verifyWrites)
+            elif len(subDidValues) > 0:
+                raise ValueError("DID " + str(paramDid) + " has no sub-DIDs")
+            else:
+                succ, code = connection.writeDataByIdentifier(paramDid, paramValues[None], paramService77=useService77)
+            if not succ:
+                error = "Negative response " + str(code)
+        except Exception as e:
+            error = str(e)
+
+        with self._condition:
+            self.stats["writes"] += 1
+            if error != None:
+                self.stats["failed"] += 1
+        for subDidName, value in paramValues.items():
+            topic = self.topicPrefix + "/" + paramEcuName + "/" + str(paramDid) + ("" if subDidName == None else "/" + subDidName) + "/ack"
+            self.client.publish(topic, json.dumps({"success": error == None, "value": value, "error": error}, default=jsonDefault), self.ackQos)
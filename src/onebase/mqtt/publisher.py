@@ -0,0 +1,181 @@
+import paho.mqtt.client as mqtt
+
+from collections.abc import Mapping
+import json
+import queue
+import threading
+import time
+
+from onebase.core.did_registry import DIDRegistry
+from onebase.core.lazy_record import jsonDefault
+
+class MQTTPublisher():
+    # Publishes decoded DID values to MQTT from a worker thread. publish() only enqueues, so the thread reading
+    # the bus is never blocked by the broker. Topics are <prefix>/<ecu>/<did> and <prefix>/<ecu>/<did>/<sub-DID>
+    # for the sub-DIDs of complex DIDs. Which DIDs are complex is taken from the DID registry of the ECU,
+    # paramDataIdentifiers maps the ecu names to their registries (e.g. ECUConnection.dataIdentifiers).
+    def __init__(self, paramClient:mqtt.Client=None, paramHost:str="localhost", paramPort:int=1883, paramTopicPrefix:str="onebase",
+                 paramMaxQueued:int=10000, paramMaxInflight:int=100, paramBatchSize:int=100, paramBlockOnFull:bool=False,
+                 paramDefaultQos:int=0, paramDefaultRetain:bool=False, paramDataIdentifiers:dict=None):
+        if paramClient == None:
+            paramClient = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+            paramClient.connect_async(paramHost, paramPort)
+            self._ownClient = True
+        else:
+            self._ownClient = False
+        self.client = paramClient
+        self.client.on_publish = self._onPublish
+        self.client.max_inflight_messages_set(paramMaxInflight)
+
+        self.topicPrefix = paramTopicPrefix
+        self.batchSize = paramBatchSize
+        self.blockOnFull = paramBlockOnFull
+        self.defaultQos = paramDefaultQos
+        self.defaultRetain = paramDefaultRetain
+
+        self._queue = queue.Queue(maxsize=paramMaxQueued)
+        self._maxInflight = paramMaxInflight
+        self._inflight = threading.BoundedSemaphore(paramMaxInflight) # messages handed to the client but not yet sent/acknowledged
+        self._topics = dict()     # (ecu, did, sub-DID) -> topic string
+        self._options = dict()    # did -> (qos, retain)
+        self._dataIdentifiers = dict() # ecu -> DIDRegistry
+        for ecuName, dataIdentifiers in (paramDataIdentifiers or dict()).items():
+            self.setDataIdentifiers(ecuName, dataIdentifiers)
+        self._worker = None
+        self._running = False
+        self._abort = False # set by stop() when flushing takes longer than its timeout
+        self.stats = {"queued": 0, "published": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._statsLock = threading.Lock()
+
+    def setTopicOptions(self, paramDid:int, paramQos:int=None, paramRetain:bool=None):
+        qos, retain = self._options.get(paramDid, (self.defaultQos, self.defaultRetain))
+        self._options[paramDid] = (qos if paramQos == None else paramQos, retain if paramRetain == None else paramRetain)
+
+    def setDataIdentifiers(self, paramEcuName:str, paramDataIdentifiers:dict):
+        # plain did -> codec dictionaries are wrapped in a DIDRegistry for the sub-DID layouts
+        if not isinstance(paramDataIdentifiers, DIDRegistry):
+            paramDataIdentifiers = DIDRegistry(paramDataIdentifiers)
+        self._dataIdentifiers[paramEcuName] = paramDataIdentifiers
+
+    def getTopic(self, paramEcuName:str, paramDid:int, paramSubDidName:str=None) -> str:
+        key = (paramEcuName, paramDid, paramSubDidName)
+        topic = self._topics.get(key)
+        if topic == None:
+            topic = self.topicPrefix + "/" + str(paramEcuName) + "/" + str(paramDid)
+            if paramSubDidName != None:
+                topic += "/" + paramSubDidName
+            self._topics[key] = topic
+        return topic
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._abort = False
+        if self._ownClient:
+            self.client.loop_start()
+        self._worker = threading.Thread(target=self._run, name="MQTTPublisher", daemon=True)
+        self._worker.start()
+
+    def stop(self, paramFlushTimeout:float=5.0):
+        # Publishes what is still queued, the batch in progress included, and waits for the broker to acknowledge
+        # it. Messages not handed to the client within paramFlushTimeout are dropped.
+        deadline = time.monotonic() + paramFlushTimeout
+        self._running = False
+        if self._worker != None:
+            self._worker.join(paramFlushTimeout)
+            if self._worker.is_alive():
+                self._abort = True
+                self._worker.join()
+            self._worker = None
+
+        acquired = 0 # all in-flight slots free again means all messages were acknowledged
+        while acquired < self._maxInflight and self._inflight.acquire(timeout=max(deadline - time.monotonic(), 0)):
+            acquired += 1
+        for i in range(acquired):
+            self._inflight.release()
+        if self._ownClient:
+            self.client.loop_stop()
+            self.client.disconnect()
+
+    def publish(self, paramEcuName:str, paramDid:int, paramValue, paramSubDidName:str=None) -> bool:
+        # values of complex DIDs (dicts, LazyRecords, memoized FrozenDicts) are published as one topic per sub-DID,
+        # other values as one payload, e.g. enumerations as JSON. Returns False if the message was dropped.
+        if paramSubDidName == None and isinstance(paramValue, Mapping) and self._isComplex(paramEcuName, paramDid):
+            queued = True
+            for subDidName, subValue in paramValue.items():
+                queued &= self._enqueue((paramEcuName, paramDid, subDidName, subValue))
+            return queued
+        return self._enqueue((paramEcuName, paramDid, paramSubDidName, paramValue))
+
+    def _isComplex(self, paramEcuName:str, paramDid:int) -> bool:
+        dataIdentifiers = self._dataIdentifiers.get(paramEcuName)
+        return dataIdentifiers != None and dataIdentifiers.getLayout(paramDid) != None
+
+    def publishEvents(self, paramEcuName:str, paramEvents:list) -> bool:
+        # publishes change events as returned by ECUConnection.readChanges()
+        queued = True
+        for event in paramEvents:
+            queued &= self._enqueue((paramEcuName, event["did"], event["subDid"], event["value"]))
+        return queued
+
+    def getStats(self) -> dict:
+        with self._statsLock:
+            stats = dict(self.stats)
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+    def _count(self, paramKey:str, paramNumber:int=1):
+        # stats are updated by the caller of publish(), the worker and the callbacks of the client
+        with self._statsLock:
+            self.stats[paramKey] += paramNumber
+
+    def _enqueue(self, paramItem) -> bool:
+        try:
+            self._queue.put(paramItem, block=self.blockOnFull)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def _run(self):
+        # runs until stop() was called and the queue is empty
+        while not self._abort:
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                if not self._running:
+                    return
+                continue
+            try: # drain what is queued already to publish it in one go
+                while len(batch) < self.batchSize:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            self._count("batches")
+
+            for index, (ecuName, did, subDidName, value) in enumerate(batch):
+                qos, retain = self._options.get(did, (self.defaultQos, self.defaultRetain))
+                while not self._inflight.acquire(timeout=0.1): # backpressure from the broker
+                    if self._abort:
+                        self._count("dropped", len(batch) - index)
+                        return
+                info = self.client.publish(self.getTopic(ecuName, did, subDidName), self._makePayload(value), qos, retain)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    self._inflight.release() # there will be no on_publish for this message
+                    self._count("failed")
+
+    def _onPublish(self, client, userdata, mid, reason_code=None, properties=None):
+        self._count("published")
+        try:
+            self._inflight.release()
+        except ValueError: # more callbacks than messages, e.g. after a reconnect
+            pass
+
+    def _makePayload(self, paramValue):
+        if isinstance(paramValue, (Mapping, list, tuple)): # memoized values are FrozenDicts and tuples
+            return json.dumps(paramValue, default=jsonDefault)
+        if type(paramValue) in (bytes, bytearray):
+            return paramValue.hex()
+        return str(paramValue)
@@ -1,17 +1,151 @@
 from udsoncan import  services
 from udsoncan.common.dids import DataIdentifier
 from udsoncan.Response import Response
+from udsoncan.Request import Request
 from udsoncan.ResponseCode import ResponseCode
 
 from udsoncan.exceptions import *
 from typing import Optional, Any
+import time
 
 from udsoncan.client import Client
+from udsoncan import DidCodec, check_did_config, make_did_codec_from_definition, fetch_codec_definition_from_config
 
 from onebase.uds.uds_service_77 import WriteDataByIdentifier77
+from onebase.uds.uds_periodic import ReadDataByPeriodicIdentifier
 
 class OneBaseUDSClient(Client):
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._templates77 = dict() # did -> (codec definition from the config, codec, prefix) for service 0x77 requests
+        self._readRequests = dict() # tuple of DIDs -> pre-encoded ReadDataByIdentifier request
+
+    def get_read_request(self, dids) -> Request:
+        """
+        Returns the pre-encoded ReadDataByIdentifier request for the DIDs, built once per combination of DIDs.
+
+        :param dids: The DIDs to read, the order is kept
+        :type dids: tuple or list of int
+        """
+        return self._get_read_entry(dids)[0]
+
+    def _get_read_entry(self, dids):
+        key = tuple(dids)
+        entry = self._readRequests.get(key)
+        if entry is None:
+            if len(self._readRequests) >= 4096: # changing batches must not let the cache grow without bound
+                self._readRequests.clear()
+            req = Request(services.ReadDataByIdentifier, data=b"".join(did.to_bytes(2, byteorder='big') for did in key))
+            entry = (req, req.get_payload())
+            self._readRequests[key] = entry
+        return entry
+
+    def send_read_request(self, dids) -> bytes:
+        """
+        Sends the pre-encoded ReadDataByIdentifier request for the DIDs and returns the positive response without
+        the service ID. A positive response is recognized by its first byte and returned as it is, everything else
+        goes through the generic :ref:`Response<Response>` parsing. Uses the same timeouts as :meth:`send_request`.
+
+        :raises NegativeResponseException: If the server answered with a negative response
+        :raises TimeoutException: If the server did not answer in time
+        """
+        req, payload = self._get_read_entry(dids)
+        positive_id = services.ReadDataByIdentifier.response_id()
+        overall_timeout = self.config['request_timeout']
+        p2 = self.config['p2_timeout'] if self.session_timing.p2_server_max is None else self.session_timing.p2_server_max
+        single_timeout = p2 if overall_timeout is None else min(overall_timeout, p2)
+        deadline = None if overall_timeout is None else time.monotonic() + overall_timeout
+
+        self.conn.empty_rxqueue()
+        self.conn.send(payload)
+        while True:
+            timeout = single_timeout if deadline is None else min(single_timeout, max(deadline - time.monotonic(), 0))
+            try:
+                recv_payload = self.conn.wait_frame(timeout=timeout, exception=True)
+            except TimeoutException:
+                recv_payload = None
+            if recv_payload is None:
+                raise TimeoutException('Did not receive response in time (timeout=%.3f sec)' % timeout)
+            if len(recv_payload) > 0 and recv_payload[0] == positive_id:
+                return recv_payload[1:]
+
+            response = Response.from_payload(recv_payload)
+            self.last_response = response
+            if not response.valid:
+                raise InvalidResponseException(response)
+            if response.service is not services.ReadDataByIdentifier:
+                raise UnexpectedResponseException(response, "Response gotten from server has a service ID different than the request service ID")
+            if response.code == Response.Code.RequestCorrectlyReceived_ResponsePending:
+                single_timeout = self.config['p2_star_timeout'] if self.session_timing.p2_star_server_max is None else self.session_timing.p2_star_server_max
+                continue
+            raise NegativeResponseException(response)
+
+    def read_data_by_periodic_identifier(self, transmission_mode: int, periodic_ids) -> Response:
+        """
+        Starts or stops the periodic transmission of DIDs through the ReadDataByPeriodicIdentifier service (0x2A).
+        The periodic data is received by a :class:`PeriodicDataConnection<onebase.uds.uds_periodic.PeriodicDataConnection>`.
+
+        :param transmission_mode: One of :class:`TransmissionMode<onebase.uds.uds_periodic.TransmissionMode>`
+        :type transmission_mode: int
+
+        :param periodic_ids: The low bytes of the periodic DIDs 0xF200 to 0xF2FF
+        :type periodic_ids: list of int
+
+        :return: The positive response, it carries no data
+
+        :raises NegativeResponseException: If the server rejected the request
+        """
+        req = Request(ReadDataByPeriodicIdentifier, data=bytes([transmission_mode]) + bytes(periodic_ids))
+        self.logger.info("%s - Transmission mode 0x%02x for periodic identifiers %s" %
+                         (self.service_log_prefix(services.ReadDataByPeriodicIdentifier), transmission_mode, ", ".join("0x%02x" % pid for pid in periodic_ids)))
+        try:
+            return self.send_request(req)
+        except InvalidResponseException as e:
+            if e.response.original_payload == bytes([ReadDataByPeriodicIdentifier.response_id()]): # positive response without data
+                return e.response
+            raise
+
+    def _get_template_77(self, did: int):
+        """
+        Returns the cached (codec definition, codec, prefix) of a DID for service 0x77. The template is built again
+        when the codec of the DID in the ``data_identifiers`` configuration was replaced.
+        """
+        template = self._templates77.get(did)
+        definition = self.config['data_identifiers'].get(did)
+        if template is None or template[0] is not definition:
+            didconfig = check_did_config(did, didconfig=self.config['data_identifiers'])
+            codec = make_did_codec_from_definition(fetch_codec_definition_from_config(did, didconfig))
+            template = (definition, codec, WriteDataByIdentifier77.make_prefix(did))
+            self._templates77[did] = template
+        return template
+
+    def prepare_write_77(self, did: int, value: Any):
+        """
+        Builds a service 0x77 request from the cached template of the DID without looking up the configuration again.
+
+        :param did: The DID to write its value
+        :type did: int
+
+        :param value: Value given to the :ref:`DidCodec <DidCodec>`.encode method.
+        :type value: object
+        """
+        definition, codec, prefix = self._get_template_77(did)
+        if codec.__class__ == DidCodec and isinstance(value, tuple):
+            payload = codec.encode(*value)
+        else:
+            payload = codec.encode(value)
+        return WriteDataByIdentifier77.make_raw_request(did, payload, prefix)
+
+    def prepare_raw_write_77(self, did: int, payload: bytes):
+        """
+        Builds a service 0x77 request for an already encoded payload, the prefix is taken from the cache if the DID is known.
+        """
+        template = self._templates77.get(did)
+        if template is None and did in self.config['data_identifiers']:
+            template = self._get_template_77(did)
+        return WriteDataByIdentifier77.make_raw_request(did, payload, None if template is None else template[2])
+
     def write_data_by_identifier(self, did: int, value: Any, useService77=False) -> Optional[services.WriteDataByIdentifier.InterpretedResponse]:
         """
         Requests to write a value associated with a data identifier (DID) through the :ref:`WriteDataByIdentifier<WriteDataByIdentifier>` service.
@@ -38,7 +172,7 @@ class OneBaseUDSClient(Client):
                 return Response(code=ResponseCode.ConditionsNotCorrect)
         else:
             print('Using writeDataByIdentifier service 77. Verify the result!')
-            req = WriteDataByIdentifier77.make_request(did, value, didconfig=self.config['data_identifiers'])
+            req = self.prepare_write_77(did, value)
             print(req)
             self.logger.info("%s - Writing data identifier 0x%04x (%s)" %
                             (self.service_log_prefix(services.WriteDataByIdentifier), did, DataIdentifier.name_from_id(did)))
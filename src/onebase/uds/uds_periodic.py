@@ -0,0 +1,81 @@
+from udsoncan.connections import BaseConnection
+from udsoncan import services
+
+from typing import Callable, Optional
+import time
+
+PERIODIC_RESPONSE_ID = 0x6A
+
+class TransmissionMode:
+    """
+    Transmission modes of the ReadDataByPeriodicIdentifier service (0x2A). The rates behind slow, medium and
+    fast are defined by the server.
+    """
+    sendAtSlowRate = 0x01
+    sendAtMediumRate = 0x02
+    sendAtFastRate = 0x03
+    stopSending = 0x04
+
+class ReadDataByPeriodicIdentifier(services.ReadDataByPeriodicIdentifier):
+    """
+    ReadDataByPeriodicIdentifier (0x2A) with the transmission mode as first data byte. The transmission mode is
+    no subfunction, it has no bit to suppress the positive response.
+    """
+    _use_subfunction = False
+
+def is_periodic_data(payload: bytes) -> bool:
+    """
+    Tells if a received payload is periodic data (response type 1: 0x6A, periodic DID, data) and not the
+    response to a request. The positive response to a 0x2A request itself is 0x6A alone.
+    """
+    return len(payload) > 1 and payload[0] == PERIODIC_RESPONSE_ID
+
+class PeriodicDataConnection(BaseConnection):
+    """
+    Wraps a connection and hands the periodic data the server sends on its own to a handler, so the frames
+    never reach the client as a response to a pending request. Periodic data still waiting in the reception
+    buffer when a request is sent is handed to the handler instead of being dropped.
+
+    :param conn: The connection to the server
+    :type conn: :ref:`BaseConnection<BaseConnection>`
+
+    :param handler: Called with the payload of every periodic data frame, without the response ID
+    :type handler: callable
+    """
+
+    def __init__(self, conn: BaseConnection, handler: Callable[[bytes], None]):
+        BaseConnection.__init__(self, None)
+        self.name = conn.name
+        self.conn = conn
+        self.handler = handler
+
+    def open(self) -> "PeriodicDataConnection":
+        self.conn.open()
+        return self
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def is_open(self) -> bool:
+        return self.conn.is_open()
+
+    def specific_send(self, payload: bytes, timeout: Optional[float] = None) -> None:
+        self.conn.send(payload, timeout=timeout)
+
+    def specific_wait_frame(self, timeout: Optional[float] = None) -> Optional[bytes]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+            frame = self.conn.wait_frame(timeout=remaining, exception=True)
+            if frame is None or not is_periodic_data(frame):
+                return frame
+            self.handler(frame[1:])
+
+    def empty_rxqueue(self) -> None:
+        while True:
+            frame = self.conn.wait_frame(timeout=0)
+            if frame is None:
+                break
+            if is_periodic_data(frame):
+                self.handler(frame[1:])
+        self.conn.empty_rxqueue()
@@ -58,24 +58,52 @@ class WriteDataByIdentifier77(OneBaseUDSBaseService):
         """
 
         tools.validate_int(did, min=0, max=0xFFFF, name='Data Identifier')
-        req = Request(cls)
         didconfig = check_did_config(did, didconfig=didconfig)  # Make sure all DIDs are correctly defined in client config
         codec_definition = fetch_codec_definition_from_config(did, didconfig)
         codec = make_did_codec_from_definition(codec_definition)
 
         if codec.__class__ == DidCodec and isinstance(value, tuple):
-            req.data = codec.encode(*value)    # Fixes issue #29
+            payload = codec.encode(*value)    # Fixes issue #29
         else:
-            req.data = codec.encode(value)
+            payload = codec.encode(value)
+
+        return cls.make_raw_request(did, payload)
+
+    @classmethod
+    def make_prefix(cls, did: int) -> bytes:
+        """
+        Generates the part of the service 0x77 prefix that only depends on the DID, the length code is appended per request
 
-        # Assemble prefix data for service 0x77:
+        :param did: The data identifier to write
+        :type did: int
+        """
+        tools.validate_int(did, min=0, max=0xFFFF, name='Data Identifier')
         prefix = struct.pack('>H', did)     # encode DID number
-        len_code = 0xb0+ len(req.data)      # encode length: 0xb0 + data length
-        prefix77 = [prefix[0], prefix[1], 0x43, 0x01, 0x82, prefix[1], prefix[0], len_code];
+        return bytes([prefix[0], prefix[1], 0x43, 0x01, 0x82, prefix[1], prefix[0]])
                     # Use did as ID code (first two bytes)
 
-        # Assemble req.data:
-        req.data = bytearray(prefix77) + req.data
+    @classmethod
+    def make_raw_request(cls, did: int, payload: bytes, prefix: bytes = None) -> Request:
+        """
+        Generates a request for WriteDataByIdentifier with an already encoded payload
+
+        :param did: The data identifier to write
+        :type did: int
+
+        :param payload: The encoded value
+        :type payload: bytes
+
+        :param prefix: The prefix of the DID as returned by :meth:`make_prefix`, built if not given
+        :type prefix: bytes
+        """
+        if prefix is None:
+            prefix = cls.make_prefix(did)
+        req = Request(cls)
+
+        # Assemble req.data: prefix, length code 0xb0 + data length, payload
+        req.data = bytearray(prefix)
+        req.data.append(0xb0 + len(payload))
+        req.data += payload
 
         return req
 
@@ -0,0 +1,50 @@
+from onebase.core.codecs import CodecInt16, CodecByte, CodecComplexType, CodecList, CodecEnumeration, CodecDateTime
+from onebase.core.did_registry import DIDRegistry
+
+import pytest
+
+# Codecs shared by the tests, defined like the DIDs of the same name in the OneBase DID list
+
+@pytest.fixture
+def dhwSetpoint():
+    return CodecInt16(2, "DomesticHotWaterTemperatureSetpoint", paramScale=10.0, paramSigned=True) # DID 396
+
+@pytest.fixture
+def roomSetpoint():
+    return CodecComplexType(9, "MixerOneCircuitRoomTemperatureSetpoint", [CodecInt16(2, "Comfort", paramScale=10.0, paramSigned=True), CodecInt16(2, "Standard", paramScale=10.0, paramSigned=True),
+                                                                        CodecInt16(2, "Reduced", paramScale=10.0, paramSigned=True), CodecInt16(2, "Unknown2"), CodecByte(1, "Unknown1")]) # DID 424
+
+@pytest.fixture
+def flowSensor():
+    return CodecComplexType(9, "FlowTemperatureSensor", [CodecInt16(2, "Actual", paramScale=10.0, paramSigned=True), CodecInt16(2, "Minimum", paramScale=10.0, paramSigned=True),
+                                                         CodecInt16(2, "Maximum", paramScale=10.0, paramSigned=True), CodecInt16(2, "Average", paramScale=10.0, paramSigned=True),
+                                                         CodecByte(1, "Unknown")]) # DID 268
+
+@pytest.fixture
+def dtcList():
+    return CodecList(122, "StatusDtcList", [CodecByte(2, "Count"), CodecComplexType(12, "ListEntries", [CodecEnumeration(2, "State", "States"), CodecDateTime(8, "DateTime"), CodecByte(2, "Unknown")])]) # DID 257
+
+@pytest.fixture
+def dataIdentifiers(dhwSetpoint, roomSetpoint, flowSensor):
+    return DIDRegistry({396: dhwSetpoint, 424: roomSetpoint, 268: flowSensor})
+
+@pytest.fixture
+def simulatedECU(dataIdentifiers):
+    # connect(values, ...) returns an ECUConnection to a new ECUSimulator holding the values (did -> raw payload)
+    # and the simulator. The connection decodes the shared DIDs unless paramDataIdentifiers is given, further
+    # options are passed to ECUConnection. The simulators are stopped after the test.
+    pytest.importorskip("open3e") # ECUConnection loads the DID list of open3e
+    from ecu_simulator import ECUSimulator
+    from onebase.core.ecu_connection import ECUConnection
+
+    simulators = []
+    def connect(paramValues:dict, paramDataIdentifiers:dict=None, paramDynamicDids:bool=True, paramPeriodic:bool=True, **paramOptions):
+        simulator = ECUSimulator(paramValues, paramDynamicDids, paramPeriodic)
+        simulators.append(simulator)
+        connection = ECUConnection(paramConnection=simulator.connection, **paramOptions)
+        connection.dataIdentifiers = DIDRegistry(dataIdentifiers if paramDataIdentifiers == None else paramDataIdentifiers)
+        return connection, simulator
+
+    yield connect
+    for simulator in simulators:
+        simulator.stop()
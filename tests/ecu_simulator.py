@@ -0,0 +1,125 @@
+from udsoncan.connections import QueueConnection
+
+import queue
+import threading
+import time
+
+class ECUSimulator():
+    # Simulated ECU behind a udsoncan QueueConnection, answers ReadDataByIdentifier with several DIDs (0x22),
+    # WriteDataByIdentifier (0x2E), service 0x77, DynamicallyDefineDataIdentifier (0x2C) and
+    # ReadDataByPeriodicIdentifier (0x2A). The ECU memory is the dict did -> raw payload, every request is recorded.
+    PERIODIC_INTERVALS = {0x01: 0.2, 0x02: 0.05, 0x03: 0.01} # seconds per transmission mode
+
+    def __init__(self, paramValues:dict, paramDynamicDids:bool=True, paramPeriodic:bool=True):
+        self.values = dict(paramValues)
+        self.dynamicDidsSupported = paramDynamicDids
+        self.periodicSupported = paramPeriodic
+        self.dynamicDids = dict() # dynamic did -> [(source did, position, size)]
+        self.periodic = dict()    # periodic did -> (interval, time of the next transmission)
+        self.responding = True # False simulates a lost ECU, requests are recorded but not answered
+        self.ignoredWrites = set() # DIDs whose writes are acknowledged but not stored, like an ECU clamping values
+        self.rejectUnknownDids = False # True simulates ECUs that reject a whole multi DID read with NRC 0x31 if one DID is unknown
+        self.requests = []
+        self.connection = QueueConnection("simulator")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+    def getRequests(self, paramService:int) -> list:
+        return [request for request in self.requests if request[0] == paramService]
+
+    def _run(self):
+        while self._running:
+            try:
+                request = self.connection.touserqueue.get(timeout=0.005)
+            except queue.Empty:
+                self._sendPeriodic()
+                continue
+            request = bytes(request)
+            self.requests.append(request)
+            if self.responding:
+                self.connection.fromuserqueue.put(self._respond(request))
+
+    def _respond(self, paramRequest:bytes) -> bytes:
+        service = paramRequest[0]
+        if service == 0x22:
+            return self._readDids(paramRequest)
+        if service == 0x2E:
+            did = int.from_bytes(paramRequest[1:3], byteorder="big")
+            if did not in self.values:
+                return bytes([0x7F, service, 0x31])
+            if did not in self.ignoredWrites:
+                self.values[did] = paramRequest[3:]
+            return bytes([0x6E]) + paramRequest[1:3]
+        if service == 0x77:
+            did = int.from_bytes(paramRequest[1:3], byteorder="big")
+            self.values[did] = paramRequest[9:]
+            return bytes([0x77]) + paramRequest[1:3]
+        if service == 0x2C and self.dynamicDidsSupported:
+            return self._defineDid(paramRequest)
+        if service == 0x2A and self.periodicSupported:
+            return self._schedulePeriodic(paramRequest)
+        return bytes([0x7F, service, 0x11])
+
+    def _readDids(self, paramRequest:bytes) -> bytes:
+        # DIDs the ECU does not know are left out, NRC 0x31 only if none of them is known
+        response = bytearray([0x62])
+        for index in range(1, len(paramRequest) - 1, 2):
+            did = int.from_bytes(paramRequest[index:index+2], byteorder="big")
+            payload = self._readDid(did)
+            if payload != None:
+                response += paramRequest[index:index+2] + payload
+            elif self.rejectUnknownDids:
+                return bytes([0x7F, 0x22, 0x31])
+        return bytes(response) if len(response) > 1 else bytes([0x7F, 0x22, 0x31])
+
+    def _readDid(self, paramDid:int) -> bytes:
+        if paramDid in self.dynamicDids:
+            return b"".join(self.values[did][position-1:position-1+size] for did, position, size in self.dynamicDids[paramDid])
+        return self.values.get(paramDid)
+
+    def _defineDid(self, paramRequest:bytes) -> bytes:
+        subfunction = paramRequest[1]
+        did = int.from_bytes(paramRequest[2:4], byteorder="big") if len(paramRequest) >= 4 else None
+        if subfunction == 0x01: # define by identifier
+            sources = []
+            for index in range(4, len(paramRequest), 4):
+                source = int.from_bytes(paramRequest[index:index+2], byteorder="big")
+                if source not in self.values:
+                    return bytes([0x7F, 0x2C, 0x31])
+                sources.append((source, paramRequest[index+2], paramRequest[index+3]))
+            self.dynamicDids.setdefault(did, []).extend(sources)
+        elif subfunction == 0x03: # clear
+            if did == None:
+                self.dynamicDids.clear()
+            else:
+                self.dynamicDids.pop(did, None)
+        else:
+            return bytes([0x7F, 0x2C, 0x12])
+        return bytes([0x6C]) + paramRequest[1:4]
+
+    def _schedulePeriodic(self, paramRequest:bytes) -> bytes:
+        mode = paramRequest[1]
+        dids = [0xF200 | pid for pid in paramRequest[2:]]
+        if mode == 0x04:
+            for did in dids:
+                self.periodic.pop(did, None)
+        elif mode in ECUSimulator.PERIODIC_INTERVALS:
+            if any(self._readDid(did) == None for did in dids):
+                return bytes([0x7F, 0x2A, 0x31])
+            for did in dids:
+                self.periodic[did] = (ECUSimulator.PERIODIC_INTERVALS[mode], time.monotonic())
+        else:
+            return bytes([0x7F, 0x2A, 0x31])
+        return bytes([0x6A])
+
+    def _sendPeriodic(self):
+        now = time.monotonic()
+        for did, (interval, nextTime) in list(self.periodic.items()):
+            if nextTime <= now:
+                self.periodic[did] = (interval, now + interval)
+                self.connection.fromuserqueue.put(bytes([0x6A, did & 0xFF]) + self._readDid(did))
@@ -0,0 +1,177 @@
+import pytest
+
+can = pytest.importorskip("can")
+isotp = pytest.importorskip("isotp")
+
+from onebase.core.bus_scan import readFunctionalCAN, readFunctionalDoIP, scanCANBus, scanDoIPHosts, FUNCTIONAL_CAN_ADDRESS, FUNCTIONAL_DOIP_ADDRESS, SCAN_ISOTP_PARAMS
+from onebase.core.device_identity import BusIdentificationCodec
+
+from doipclient.client import Parser
+from doipclient.messages import DiagnosticMessage, DiagnosticMessageNegativeAcknowledgement, DiagnosticMessagePositiveAcknowledgement, RoutingActivationRequest, RoutingActivationResponse
+import socket
+import struct
+import threading
+import time
+
+def _makeIdentification(paramDevice:int) -> bytes:
+    return bytes([1, 0x10, paramDevice, paramDevice]) + bytes([1, 2, 3, 4, 5, 6, 7, 8]) * 2 + b"7571234567890123"
+
+def _respond(paramValues:dict, paramRequest:bytes) -> bytes:
+    # ReadDataByIdentifier of a simulated ECU, negative if a DID is unknown
+    response = bytearray([0x62])
+    for index in range(1, len(paramRequest) - 1, 2):
+        did = int.from_bytes(paramRequest[index:index+2], byteorder="big")
+        if did not in paramValues:
+            return bytes([0x7F, 0x22, 0x31])
+        response += paramRequest[index:index+2] + paramValues[did]
+    return bytes(response)
+
+class _SimulatedECUs():
+    # ECUs on a virtual CAN bus answering ReadDataByIdentifier sent to their physical or the functional address
+    def __init__(self, paramChannel:str, paramValues:dict):
+        self.bus = can.Bus(interface="virtual", channel=paramChannel)
+        self.notifier = can.Notifier(self.bus, [], timeout=0.01)
+        self.values = paramValues # tx -> {did: raw payload}
+        self.stacks = []
+        for tx in paramValues:
+            physical = isotp.NotifierBasedCanStack(self.bus, self.notifier, address=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx + 0x10, rxid=tx), params=SCAN_ISOTP_PARAMS)
+            functional = isotp.NotifierBasedCanStack(self.bus, self.notifier, address=isotp.AsymmetricAddress(tx_addr=isotp.Address(isotp.AddressingMode.Normal_11bits, txid=tx + 0x10, tx_only=True),
+                                                                                                          rx_addr=isotp.Address(isotp.AddressingMode.Normal_11bits, rxid=FUNCTIONAL_CAN_ADDRESS, rx_only=True)), params=SCAN_ISOTP_PARAMS)
+            physical.start()
+            functional.start()
+            self.stacks.append((tx, physical, functional))
+        self.requests = []
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+        for tx, physical, functional in self.stacks:
+            physical.stop()
+            functional.stop()
+        self.notifier.stop()
+        self.bus.shutdown()
+
+    def _run(self):
+        while self._running:
+            for tx, physical, functional in self.stacks:
+                for stack in (physical, functional):
+                    request = stack.recv(block=False)
+                    if request != None:
+                        self.requests.append((tx, stack is functional, bytes(request)))
+                        physical.send(_respond(self.values[tx], request))
+            time.sleep(0.001)
+
+
+class _DoIPGateway():
+    # DoIP gateway on a local socket in front of ECUs (logical address -> {did: raw payload}). Like fast real
+    # gateways it sends the response of an ECU before the acknowledgement of the request.
+    def __init__(self, paramHost:str, paramPort:int, paramValues:dict, paramActivate:bool=True):
+        self.values = paramValues
+        self.activate = paramActivate
+        self.server = socket.create_server((paramHost, paramPort))
+        self.port = self.server.getsockname()[1]
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.server.close()
+        self._thread.join()
+
+    def _run(self):
+        self.server.settimeout(0.05)
+        while self._running:
+            try:
+                connection = self.server.accept()[0]
+            except OSError:
+                continue
+            threading.Thread(target=self._serve, args=(connection,), daemon=True).start()
+
+    def _serve(self, paramConnection:socket.socket):
+        parser = Parser()
+        with paramConnection:
+            while self._running:
+                try:
+                    data = paramConnection.recv(1024)
+                except OSError:
+                    return
+                if len(data) == 0:
+                    return
+                message = parser.read_message(data)
+                while message != None:
+                    self._handle(paramConnection, message)
+                    message = parser.read_message(b"")
+
+    def _handle(self, paramConnection:socket.socket, paramMessage):
+        if type(paramMessage) == RoutingActivationRequest:
+            self._send(paramConnection, RoutingActivationResponse(paramMessage.source_address, 0x1000, RoutingActivationResponse.ResponseCode.Success if self.activate else RoutingActivationResponse.ResponseCode.DeniedUnknownSourceAddress))
+        elif type(paramMessage) == DiagnosticMessage:
+            target = paramMessage.target_address
+            if target != FUNCTIONAL_DOIP_ADDRESS and target not in self.values:
+                self._send(paramConnection, DiagnosticMessageNegativeAcknowledgement(target, paramMessage.source_address, DiagnosticMessageNegativeAcknowledgement.NackCodes.UnknownTargetAddress))
+                return
+            for address in (self.values if target == FUNCTIONAL_DOIP_ADDRESS else [target]):
+                self._send(paramConnection, DiagnosticMessage(address, paramMessage.source_address, _respond(self.values[address], bytes(paramMessage.user_data))))
+            self._send(paramConnection, DiagnosticMessagePositiveAcknowledgement(target, paramMessage.source_address, 0))
+
+    def _send(self, paramConnection:socket.socket, paramMessage):
+        payload = paramMessage.pack()
+        paramConnection.sendall(struct.pack("!BBHL", 2, 0xFD, paramMessage.payload_type, len(payload)) + payload)
+
+def test_functional_read_collects_all_ecus_with_one_request(dhwSetpoint):
+    ecus = _SimulatedECUs("functional", {0x680: {256: _makeIdentification(46), 396: bytes.fromhex("c201")},
+                                         0x684: {256: _makeIdentification(46), 396: bytes.fromhex("c801")},
+                                         0x68C: {256: _makeIdentification(46)}})
+    bus = can.Bus(interface="virtual", channel="functional")
+    try:
+        values = readFunctionalCAN(bus, [256, 396], {256: BusIdentificationCodec, 396: dhwSetpoint}, paramTimeout=0.3)
+        assert list(values) == [0x680, 0x684, 0x68C]
+        assert values[0x680][396] == 45.0 and values[0x684][396] == 45.6
+        assert values[0x680][256]["DeviceProperty"]["Value "] == "ELECTRICALPREHEATER"
+        assert values[0x68C] == None # answered negatively
+        assert [request[1] for request in ecus.requests] == [True] * 3
+
+        identifications = readFunctionalCAN(bus, paramTimeout=0.3)
+        assert identifications[0x684][256]["VIN"] == "7571234567890123"
+        assert scanCANBus(bus, paramTimeout=0.3)[1]["tx"] == 0x684
+    finally:
+        bus.shutdown()
+        ecus.stop()
+
+def test_scan_reports_the_interface_to_connect_to():
+    ecus = _SimulatedECUs("scan", {0x680: {256: _makeIdentification(46)}})
+    bus = can.Bus(interface="virtual", channel="scan")
+    try:
+        found = scanCANBus(bus, range(0x680, 0x682), paramTimeout=0.3, paramConnectionInterface="can0")
+        assert [(result["type"], result["interface"], result["tx"], result["rx"]) for result in found] == [("SocketCAN", "can0", 0x680, 0x690)]
+        assert scanCANBus(bus, [0x680], paramTimeout=0.3)[0]["interface"] == None # not a SocketCAN channel, no description text
+    finally:
+        bus.shutdown()
+        ecus.stop()
+
+def test_functional_request_must_fit_into_a_single_frame():
+    with pytest.raises(ValueError):
+        readFunctionalCAN(None, [256, 257, 258, 259])
+
+def test_doip_scan_keeps_responses_sent_before_the_acknowledgement():
+    gateway = _DoIPGateway("127.0.0.1", 0, {0x680: {256: _makeIdentification(46)}, 0x684: {256: _makeIdentification(46)}})
+    refusing = _DoIPGateway("127.0.0.2", gateway.port, {0x680: {256: _makeIdentification(46)}}, paramActivate=False)
+    try:
+        found = scanDoIPHosts(["127.0.0.1", "127.0.0.2", "127.0.0.3"], [0x680, 0x684, 0x688], paramTimeout=0.5, paramPort=gateway.port)
+        assert [(result["interface"], result["tx"]) for result in found] == [("127.0.0.1", 0x680), ("127.0.0.1", 0x684)]
+        assert found[0]["deviceType"] == "ELECTRICALPREHEATER"
+    finally:
+        gateway.stop()
+        refusing.stop()
+
+def test_doip_functional_read_keeps_responses_sent_before_the_acknowledgement(dhwSetpoint):
+    gateway = _DoIPGateway("127.0.0.1", 0, {0x680: {256: _makeIdentification(46), 396: bytes.fromhex("c201")}, 0x684: {256: _makeIdentification(46), 396: bytes.fromhex("c801")}})
+    try:
+        values = readFunctionalDoIP("127.0.0.1", [396], {396: dhwSetpoint}, paramTimeout=0.3, paramPort=gateway.port)
+        assert values == {0x680: {396: 45.0}, 0x684: {396: 45.6}}
+    finally:
+        gateway.stop()
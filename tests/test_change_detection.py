@@ -0,0 +1,24 @@
+from onebase.core.change_detection import ChangeDetector
+
+def test_identical_payload_is_not_reported(dataIdentifiers):
+    detector = ChangeDetector(dataIdentifiers)
+
+    events = detector.update(396, bytes.fromhex("d200"))
+    assert [event["value"] for event in events] == [21.0]
+    assert detector.update(396, bytes.fromhex("d200")) == []
+
+def test_only_changed_sub_fields_are_reported(dataIdentifiers):
+    detector = ChangeDetector(dataIdentifiers)
+    assert len(detector.update(268, bytes.fromhex("e600c800f000dc0000"))) == 5
+
+    events = detector.update(268, bytes.fromhex("e700c800f000dd0000"))
+    assert [(event["subDid"], event["value"]) for event in events] == [("Actual", 23.1), ("Average", 22.1)]
+
+def test_deadband_suppresses_small_changes(dataIdentifiers):
+    detector = ChangeDetector(dataIdentifiers)
+    detector.setDeadband(268, 0.5, "Actual")
+    detector.update(268, bytes.fromhex("e600c800f000dc0000"))
+
+    assert detector.update(268, bytes.fromhex("e800c800f000dc0000")) == []
+    events = detector.update(268, bytes.fromhex("eb00c800f000dc0000"))
+    assert [(event["subDid"], event["value"]) for event in events] == [("Actual", 23.5)]
@@ -1,8 +1,12 @@
 from open3e.Open3Ecodecs import O3EByteVal, O3EComplexType, O3EInt8, O3EInt16, RawCodec, O3EUtf8, O3EDateTime, O3EList, O3EEnum, O3ESdate, \
     O3EStime, O3EUtc, O3ESoftVers, O3EMacAddr, O3EIp4Addr
 import open3e.Open3Ecodecs
+from onebase.core.codecs import CodecByte
+from onebase.core.lazy_record import jsonDefault
 
 from open3e.Open3Edatapoints import dataIdentifiers
+import decimal
+import json
 import random 
 
 import pytest
@@ -135,3 +139,61 @@ def test_datapoints_length():
         subcodec_len_sum = _calc_codec_length(codec)
 
         assert codec_len == subcodec_len_sum, f"Did {did}: Length {codec_len} does not match sum of subType lenghts {subcodec_len_sum}" 
+
+def test_complex_projection_decodes_requested_fields_only(flowSensor):
+    codec = flowSensor
+    raw = bytes.fromhex("e600c800f000dc0000")
+
+    assert codec.decode(raw, paramFields=["Actual"]) == {"Actual": 23.0}
+    assert codec.decode(raw, paramFields=["Average", "Minimum"]) == {"Minimum": 20.0, "Average": 22.0}
+    assert codec.decode(raw, paramFields=["Actual", "Minimum", "Maximum", "Average", "Unknown"]) == codec.decode(raw)
+
+def test_list_projection_skips_entries(dtcList):
+    codec = dtcList
+    raw = (2).to_bytes(2, byteorder="little") + bytes.fromhex("0100" + "14180a0f01020304" + "0000") * 2
+    raw += bytes(122 - len(raw))
+
+    assert codec.decode(raw, paramFields=["Count"]) == {"Count": 2}
+    assert codec.decode(raw, paramFields=["ListEntries"]) == {"ListEntries": codec.decode(raw)["ListEntries"]}
+
+def test_lazy_record_decodes_on_access_and_serializes_like_dict(dtcList, flowSensor):
+    codec = dtcList
+    raw = (2).to_bytes(2, byteorder="little") + bytes.fromhex("0100" + "14180a0f01020304" + "0000") * 2
+    raw += bytes(122 - len(raw))
+
+    record = codec.decode(raw, paramLazy=True)
+    assert record._values == {}
+    assert record["Count"] == 2
+    assert "ListEntries" not in record._values
+    assert record == codec.decode(raw)
+    assert json.dumps(record, default=jsonDefault) == json.dumps(codec.decode(raw))
+    try:
+        record.newField = 1
+        assert False
+    except AttributeError:
+        pass
+
+    sensor = flowSensor.decode(bytes.fromhex("e600c800f000dc0000"), paramLazy=True, paramFields=["Actual"])
+    assert dict(sensor) == {"Actual": 23.0}
+
+def test_int_encode_accepts_numbers_and_numeric_strings(dhwSetpoint):
+    codec = dhwSetpoint
+
+    assert codec.encode(45.5) == bytes.fromhex("c701")
+    assert codec.encode(45) == bytes.fromhex("c201")
+    assert codec.encode(decimal.Decimal("45.5")) == bytes.fromhex("c701")
+    assert codec.encode(" 45.5 ") == bytes.fromhex("c701")
+    assert codec.encode("-2.5e1") == bytes.fromhex("06ff")
+    assert CodecByte(1, "Mode").encode("0x0f") == bytes([15])
+    assert codec.encodeBatch([45.5, "45", -1]) == [bytes.fromhex("c701"), bytes.fromhex("c201"), bytes.fromhex("f6ff")]
+
+def test_int_encode_rejects_expressions_and_overflow(dhwSetpoint):
+    codec = dhwSetpoint
+
+    for value in ("__import__('os')", "20+1", "nan", 3276.8, float("inf")):
+        with pytest.raises(ValueError):
+            codec.encode(value)
+    with pytest.raises(ValueError):
+        CodecByte(1, "Mode").encode(-1)
+    with pytest.raises(TypeError):
+        codec.encode([45])
@@ -0,0 +1,123 @@
+import pytest
+
+pytest.importorskip("open3e") # ECUConnection loads the DID list of open3e
+
+from onebase.core.connection_pool import ConnectionPool
+from onebase.core.timing import AdaptiveTimeout, RetryPolicy
+
+import threading
+import time
+
+class _Factory():
+    # one simulated ECU per created connection
+    def __init__(self, paramSimulatedECU):
+        self.simulatedECU = paramSimulatedECU
+        self.simulators = []
+
+    def __call__(self, **paramOptions):
+        connection, simulator = self.simulatedECU({396: bytes.fromhex("c201")}, paramAdaptiveTimeout=AdaptiveTimeout(paramDefaultTimeout=0.05, paramMinTimeout=0.05),
+                                                  paramRetryPolicy=RetryPolicy(paramRetries=0), **paramOptions)
+        self.simulators.append(simulator)
+        return connection
+
+class _GatedConnection():
+    # stand-in for ECUConnection whose open() waits until the test opens the gate of its interface
+    gates = dict()
+
+    def __init__(self, **paramOptions):
+        self.interface = paramOptions["paramConnectionInterface"]
+        self.reconnects = 0
+        self.opened = False
+
+    def open(self):
+        _GatedConnection.gates.get(self.interface, threading.Event()).wait(5.0)
+        self.opened = True
+
+    def isOpen(self) -> bool:
+        return self.opened
+
+    def isAlive(self) -> bool:
+        return self.opened
+
+    def close(self):
+        self.opened = False
+
+def _waitUntil(paramCondition, paramTimeout:float=5.0) -> bool:
+    deadline = time.monotonic() + paramTimeout
+    while not paramCondition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return paramCondition()
+
+def test_connections_are_shared_per_endpoint_and_closed_when_idle(simulatedECU):
+    factory = _Factory(simulatedECU)
+    pool = ConnectionPool(paramIdleTimeout=60.0, paramConnectionFactory=factory)
+    try:
+        with pool.connection("DoIP", "192.168.1.20") as first:
+            assert first.readDataByIdentifier(396) == 45.0
+            with pool.connection("DoIP", "192.168.1.20", 0x680, 0x690) as second:
+                assert second is first
+            with pool.connection("DoIP", "192.168.1.21") as other:
+                assert other is not first
+        assert pool.getStats()["opened"] == 2 and pool.getStats()["reused"] == 1 and pool.getStats()["inUse"] == 0
+
+        pool.idleTimeout = 0.0
+        assert pool.closeIdle() == 2
+        assert not first.isOpen()
+        assert pool.getStats()["closed"] == 2 and pool.getStats()["open"] == 0
+    finally:
+        pool.closeAll()
+
+def test_lost_connection_is_reopened(simulatedECU):
+    factory = _Factory(simulatedECU)
+    pool = ConnectionPool(paramHealthCheckInterval=0.0, paramConnectionFactory=factory)
+    try:
+        connection = pool.acquire("DoIP", "192.168.1.20")
+        pool.release(connection)
+        factory.simulators[0].responding = False
+        assert pool.acquire("DoIP", "192.168.1.20") is connection # health check failed, reconnected
+        assert pool.getStats()["healthCheckFailed"] == 1 and pool.getStats()["reconnected"] == 1
+
+        factory.simulators[0].responding = True
+        original = factory.simulators[0].connection.specific_send
+        def loseConnection(payload, timeout=None):
+            factory.simulators[0].connection.specific_send = original
+            raise ConnectionResetError("Connection reset by peer")
+        factory.simulators[0].connection.specific_send = loseConnection
+        assert connection.readDataByIdentifier(396) == 45.0 # reconnected during the request
+        assert pool.getStats()["reconnected"] == 2
+        pool.release(connection)
+    finally:
+        pool.closeAll()
+
+def test_slow_open_does_not_block_other_endpoints():
+    pool = ConnectionPool(paramConnectionFactory=_GatedConnection)
+    _GatedConnection.gates = {"192.168.1.20": threading.Event(), "192.168.1.21": threading.Event()}
+    _GatedConnection.gates["192.168.1.21"].set()
+    try:
+        slow = threading.Thread(target=pool.acquire, args=("DoIP", "192.168.1.20"))
+        slow.start()
+        assert _waitUntil(lambda: pool.getStats()["inUse"] == 1) # the slow endpoint is being opened
+
+        startTime = time.monotonic()
+        assert pool.acquire("DoIP", "192.168.1.21").isOpen()
+        assert time.monotonic() - startTime < 1.0
+        assert pool.getStats()["opened"] == 1
+
+        _GatedConnection.gates["192.168.1.20"].set()
+        slow.join()
+        assert pool.getStats()["opened"] == 2
+    finally:
+        pool.closeAll()
+
+def test_idle_connections_are_closed_by_the_reaper():
+    pool = ConnectionPool(paramIdleTimeout=0.05, paramConnectionFactory=_GatedConnection, paramReapInterval=0.01)
+    _GatedConnection.gates = {"192.168.1.20": threading.Event()}
+    _GatedConnection.gates["192.168.1.20"].set()
+    try:
+        with pool.connection("DoIP", "192.168.1.20") as connection:
+            time.sleep(0.1)
+            assert connection.isOpen() # in use, not idle
+        assert _waitUntil(lambda: pool.getStats()["open"] == 0) # nobody calls acquire() or release() again
+        assert not connection.isOpen() and pool.getStats()["closed"] == 1
+    finally:
+        pool.closeAll()
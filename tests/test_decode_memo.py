@@ -0,0 +1,30 @@
+from onebase.core.decode_memo import DecodeMemo, FrozenDict
+
+import json
+import pytest
+
+def test_repeated_payload_is_decoded_once(flowSensor):
+    codec = flowSensor
+    memo = DecodeMemo(codec)
+    raw = bytes.fromhex("e600c800f000dc0000")
+
+    first = memo.decode(raw)
+    assert memo.decode(bytearray(raw)) is first
+    assert first == codec.decode(raw)
+    assert json.dumps(first) == json.dumps(codec.decode(raw))
+    assert memo.getStats() == {"hits": 1, "misses": 1, "entries": 1, "hitRate": 0.5}
+
+    with pytest.raises(TypeError):
+        first["Actual"] = 0.0
+    assert type(first) == FrozenDict
+
+def test_least_recently_used_payload_is_evicted(dhwSetpoint):
+    memo = DecodeMemo(dhwSetpoint, paramMaxEntries=2)
+    memo.decode(bytes.fromhex("d200"))
+    memo.decode(bytes.fromhex("d300"))
+    memo.decode(bytes.fromhex("d200"))
+    memo.decode(bytes.fromhex("d400")) # evicts d300
+
+    memo.decode(bytes.fromhex("d300"))
+    assert memo.getStats()["misses"] == 4
+    assert memo.getStats()["entries"] == 2
@@ -0,0 +1,28 @@
+from onebase.core.did_registry import DIDRegistry
+from onebase.core.codecs import CodecInt16, CodecComplexType, CodecByte, CodecDateTime
+
+def test_layout_of_complex_did(roomSetpoint, dhwSetpoint):
+    registry = DIDRegistry({424: roomSetpoint, 396: dhwSetpoint})
+
+    layout = registry.getLayout(424)
+    assert [(field.name, field.index, field.offset, field.length) for field in layout.values()] == [("Comfort", 0, 0, 2), ("Standard", 1, 2, 2), ("Reduced", 2, 4, 2), ("Unknown2", 3, 6, 2), ("Unknown1", 4, 8, 1)]
+    assert registry.getLayout(424) is layout
+    assert registry.getField(424, 2) is layout["Reduced"]
+    assert registry.getField(424, 5) == None
+    assert registry.getLayout(396) == None
+
+def test_layout_follows_replaced_codec(roomSetpoint):
+    registry = DIDRegistry({424: roomSetpoint})
+    registry.getLayout(424)
+
+    registry[424] = CodecComplexType(3, "Short", [CodecByte(1, "First"), CodecInt16(2, "Second")])
+    assert [(field.name, field.offset) for field in registry.getLayout(424).values()] == [("First", 0), ("Second", 1)]
+
+def test_volatile_mask_covers_time_stamps_and_marked_fields(roomSetpoint):
+    registry = DIDRegistry({424: roomSetpoint, 600: CodecComplexType(10, "Timer", [CodecInt16(2, "Value"), CodecDateTime(8, "Stamp")])})
+
+    assert registry.getVolatileMask(424) == None
+    assert registry.getVolatileMask(600) == bytes.fromhex("ffff0000000000000000")
+
+    registry.setVolatileFields(424, ["Unknown1"])
+    assert registry.getVolatileMask(424) == bytes.fromhex("ffffffffffffffff00")
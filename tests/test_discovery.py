@@ -0,0 +1,56 @@
+from onebase.core.codecs import CodecInt16
+
+import json
+
+SUPPORTED = [did for did in range(1000, 1016) if did not in (1005, 1012)]
+IDENTIFICATION = bytes([1, 0x10, 46, 46]) + bytes([1, 2, 3, 4, 5, 6, 7, 8]) * 2 + b"7571234567890123"
+
+def _connect(paramSimulatedECU, **paramOptions):
+    values = {did: (did - 1000).to_bytes(2, byteorder="little") for did in SUPPORTED}
+    values[256] = IDENTIFICATION
+    return paramSimulatedECU(values, {did: CodecInt16(2, "Value" + str(did)) for did in range(1000, 1016)}, **paramOptions)
+
+def test_iso_ecu_is_probed_with_one_request_per_batch(simulatedECU):
+    connection, simulator = _connect(simulatedECU)
+    supported = connection.discoverSupportedDids(paramBatchSize=8)
+
+    assert supported == {did: 2 for did in SUPPORTED}
+    assert [request.hex() for request in simulator.getRequests(0x22)] == ["22" + "".join("%04x" % did for did in range(1000, 1008)), "22" + "".join("%04x" % did for did in range(1008, 1016))]
+
+def test_rejected_batches_are_bisected(simulatedECU):
+    connection, simulator = _connect(simulatedECU)
+    simulator.rejectUnknownDids = True
+    supported = connection.discoverSupportedDids(paramBatchSize=8, paramIsoMultiRead=False)
+
+    assert supported == {did: 2 for did in SUPPORTED}
+    assert len(simulator.getRequests(0x22)) == 11 # instead of 16 single reads
+    assert bytes.fromhex("2203ed") not in simulator.getRequests(0x22) # DID 1005 is known to fail once 1004 was read
+    assert connection.negativeCache.lookup(1012) == 0x31
+    assert connection.getSupportedDids() == supported
+
+def test_dids_of_unknown_length_are_read_singly_once(simulatedECU):
+    connection, simulator = _connect(simulatedECU)
+    simulator.values.update({0x0300: bytes.fromhex("010203"), 0x0305: bytes.fromhex("0102030405")})
+    supported = connection.discoverSupportedDids(paramIncludeRange=range(0x0300, 0x0308), paramBatchSize=8)
+
+    assert supported == {**{did: 2 for did in SUPPORTED}, 0x0300: 3, 0x0305: 5}
+    assert len(simulator.getRequests(0x22)) == 2 + 8 # the registry DIDs in two batches, the others singly
+
+    simulator.requests.clear()
+    assert connection.discoverSupportedDids(paramIncludeRange=range(0x0300, 0x0308), paramBatchSize=8) == supported
+    assert simulator.getRequests(0x22)[0].hex().startswith("2203000305") # learned lengths, batched with the registry DIDs
+
+def test_capability_map_is_persisted_per_device(simulatedECU, tmp_path):
+    capabilityFile = str(tmp_path / "capabilities.json")
+    connection, simulator = _connect(simulatedECU, paramCapabilityFile=capabilityFile)
+    connection.discoverSupportedDids(paramBatchSize=8)
+
+    with open(capabilityFile) as json_file:
+        data = json.load(json_file)
+    assert list(data) == [connection.getIdentityKey()]
+    assert data[connection.getIdentityKey()]["dids"]["1000"] == 2
+
+    connection, simulator = _connect(simulatedECU, paramCapabilityFile=capabilityFile)
+    assert connection.capabilityMap.isKnown()
+    assert connection.getSupportedDids() == {did: 2 for did in SUPPORTED}
+    assert simulator.getRequests(0x22) == [bytes.fromhex("220100")] # only the identification was read
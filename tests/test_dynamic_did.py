@@ -0,0 +1,24 @@
+DYNAMIC_DID = 0xF300
+VALUES = {396: bytes.fromhex("c201"), 424: bytes.fromhex("d200c800b4000000ff"), 500: bytes.fromhex("0102")}
+
+def test_dynamic_did_is_read_with_one_request(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+    assert connection.defineDynamicDid(DYNAMIC_DID, [396, (424, "Standard"), (424, 2)])
+    assert simulator.getRequests(0x2C)[-1] == bytes.fromhex("2c01f300018c010201a8030201a80502")
+
+    values = connection.readDynamicDid(DYNAMIC_DID)
+    assert values == {396: 45.0, 424: {"Standard": 20.0, "Reduced": 18.0}}
+    assert simulator.getRequests(0x22) == [bytes.fromhex("22f300")]
+
+    simulator.dynamicDids.clear() # ECU reset, the definition is restored on the next read
+    assert connection.readDynamicDid(DYNAMIC_DID, paramRaw=True) == {396: bytes.fromhex("c201"), 424: {"Standard": bytes.fromhex("c800"), "Reduced": bytes.fromhex("b400")}}
+    assert DYNAMIC_DID in simulator.dynamicDids
+
+def test_rejected_dynamic_did_falls_back_to_batched_reads(simulatedECU):
+    connection, simulator = simulatedECU(VALUES, paramDynamicDids=False)
+    assert not connection.defineDynamicDid(DYNAMIC_DID, [396, (424, "Comfort")])
+    assert connection.readDynamicDid(DYNAMIC_DID) == {396: 45.0, 424: {"Comfort": 21.0}}
+    assert simulator.getRequests(0x22) == [bytes.fromhex("22018c01a8")]
+
+    assert not connection.defineDynamicDid(DYNAMIC_DID, [396]) # not asked again
+    assert len(simulator.getRequests(0x2C)) == 1
@@ -0,0 +1,119 @@
+from udsoncan.exceptions import NegativeResponseException, InvalidResponseException
+
+import pytest
+
+VALUES = {396: bytes.fromhex("c201"), 424: bytes.fromhex("d200c800b4000000ff")}
+
+def test_sub_dids_are_written_with_one_read_and_one_write(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    succ, code, payload = connection.writeSubDids(424, {"Comfort": 22.5, 2: 17.0}, paramVerify=True)
+
+    assert succ and payload == bytes.fromhex("e100c800aa000000ff")
+    assert simulator.values[424] == payload
+    assert simulator.getRequests(0x2E) == [bytes.fromhex("2e01a8") + payload]
+    assert simulator.getRequests(0x22) == [bytes.fromhex("2201a8")] * 2 # read, then read back
+
+def test_simulated_sub_did_write_does_not_touch_the_ecu(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    assert connection.planWrite(424, 19.5, "Standard") == bytes.fromhex("d200c300b4000000ff")
+    assert connection.writeDataByIdentifier(424, 19.5, "Standard", paramSimulateOnly=True) == (True, None)
+    assert simulator.values[424] == VALUES[424]
+    assert simulator.getRequests(0x2E) == []
+
+def test_unknown_sub_did_is_rejected_before_anything_is_written(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    with pytest.raises(NotImplementedError):
+        connection.writeSubDids(424, {"Comfort": 22.5, "Unknown3": 1})
+
+    assert simulator.requests == []
+
+def test_raw_payloads_are_read_and_written_without_codec(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    assert connection.readRaw(424) == VALUES[424]
+    assert bytes(connection.readRaw(424, "Standard")) == bytes.fromhex("c800")
+    assert connection.writeRaw(396, bytes.fromhex("2c01"))[0]
+    assert simulator.values[396] == bytes.fromhex("2c01")
+
+    with pytest.raises(ValueError): # the length is checked against the codec before sending
+        connection.writeRaw(396, bytes.fromhex("2c0100"))
+    assert len(simulator.getRequests(0x2E)) == 1
+
+def test_rejected_raw_read_is_cached(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    for attempt in range(2):
+        with pytest.raises(NegativeResponseException):
+            connection.readRaw(500)
+    assert simulator.getRequests(0x22) == [bytes.fromhex("2201f4")]
+
+def test_truncated_response_is_an_invalid_response(simulatedECU):
+    connection, simulator = simulatedECU({**VALUES, 396: bytes.fromhex("c2")})
+
+    with pytest.raises(InvalidResponseException):
+        connection.readRaw(396)
+    assert connection.readRawValues([396, 424]) == {424: VALUES[424]} # the batch is split, DID 396 is left out
+
+def test_simulated_raw_write_does_not_touch_the_ecu(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    assert connection.planWrite(396, "2c01", paramRaw=True) == bytes.fromhex("2c01")
+    assert connection.writeDataByIdentifier(396, "2c01", paramRaw=True, paramSimulateOnly=True) == (True, None)
+    assert simulator.values[396] == VALUES[396]
+    assert simulator.requests == []
+
+def test_single_write_is_read_back_at_once(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    assert connection.writeDataByIdentifier(396, 50.0, paramCheckAfterWrite=True)[0]
+    assert simulator.getRequests(0x22) == [bytes.fromhex("22018c")]
+
+    simulator.ignoredWrites.add(396)
+    assert not connection.writeDataByIdentifier(396, 55.0, paramCheckAfterWrite=True)[0]
+    assert connection.verifyWrites() == dict() # nothing left for a deferred check
+
+def test_simulated_checked_write_does_not_touch_the_ecu(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+
+    assert connection.planWrite(396, 50.0) == bytes.fromhex("f401")
+    assert connection.writeDataByIdentifier(396, 50.0, paramCheckAfterWrite=True, paramSimulateOnly=True) == (True, None)
+    assert connection.writeDataByIdentifier(396, 50.0, paramSimulateOnly=True) == (True, None)
+    assert simulator.requests == []
+
+def test_write_many_verifies_with_one_batched_read(simulatedECU):
+    connection, simulator = simulatedECU({**VALUES, 268: bytes.fromhex("d200c800dc00d20000")})
+    connection.setVolatileFields(268, ["Actual"]) # the ECU measures it, the written value does not stay
+    simulator.ignoredWrites.update([268, 424])
+
+    report = connection.writeMany({396: 50.0, 268: {"Actual": 30.0, "Minimum": 20.0, "Maximum": 22.0, "Average": 21.0, "Unknown": 0},
+                                   424: {"Comfort": 22.0, "Standard": 20.0, "Reduced": 18.0, "Unknown2": 0, "Unknown1": 255}})
+
+    assert simulator.getRequests(0x22) == [bytes.fromhex("22010c018c01a8")]
+    assert set(report[396].keys()) == {"success", "code", "error", "verified", "written", "read", "delay"}
+    assert report[396]["verified"] and report[396]["read"] == "f401"
+    assert report[268]["success"] and report[268]["verified"] # only the volatile field differs
+    assert report[424]["success"] and not report[424]["verified"]
+    assert report[424]["written"] == "dc00c800b4000000ff" and report[424]["read"] == VALUES[424].hex()
+
+def test_whole_did_writes_send_the_encoded_payload(simulatedECU):
+    connection, simulator = simulatedECU({396: VALUES[396]})
+
+    assert connection.writeDataByIdentifier(396, 50.0)[0]
+    assert simulator.getRequests(0x2E) == [bytes.fromhex("2e018cf401")]
+    assert connection.writeDataByIdentifier(396, 45.0, paramService77=True)[0]
+    assert simulator.values[396] == bytes.fromhex("c201")
+    # a rejected write is reported the same way for whole DIDs and sub-DIDs
+    assert connection.writeDataByIdentifier(424, {"Comfort": 22.0, "Standard": 20.0, "Reduced": 18.0, "Unknown2": 0, "Unknown1": 255}) == (False, 0x31)
+
+def test_deferred_checks_are_bounded(simulatedECU, dhwSetpoint):
+    connection, simulator = simulatedECU({did: bytes.fromhex("c201") for did in range(396, 400)}, {did: dhwSetpoint for did in range(396, 400)})
+    connection.MAX_PENDING_VERIFICATIONS = 2
+
+    for did in [396, 397, 398, 397, 399]:
+        connection.writeDataByIdentifier(did, 50.0, paramCheckAfterWrite=True, paramDeferCheck=True)
+
+    assert simulator.getRequests(0x22) == []
+    assert sorted(connection.verifyWrites().keys()) == [397, 399] # the oldest were dropped, a rewrite counts as new
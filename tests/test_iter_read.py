@@ -0,0 +1,28 @@
+from onebase.core.codecs import CodecInt16
+
+import asyncio
+
+def _connect(paramSimulatedECU, paramCount:int):
+    return paramSimulatedECU({1000 + i: i.to_bytes(2, byteorder="little") for i in range(paramCount)},
+                             {1000 + i: CodecInt16(2, "Value" + str(i), paramScale=10.0) for i in range(paramCount)})
+
+def test_iter_read_yields_values_in_order_with_batched_requests(simulatedECU):
+    connection, simulator = _connect(simulatedECU, 40)
+    dids = (1000 + i for i in list(range(40)) + [99]) # any iterable, DID 1099 does not exist
+    values = list(connection.iterRead(dids, paramBatchSize=16))
+    assert [value[0] for value in values] == [1000 + i for i in range(40)]
+    assert values[12][1] == 1.2
+    assert all(latency >= 0.0 and timestamp > 0.0 for did, value, timestamp, latency in values)
+    assert len(simulator.getRequests(0x22)) == 3 # the ECU leaves out the DID that does not exist
+
+    reader = connection.iterRead(range(1000, 1040), paramBatchSize=4, paramPrefetch=1, paramRaw=True)
+    assert next(reader)[1] == bytes.fromhex("0000")
+    reader.close() # stops reading ahead
+    assert len(simulator.getRequests(0x22)) <= 3 + 3
+
+def test_aiter_read_yields_values(simulatedECU):
+    connection, simulator = _connect(simulatedECU, 20)
+
+    async def collect():
+        return [(did, value) async for did, value, timestamp, latency in connection.aiterRead(range(1000, 1020), paramBatchSize=8)]
+    assert asyncio.run(collect()) == [(1000 + i, i / 10.0) for i in range(20)]
@@ -0,0 +1,66 @@
+from onebase.mqtt.command_gateway import MQTTCommandGateway
+
+import json
+import time
+
+class _Client():
+    def __init__(self):
+        self.messages = []
+
+    def subscribe(self, topics):
+        pass
+
+    def publish(self, topic:str, payload=None, qos:int=0, retain:bool=False):
+        self.messages.append((topic, json.loads(payload)))
+
+class _Connection():
+    # records the writes the gateway issues instead of talking to an ECU
+    def __init__(self, paramDataIdentifiers:dict):
+        self.dataIdentifiers = paramDataIdentifiers
+        self.writes = []
+
+    def writeSubDids(self, paramDid, paramValues, paramService77=False, paramVerify=False):
+        self.writes.append((paramDid, dict(paramValues)))
+        return True, None, None
+
+    def writeDataByIdentifier(self, paramDid, paramValue, paramService77=False):
+        self.writes.append((paramDid, paramValue))
+        return True, None
+
+def test_bursts_are_coalesced_into_one_write_per_did(dataIdentifiers):
+    client = _Client()
+    connection = _Connection(dataIdentifiers)
+    gateway = MQTTCommandGateway({"680": connection}, paramClient=client, paramDebounce=0.05)
+    gateway.start()
+
+    for value in range(200, 210):
+        gateway.handleCommand("onebase/680/424/Comfort/set", str(value / 10).encode())
+    gateway.handleCommand("onebase/680/424/Reduced/set", b"18")
+    gateway.handleCommand("onebase/680/396/set", b"45.5")
+    time.sleep(0.3)
+    gateway.stop()
+
+    assert sorted(connection.writes, key=lambda write: write[0]) == [(396, 45.5), (424, {"Comfort": 20.9, "Reduced": 18})]
+    assert ("onebase/680/424/Comfort/ack", {"success": True, "value": 20.9, "error": None}) in client.messages
+    assert len(client.messages) == 3
+
+def test_invalid_topics_are_ignored(dataIdentifiers):
+    gateway = MQTTCommandGateway({"680": _Connection(dataIdentifiers)}, paramClient=_Client())
+
+    assert not gateway.handleCommand("onebase/681/396/set", b"45")
+    assert not gateway.handleCommand("onebase/680/name/set", b"45")
+    assert not gateway.handleCommand("other/680/396/set", b"45")
+
+def test_stop_writes_the_commands_still_being_debounced(dataIdentifiers):
+    client = _Client()
+    connection = _Connection(dataIdentifiers)
+    gateway = MQTTCommandGateway({"680": connection}, paramClient=client, paramDebounce=10.0, paramMaxDelay=10.0)
+    gateway.start()
+
+    gateway.handleCommand("onebase/680/396/set", b"45.5")
+    gateway.handleCommand("onebase/680/424/Comfort/set", b"21")
+    gateway.stop()
+
+    assert sorted(connection.writes, key=lambda write: write[0]) == [(396, 45.5), (424, {"Comfort": 21})]
+    assert len(client.messages) == 2
+    assert gateway.stats["writes"] == 2 and gateway.stats["failed"] == 0
@@ -0,0 +1,96 @@
+from onebase.core.decode_memo import freeze
+from onebase.mqtt.publisher import MQTTPublisher
+
+import paho.mqtt.client as mqtt
+import threading
+import time
+
+class _MessageInfo():
+    def __init__(self, paramMid:int):
+        self.mid = paramMid
+        self.rc = mqtt.MQTT_ERR_SUCCESS
+
+class _LocalBroker():
+    # stand-in for paho's client, acknowledges every message asynchronously like a broker would
+    def __init__(self):
+        self.on_publish = None
+        self.messages = []
+        self._mid = 0
+
+    def max_inflight_messages_set(self, inflight:int):
+        pass
+
+    def publish(self, topic:str, payload=None, qos:int=0, retain:bool=False):
+        self._mid += 1
+        self.messages.append((topic, payload, qos, retain))
+        threading.Thread(target=self.on_publish, args=(self, None, self._mid, 0, None)).start()
+        return _MessageInfo(self._mid)
+
+def _waitFor(paramPublisher:MQTTPublisher, paramCount:int, paramTimeout:float=10.0):
+    deadline = time.monotonic() + paramTimeout
+    while paramPublisher.getStats()["published"] < paramCount and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+def test_topics_and_options(dataIdentifiers):
+    broker = _LocalBroker()
+    publisher = MQTTPublisher(paramClient=broker, paramTopicPrefix="home", paramDataIdentifiers={"680": dataIdentifiers})
+    publisher.setTopicOptions(396, paramQos=1, paramRetain=True)
+    publisher.start()
+
+    publisher.publish("680", 396, 50.0)
+    publisher.publish("680", 268, {"Actual": 21.5, "Minimum": 20.0})
+    _waitFor(publisher, 3)
+    publisher.stop()
+
+    assert broker.messages == [("home/680/396", "50.0", 1, True), ("home/680/268/Actual", "21.5", 0, False), ("home/680/268/Minimum", "20.0", 0, False)]
+
+def test_memoized_values_are_published_like_plain_ones(dataIdentifiers):
+    broker = _LocalBroker()
+    publisher = MQTTPublisher(paramClient=broker, paramDataIdentifiers={"680": dataIdentifiers})
+    publisher.start()
+
+    publisher.publish("680", 268, freeze({"Actual": 21.5, "Minimum": 20.0}))
+    publisher.publish("680", 257, freeze([{"State": "Active"}]), "ListEntries")
+    publisher.stop()
+
+    assert broker.messages == [("onebase/680/268/Actual", "21.5", 0, False), ("onebase/680/268/Minimum", "20.0", 0, False),
+                               ("onebase/680/257/ListEntries", '[{"State": "Active"}]', 0, False)]
+
+def test_only_complex_dids_are_split_into_sub_did_topics(dataIdentifiers):
+    broker = _LocalBroker()
+    publisher = MQTTPublisher(paramClient=broker)
+    publisher.setDataIdentifiers("680", {did: codec for did, codec in dataIdentifiers.items()})
+    publisher.start()
+
+    publisher.publish("680", 424, {"Comfort": 22.0, "Standard": 20.0, "Reduced": 18.0, "Unknown2": 0, "Unknown1": 255})
+    publisher.publish("680", 1415, {"Key ": 2, "Value ": "Heating"}) # an enumeration, not a complex DID
+    publisher.publish("681", 424, {"Comfort": 22.0}) # no registry for this ECU
+    publisher.stop()
+
+    assert [topic for topic, payload, qos, retain in broker.messages[:5]] == ["onebase/680/424/" + name for name in ["Comfort", "Standard", "Reduced", "Unknown2", "Unknown1"]]
+    assert broker.messages[5:] == [("onebase/680/1415", '{"Key ": 2, "Value ": "Heating"}', 0, False), ("onebase/681/424", '{"Comfort": 22.0}', 0, False)]
+
+def test_full_queue_drops_instead_of_blocking():
+    publisher = MQTTPublisher(paramClient=_LocalBroker(), paramMaxQueued=10)
+
+    startTime = time.monotonic()
+    queued = [publisher.publish("680", did, 1.0) for did in range(20)]
+
+    assert time.monotonic() - startTime < 0.5
+    assert queued.count(True) == 10
+    assert publisher.getStats()["dropped"] == 10
+
+def test_queued_messages_are_published_in_batches_and_flushed_by_stop():
+    broker = _LocalBroker()
+    publisher = MQTTPublisher(paramClient=broker, paramMaxInflight=50, paramBatchSize=100)
+    for i in range(5000):
+        publisher.publish("680", 256 + i % 500, float(i))
+
+    publisher.start()
+    publisher.stop() # returns once everything queued was published and acknowledged
+
+    assert len(broker.messages) == 5000
+    assert broker.messages[-1] == ("onebase/680/755", "4999.0", 0, False)
+    stats = publisher.getStats()
+    assert stats["published"] == 5000 and stats["pending"] == 0 and stats["dropped"] == 0
+    assert stats["batches"] == 50 # the worker drains the queue in full batches
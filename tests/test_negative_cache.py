@@ -0,0 +1,34 @@
+from onebase.core.negative_cache import NegativeResponseCache
+from udsoncan.ResponseCode import ResponseCode
+
+import time
+
+def test_policy_per_response_code():
+    cache = NegativeResponseCache(paramPolicy={ResponseCode.ConditionsNotCorrect: 0.01})
+    cache.store(512, ResponseCode.RequestOutOfRange)
+    cache.store(513, ResponseCode.ConditionsNotCorrect)
+    cache.store(514, ResponseCode.BusyRepeatRequest)
+
+    assert cache.lookup(512) == ResponseCode.RequestOutOfRange
+    assert cache.lookup(513) == ResponseCode.ConditionsNotCorrect
+    assert cache.lookup(514) == None
+
+    time.sleep(0.02)
+    assert cache.lookup(512) == ResponseCode.RequestOutOfRange
+    assert cache.lookup(513) == None
+
+def test_persisted_per_identity(tmp_path):
+    filePath = str(tmp_path / "negative_cache.json")
+
+    cache = NegativeResponseCache(paramFilePath=filePath)
+    cache.setIdentity("680_7654321_1.2.3.4")
+    cache.store(512, ResponseCode.RequestOutOfRange)
+    cache.save()
+
+    restored = NegativeResponseCache(paramFilePath=filePath)
+    restored.setIdentity("680_7654321_1.2.3.4")
+    assert restored.lookup(512) == ResponseCode.RequestOutOfRange
+
+    otherDevice = NegativeResponseCache(paramFilePath=filePath)
+    otherDevice.setIdentity("680_7654321_1.2.3.5")
+    assert otherDevice.lookup(512) == None
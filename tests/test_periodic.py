@@ -0,0 +1,74 @@
+from onebase.core.periodic import PeriodicReader
+
+import threading
+import time
+
+VALUES = {396: bytes.fromhex("c201"), 424: bytes.fromhex("d200c800b4000000ff")}
+
+def _collect(paramReader:PeriodicReader, paramSources, paramRate:str, paramCount:int) -> list:
+    received = []
+    done = threading.Event()
+    def onData(values, timestamp):
+        received.append(values)
+        if len(received) >= paramCount:
+            done.set()
+    periodicDid = paramReader.subscribe(paramSources, onData, paramRate)
+    paramReader.start()
+    assert done.wait(5.0)
+    return periodicDid, received
+
+def test_periodic_data_is_pushed_by_the_ecu(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+    reader = PeriodicReader(connection)
+    try:
+        periodicDid, received = _collect(reader, [396, (424, "Reduced")], "fast", 3)
+        assert received[0] == {396: 45.0, 424: {"Reduced": 18.0}}
+        assert reader.getModes() == {periodicDid: "push"}
+        assert simulator.getRequests(0x2A) == [bytes([0x2A, 0x03, periodicDid & 0xFF])]
+
+        # periodic data arriving while a request is pending does not disturb the response
+        for i in range(5):
+            assert connection.readDataByIdentifier(396) == 45.0
+        assert len(simulator.getRequests(0x22)) == 5
+
+        reader.stop()
+        assert periodicDid not in simulator.periodic
+    finally:
+        reader.stop()
+
+def test_rejected_periodic_data_is_polled(simulatedECU):
+    connection, simulator = simulatedECU(VALUES, paramPeriodic=False)
+    reader = PeriodicReader(connection, paramPollIntervals={"medium": 0.01})
+    try:
+        periodicDid, received = _collect(reader, [(424, "Comfort")], "medium", 2)
+        assert received[0] == {424: {"Comfort": 21.0}}
+        assert reader.getModes() == {periodicDid: "poll"}
+        assert reader.stats["pushed"] == 0 and reader.stats["polled"] >= 2
+    finally:
+        reader.stop()
+
+def test_periodic_data_is_requested_again_after_a_reconnect(simulatedECU):
+    connection, simulator = simulatedECU(VALUES)
+    reader = PeriodicReader(connection)
+    try:
+        periodicDid, received = _collect(reader, [396], "fast", 1)
+
+        simulator.periodic.clear() # the ECU ends the session with the connection
+        simulator.dynamicDids.clear()
+        connection.reconnect()
+        count = len(received)
+        deadline = time.monotonic() + 5.0
+        while len(received) <= count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert len(received) > count
+        assert reader.getModes() == {periodicDid: "push"} and reader.stats["restarted"] == 1
+        assert len(simulator.getRequests(0x2A)) == 2 and len(simulator.getRequests(0x2C)) >= 2
+    finally:
+        reader.stop()
+
+def test_closed_connection_is_opened_to_receive_periodic_data(simulatedECU):
+    connection, simulator = simulatedECU(VALUES, paramOpen=False)
+
+    assert connection.receivePeriodicData(0.01) == []
+    assert connection.isOpen()
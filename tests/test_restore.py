@@ -0,0 +1,64 @@
+from onebase.core.codecs import CodecDateTime
+from onebase.core.restore import RestorePlanner
+
+class _Connection():
+    # keeps the ECU memory in a dict and records the writes
+    def __init__(self, paramValues:dict, paramDataIdentifiers:dict):
+        self.values = dict(paramValues)
+        self.dataIdentifiers = paramDataIdentifiers
+        self.reads = 0
+        self.writes = []
+
+    def readRawValues(self, paramDids, paramBatchSize=16, paramMaxResponseBytes=4000):
+        self.reads += 1
+        return {did: self.values[did] for did in paramDids if did in self.values}
+
+    def writeRaw(self, paramDid, paramPayload, paramService77=False):
+        self.writes.append((paramDid, bytes(paramPayload), paramService77))
+        self.values[paramDid] = bytes(paramPayload)
+        return True, 0
+
+class _CountingConnection(_Connection):
+    # the ECU increments the last byte of DID 424 (a counter) right after each write
+    def writeRaw(self, paramDid, paramPayload, paramService77=False):
+        result = _Connection.writeRaw(self, paramDid, paramPayload, paramService77)
+        if paramDid == 424:
+            self.values[424] = self.values[424][:-1] + bytes([self.values[424][-1] + 1])
+        return result
+
+def _makeSnapshot():
+    return {396: bytes.fromhex("c201"), 424: bytes.fromhex("d200c800b400000000"), 500: bytes.fromhex("01")}
+
+def test_only_changed_dids_are_written_and_verified(dataIdentifiers):
+    connection = _Connection({396: bytes.fromhex("c201"), 424: bytes.fromhex("dc00c800a000000000"), 500: bytes.fromhex("02")}, dataIdentifiers)
+    report = RestorePlanner(connection, {396, 500}, paramService77Dids={424}).restore(_makeSnapshot())
+
+    assert connection.writes == [(424, bytes.fromhex("d200c800b400000000"), True), (500, bytes.fromhex("01"), False)]
+    assert connection.reads == 2
+    assert report["unchanged"] == [396]
+    assert report["written"] == [424, 500]
+    assert report["verifyFailed"] == []
+    assert report["changes"][0]["fields"] == [{"name": "Comfort", "current": 22.0, "target": 21.0}, {"name": "Reduced", "current": 16.0, "target": 18.0}]
+
+def test_simulate_only_does_not_write(dataIdentifiers):
+    connection = _Connection({396: bytes.fromhex("c801"), 424: bytes.fromhex("d200c800b400000000")}, dataIdentifiers)
+    report = RestorePlanner(connection, {396, 424, 500}).restore(_makeSnapshot(), paramSimulateOnly=True)
+
+    assert connection.writes == []
+    assert [change["did"] for change in report["changes"]] == [396]
+    assert report["changes"][0]["fields"] == [{"name": "DomesticHotWaterTemperatureSetpoint", "current": 45.6, "target": 45.0}]
+    assert report["unreadable"] == [500]
+
+def test_read_only_and_volatile_data_is_not_restored(dataIdentifiers):
+    dataIdentifiers[1286] = CodecDateTime(8, "SystemDateTime")
+    dataIdentifiers.setVolatileFields(424, ["Unknown1"]) # e.g. a counter of the ECU
+    connection = _CountingConnection({268: bytes.fromhex("d200c800dc00d20000"), 424: bytes.fromhex("dc00c800b400000007"), 1286: bytes.fromhex("2026101901153000")}, dataIdentifiers)
+    snapshot = {268: bytes.fromhex("c800c800dc00d20000"), 424: bytes.fromhex("d200c800b400000003"), 1286: bytes.fromhex("2024010100000000")}
+
+    report = RestorePlanner(connection, {424, 1286}).restore(snapshot)
+
+    assert report["skipped"] == [268, 1286] # a sensor and the clock
+    assert connection.writes == [(424, bytes.fromhex("d200c800b400000007"), False)] # the counter keeps its current value
+    assert report["changes"][0]["fields"] == [{"name": "Comfort", "current": 22.0, "target": 21.0}]
+    assert report["verifyFailed"] == [] # the counter moved on after the write
+    assert RestorePlanner(connection, {424}).plan(snapshot)["unchanged"] == [424]
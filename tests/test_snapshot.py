@@ -0,0 +1,49 @@
+from onebase.core.snapshot import SnapshotEngine, readSnapshot
+
+import pytest
+
+class _Connection():
+    # answers batched raw reads from a dict except for paramMissing, can be told to fail after a number of requests
+    def __init__(self, paramValues:dict, paramDataIdentifiers:dict, paramFailAfter:int=None, paramMissing:set=None):
+        self.values = paramValues
+        self.dataIdentifiers = paramDataIdentifiers
+        self.tx = 0x680
+        self.requested = []
+        self.failAfter = paramFailAfter
+        self.missing = {400} if paramMissing == None else paramMissing
+
+    def getIdentityKey(self):
+        return "680_TEST_1.0"
+
+    def getSupportedDids(self):
+        return {did: len(raw) for did, raw in self.values.items()}
+
+    def readRawValues(self, paramDids, paramBatchSize=16, paramMaxResponseBytes=4000):
+        if self.failAfter != None and len(self.requested) >= self.failAfter:
+            raise TimeoutError("ECU gone")
+        self.requested.append(list(paramDids))
+        return {did: self.values[did] for did in paramDids if did in self.values and did not in self.missing}
+
+def test_snapshot_contains_raw_and_decoded_values(tmp_path, dataIdentifiers):
+    values = {did: bytes([did & 0xFF, 1]) for did in range(390, 410)}
+    stats = SnapshotEngine(_Connection(values, dataIdentifiers), str(tmp_path / "snapshot.jsonl"), paramChunkSize=8).run()
+
+    header, raw = readSnapshot(str(tmp_path / "snapshot.jsonl"))
+    assert header["identity"] == "680_TEST_1.0"
+    assert raw == {did: value for did, value in values.items() if did != 400}
+    assert (stats["dids"], stats["read"], stats["failed"]) == (20, 19, 1)
+    assert '"value": 39.6' in (tmp_path / "snapshot.jsonl").read_text()
+
+def test_interrupted_snapshot_resumes_after_last_chunk(tmp_path, dataIdentifiers):
+    values = {did: bytes([did & 0xFF, 1]) for did in range(390, 410)}
+    with pytest.raises(TimeoutError):
+        SnapshotEngine(_Connection(values, dataIdentifiers, paramFailAfter=2), str(tmp_path / "snapshot.jsonl"), paramChunkSize=8).run()
+    with open(tmp_path / "snapshot.jsonl", "a") as snapshotFile:
+        snapshotFile.write('{"did": 406, "ra') # line cut off by the interruption
+
+    connection = _Connection(values, dataIdentifiers, paramMissing=set())
+    stats = SnapshotEngine(connection, str(tmp_path / "snapshot.jsonl"), paramChunkSize=8).run()
+
+    assert connection.requested == [[400] + list(range(406, 410))] # DID 400 failed before and is read again
+    assert stats["resumed"] == 15
+    assert readSnapshot(str(tmp_path / "snapshot.jsonl"))[1] == values
@@ -0,0 +1,84 @@
+from onebase.core.subscriptions import SubscriptionManager
+
+import threading
+import time
+
+class _Connection():
+    # ECU memory in a dict, records the DIDs of every read
+    def __init__(self, paramValues:dict, paramDataIdentifiers:dict):
+        self.values = dict(paramValues)
+        self.dataIdentifiers = paramDataIdentifiers
+        self.reads = []
+
+    def readRawValues(self, paramDids, paramBatchSize=16, paramMaxResponseBytes=4000):
+        self.reads.append(list(paramDids))
+        return {did: self.values[did] for did in paramDids if did in self.values}
+
+    def decodeRaw(self, paramDid, paramRaw, paramFields=None):
+        codec = self.dataIdentifiers[paramDid]
+        return codec.decode(paramRaw) if paramFields == None else codec.decode(paramRaw, paramFields=paramFields)
+
+def _waitFor(paramCondition, paramTimeout:float=2.0) -> bool:
+    deadline = time.monotonic() + paramTimeout
+    while not paramCondition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return paramCondition()
+
+def test_subscriptions_share_reads_and_report_changes_only(dataIdentifiers):
+    connection = _Connection({396: bytes.fromhex("c201"), 424: bytes.fromhex("d200c800b4000000ff")}, dataIdentifiers)
+    manager = SubscriptionManager(connection)
+    updates = []
+    try:
+        manager.subscribe(396, lambda did, value, timestamp: updates.append((did, value)), 0.02)
+        comfortId = manager.subscribe(424, lambda did, value, timestamp: updates.append((did, value)), 0.02, paramFields=["Comfort"])
+        assert _waitFor(lambda: len(updates) == 2)
+        assert sorted(updates) == [(396, 45.0), (424, {"Comfort": 21.0})]
+        assert _waitFor(lambda: [396, 424] in connection.reads) # due at about the same time, read together
+
+        connection.values[424] = bytes.fromhex("d200c900b4000000ff") # change outside the subscribed field
+        connection.values[396] = bytes.fromhex("c801")
+        assert _waitFor(lambda: len(updates) == 3)
+        time.sleep(0.1)
+        assert updates[2:] == [(396, 45.6)]
+
+        manager.unsubscribe(comfortId)
+        readCount = len(connection.reads)
+        assert _waitFor(lambda: len(connection.reads) > readCount + 1)
+        assert connection.reads[-1] == [396]
+    finally:
+        manager.stop()
+
+def test_slow_subscriber_gets_the_latest_value(dataIdentifiers):
+    connection = _Connection({396: bytes.fromhex("0000")}, dataIdentifiers)
+    manager = SubscriptionManager(connection)
+    release = threading.Event()
+    updates = []
+    def slowCallback(did, value, timestamp):
+        release.wait()
+        updates.append(value)
+    try:
+        manager.subscribe(396, slowCallback, 0.01, paramOnChange=False)
+        assert _waitFor(lambda: manager.stats["coalesced"] >= 3) # reads go on while the callback blocks
+        connection.values[396] = bytes.fromhex("6400")
+        time.sleep(0.05)
+        release.set()
+        assert _waitFor(lambda: len(updates) >= 2)
+        assert updates[0] == 0.0 and updates[1] == 10.0 # values in between were replaced
+    finally:
+        release.set()
+        manager.stop()
+
+def test_stopped_manager_starts_again_with_the_next_subscription(dataIdentifiers):
+    connection = _Connection({396: bytes.fromhex("c201")}, dataIdentifiers)
+    manager = SubscriptionManager(connection)
+    updates = []
+    try:
+        subscriptionId = manager.subscribe(396, lambda did, value, timestamp: updates.append(value), 0.02)
+        assert _waitFor(lambda: len(updates) == 1)
+        manager.unsubscribe(subscriptionId)
+        manager.stop()
+
+        manager.subscribe(396, lambda did, value, timestamp: updates.append(value), 0.02)
+        assert _waitFor(lambda: len(updates) == 2)
+    finally:
+        manager.stop()
@@ -0,0 +1,126 @@
+from onebase.core.timing import AdaptiveTimeout, RetryPolicy, CircuitBreaker, ECUParkedException
+
+import pytest
+
+def test_adaptive_timeout_default_until_enough_samples():
+    timeout = AdaptiveTimeout(paramDefaultTimeout=1.0, paramMinSamples=4)
+
+    for i in range(3):
+        timeout.record(396, 0.05)
+    assert timeout.getTimeout(396) == 1.0
+
+    timeout.record(396, 0.05)
+    assert timeout.getTimeout(396) == pytest.approx(0.15)
+
+def test_adaptive_timeout_falls_back_to_ecu_distribution():
+    timeout = AdaptiveTimeout(paramMinSamples=2, paramFactor=2.0, paramMinTimeout=0.01)
+    timeout.record(396, 0.1)
+    timeout.record(397, 0.2)
+
+    assert timeout.getTimeout(398) == pytest.approx(0.4)
+
+def test_adaptive_timeout_is_clamped():
+    timeout = AdaptiveTimeout(paramMinSamples=1, paramMinTimeout=0.1, paramMaxTimeout=2.0)
+    timeout.record(396, 0.001)
+    timeout.record(397, 10.0)
+    timeout.record(397, 10.0)
+
+    assert timeout.getTimeout(396) == 0.1
+    assert timeout.getTimeout(397) == 2.0
+
+def test_retry_backoff():
+    policy = RetryPolicy(paramBackoff=0.1, paramBackoffFactor=2.0, paramMaxBackoff=0.3)
+
+    assert [policy.getDelay(attempt) for attempt in (1, 2, 3)] == pytest.approx([0.1, 0.2, 0.3])
+
+def test_circuit_breaker_parks_and_recovers():
+    breaker = CircuitBreaker(paramFailureThreshold=2, paramParkDuration=0.0)
+    breaker.recordFailure()
+    breaker.check()
+    breaker.recordFailure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    breaker.check() # park duration of 0 s is over, one trial request may pass
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.recordSuccess()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_circuit_breaker_raises_while_parked():
+    breaker = CircuitBreaker(paramFailureThreshold=1, paramParkDuration=60.0)
+    breaker.recordFailure()
+
+    with pytest.raises(ECUParkedException):
+        breaker.check()
+
+class _Client():
+    def __init__(self):
+        self.config = dict()
+
+    def close(self):
+        pass
+
+def _makeConnection(paramBreaker:CircuitBreaker):
+    # ECUConnection without transport, open() and reconnect() just put a new client in place
+    pytest.importorskip("open3e") # ECUConnection loads the DID list of open3e
+    from onebase.core.ecu_connection import ECUConnection
+
+    connection = ECUConnection(paramRetryPolicy=RetryPolicy(paramRetries=2, paramBackoff=0.0), paramCircuitBreaker=paramBreaker, paramOpen=False)
+    def open():
+        connection.uds_client = _Client()
+        connection.opened += 1
+    connection.opened = 0
+    connection.open = open
+    return connection
+
+def _outcomes(*paramOutcomes):
+    # request function raising or returning the given outcomes one after the other
+    outcomes = list(paramOutcomes)
+    def request():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+    request.remaining = outcomes
+    return request
+
+def test_transact_retries_timeouts_and_parks_the_ecu():
+    from udsoncan.exceptions import TimeoutException
+    breaker = CircuitBreaker(paramFailureThreshold=1, paramParkDuration=60.0)
+    connection = _makeConnection(breaker)
+
+    assert connection._transact(396, _outcomes(TimeoutException(), TimeoutException(), "response")) == "response"
+    assert connection.opened == 1 and breaker.state == CircuitBreaker.CLOSED
+
+    with pytest.raises(TimeoutException): # the retries are used up
+        connection._transact(396, _outcomes(TimeoutException(), TimeoutException(), TimeoutException()))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    request = _outcomes("response")
+    with pytest.raises(ECUParkedException):
+        connection._transact(396, request)
+    assert request.remaining == ["response"] # nothing was sent
+
+def test_transact_records_the_outcome_of_a_trial_request():
+    from udsoncan import Response
+    from udsoncan.exceptions import InvalidResponseException
+    breaker = CircuitBreaker(paramFailureThreshold=1, paramParkDuration=0.0)
+    connection = _makeConnection(breaker)
+
+    with pytest.raises(ValueError):
+        connection._transact(396, _outcomes(ValueError()))
+    assert breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(InvalidResponseException): # trial request, the ECU answered
+        connection._transact(396, _outcomes(InvalidResponseException(Response())))
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_transact_reconnects_once_when_the_transport_is_lost():
+    breaker = CircuitBreaker(paramFailureThreshold=1, paramParkDuration=60.0)
+    connection = _makeConnection(breaker)
+
+    assert connection._transact(396, _outcomes(OSError(), "response")) == "response"
+    assert connection.reconnects == 1 and connection.opened == 2
+
+    with pytest.raises(OSError): # lost again right after reconnecting
+        connection._transact(396, _outcomes(OSError(), OSError()))
+    assert connection.reconnects == 2 and breaker.state == CircuitBreaker.OPEN
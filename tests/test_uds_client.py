@@ -0,0 +1,41 @@
+from onebase.uds.uds_client import OneBaseUDSClient
+
+from udsoncan.connections import QueueConnection
+from udsoncan.exceptions import NegativeResponseException
+import udsoncan
+import pytest
+
+class _AnsweringConnection(QueueConnection):
+    # queues the prepared answers as soon as a request is sent
+    def __init__(self, paramAnswers:list):
+        QueueConnection.__init__(self, "test")
+        self.answers = paramAnswers
+        self.sent = []
+
+    def specific_send(self, payload, timeout=None):
+        self.sent.append(bytes(payload))
+        for answer in self.answers.pop(0):
+            self.fromuserqueue.put(answer)
+
+def _makeClient(paramAnswers:list, paramDataIdentifiers:dict):
+    config = dict(udsoncan.configs.default_client_config)
+    config['data_identifiers'] = dict(paramDataIdentifiers)
+    config['data_identifiers'][397] = paramDataIdentifiers[396] # second DID with the same layout
+    client = OneBaseUDSClient(_AnsweringConnection(paramAnswers), config=config)
+    client.open()
+    return client
+
+def test_fast_read_returns_positive_response_and_reuses_request(dataIdentifiers):
+    client = _makeClient([[bytes.fromhex("62018cc201018dc801")], [bytes.fromhex("7f2278"), bytes.fromhex("62018cc301018dc801")]], dataIdentifiers)
+
+    assert client.send_read_request((396, 397)) == bytes.fromhex("018cc201018dc801")
+    assert client.send_read_request((396, 397)) == bytes.fromhex("018cc301018dc801") # after response pending
+    assert client.conn.sent == [bytes.fromhex("22018c018d")] * 2
+    assert client.get_read_request((396, 397)) is client.get_read_request([396, 397])
+
+def test_fast_read_raises_negative_response(dataIdentifiers):
+    client = _makeClient([[bytes.fromhex("7f2231")]], dataIdentifiers)
+
+    with pytest.raises(NegativeResponseException) as e:
+        client.send_read_request((396,))
+    assert e.value.response.code == udsoncan.Response.Code.RequestOutOfRange
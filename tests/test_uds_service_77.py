@@ -0,0 +1,29 @@
+from onebase.uds.uds_client import OneBaseUDSClient
+from onebase.uds.uds_service_77 import WriteDataByIdentifier77
+from onebase.core.codecs import CodecInt16
+
+from udsoncan.connections import QueueConnection
+import udsoncan
+
+def _makeClient(paramDataIdentifiers:dict):
+    config = dict(udsoncan.configs.default_client_config)
+    config['data_identifiers'] = paramDataIdentifiers
+    return OneBaseUDSClient(QueueConnection("test"), config=config)
+
+def test_prepared_request_matches_make_request(dataIdentifiers):
+    client = _makeClient(dataIdentifiers)
+
+    request = client.prepare_write_77(396, 45.5)
+    assert request.get_payload() == WriteDataByIdentifier77.make_request(396, 45.5, client.config['data_identifiers']).get_payload()
+    assert request.get_payload() == bytes.fromhex("77018c4301828c01b2c701")
+
+def test_templates_are_cached_per_did_and_rebuilt_for_new_codec(dataIdentifiers):
+    client = _makeClient(dataIdentifiers)
+    client.prepare_write_77(396, 45.5)
+    template = client._templates77[396]
+
+    assert client.prepare_raw_write_77(396, bytes.fromhex("9001")).get_payload().hex() == "77018c4301828c01b29001"
+    assert client._templates77[396] is template
+
+    client.config['data_identifiers'][396] = CodecInt16(2, "DomesticHotWaterTemperatureSetpoint", paramScale=1.0, paramSigned=True)
+    assert client.prepare_write_77(396, 40).get_payload().hex() == "77018c4301828c01b22800"